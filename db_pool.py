@@ -0,0 +1,192 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from os import path
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import quote
+
+# PRAGMAs applied to every pooled connection. Values can be overridden per pool.
+DEFAULT_PRAGMAS = {
+    "mmap_size": 268435456,  # 256 MiB memory-mapped I/O
+    "cache_size": -65536,  # 64 MiB page cache (negative value = KiB)
+    "query_only": 1,
+    "temp_store": "MEMORY",
+}
+
+ALLOWED_PRAGMAS = {"mmap_size", "cache_size", "query_only", "temp_store", "busy_timeout"}
+
+
+class ConnectionPool:
+    """Thread-safe pool of read-only SQLite connections for a single database file.
+
+    Connections are opened lazily with a ``mode=ro`` URI, configured with the
+    pool PRAGMAs and handed out one thread at a time, so every tool call reuses
+    an open file handle and a warm page cache.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = 4,
+        pragmas: Optional[Dict[str, Any]] = None,
+        timeout: float = 30.0,
+    ):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file
+            size (int): Maximum number of open connections
+            pragmas (Dict[str, Any], optional): PRAGMA overrides applied on top of DEFAULT_PRAGMAS
+            timeout (float): Seconds to wait for a free connection before giving up
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        unknown = set(pragmas or {}) - ALLOWED_PRAGMAS
+        if unknown:
+            raise ValueError(f"Unsupported pragmas: {', '.join(sorted(unknown))}")
+
+        self.db_path = path.abspath(db_path)
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    @property
+    def uri(self) -> str:
+        return f"file:{quote(self.db_path)}?mode=ro"
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Connection pool for {self.db_path} is closed")
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"No free connection for {self.db_path} after {self.timeout}s"
+            )
+
+    def _checkin(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A connection that cannot be reset is dropped instead of reused
+            self._discard(conn)
+            return
+        with self._lock:
+            closed = self._closed
+        if closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._opened -= 1
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of the ``with`` block."""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def warm_up(self) -> None:
+        """Open every connection up front and pull the schema into the page cache."""
+        conns = []
+        try:
+            for _ in range(self.size):
+                conn = self._checkout()
+                conns.append(conn)
+                conn.execute("SELECT name FROM sqlite_master").fetchall()
+        finally:
+            for conn in conns:
+                self._checkin(conn)
+
+    def close(self) -> None:
+        """Close all idle connections; connections in use are closed on return."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_POOLS: Dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(db_path: str, **kwargs: Any) -> ConnectionPool:
+    """Return the shared pool for ``db_path``, creating it on first use.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+        **kwargs: ConnectionPool options, only used when the pool is created
+
+    Returns:
+        ConnectionPool: The process-wide pool for this database
+    """
+    key = path.abspath(db_path)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(key, **kwargs)
+            _POOLS[key] = pool
+        return pool
+
+
+@contextmanager
+def borrow(db_path: str, conn: Optional[sqlite3.Connection] = None) -> Iterator[sqlite3.Connection]:
+    """``conn`` if the caller already holds one, else a connection from the shared pool.
+
+    Code that runs while a pooled connection is checked out passes it down
+    instead of taking a second one, which could wait forever on a full pool.
+    """
+    if conn is not None:
+        yield conn
+    else:
+        with get_pool(db_path).connection() as pooled:
+            yield pooled
+
+
+def close_all() -> None:
+    """Close every shared pool."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,438 @@
+"""Index advisor for the queries the agents run.
+
+Executed queries are recorded with :func:`record_query`. They are kept in
+memory and, when ``QUERY_LOG_PATH`` is set, appended to that JSONL file so
+nightly report runs build up a history. The advisor replays each query's
+``EXPLAIN QUERY PLAN`` against a schema-only copy of the database. It
+proposes covering indexes for tables the plans read in full and keeps
+those that lower the estimated row visits. Optionally it builds them on a
+writable copy of the database.
+
+Usage::
+
+    python index_advisor.py analytics.db --log queries.jsonl
+    python index_advisor.py analytics.db --log queries.jsonl --apply analytics_indexed.db
+"""
+
+import argparse
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from os import path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from db_pool import get_pool
+from query_cache import normalize_sql, strip_statement, tokenize
+from query_guard import estimate_cost, explain, table_aliases
+from schema_cache import get_schema, quote_identifier
+from schema_summary import get_table_stats
+
+# Widest index proposed; past this only the filter columns are indexed, without covering
+MAX_INDEX_COLUMNS = 6
+
+# An index is kept only if it cuts at least this share of the row visits of the queries it changes
+MIN_REDUCTION = 0.05
+
+# Distinct queries remembered in memory per process
+MAX_LOGGED_QUERIES = 10000
+
+# Log lines are buffered and appended once this many are waiting or this many seconds have passed
+LOG_FLUSH_LINES = 100
+LOG_FLUSH_SECONDS = 1.0
+
+EQUALITY_OPS = {"=", "==", "is", "in"}
+RANGE_OPS = {"<", ">", "<=", ">=", "between", "like", "glob"}
+CLAUSES = {"select", "from", "join", "on", "using", "where", "group", "having", "order", "limit"}
+
+
+class QueryLog:
+    """Counts of the queries run against each database, optionally persisted as JSONL.
+
+    Lines for the log file are buffered and appended in batches by whichever
+    caller finds a batch due, so recording a query never waits on disk I/O
+    for other queries. The buffer is flushed at exit as well.
+    """
+
+    def __init__(self, log_path: Optional[str] = None):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._texts: Dict[tuple, str] = {}
+        # Held while appending to the file, so batches are written in order
+        self._write_lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        if log_path:
+            atexit.register(self.flush)
+
+    def record(self, db_path: str, query: str, persist: bool = True) -> None:
+        tokens = tokenize(query)
+        if not tokens or tokens[0].text.lower() not in ("select", "with"):
+            return
+        db_path = path.abspath(db_path)
+        # Spellings that differ only in whitespace, case or aliases count as one query
+        key = (db_path, normalize_sql(query) or strip_statement(query))
+        line = None
+        if persist and self.log_path:
+            line = json.dumps({"db": db_path, "query": query, "ts": time.time()}) + "\n"
+        with self._lock:
+            if key in self._counts or len(self._counts) < MAX_LOGGED_QUERIES:
+                self._counts[key] += 1
+                self._texts.setdefault(key, strip_statement(query))
+            if line is None:
+                return
+            self._buffer.append(line)
+            due = (
+                len(self._buffer) >= LOG_FLUSH_LINES
+                or time.monotonic() - self._last_flush >= LOG_FLUSH_SECONDS
+            )
+        if due:
+            # Another thread already writing a batch will take this line with the next one
+            self.flush(wait=False)
+
+    def flush(self, wait: bool = True) -> None:
+        """Append the buffered lines to the log file."""
+        if not self.log_path or not self._write_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if lines:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write("".join(lines))
+        finally:
+            self._write_lock.release()
+
+    def queries(self, db_path: str) -> List[Tuple[str, int]]:
+        """``(query, runs)`` pairs recorded for ``db_path``, most frequent first."""
+        db_path = path.abspath(db_path)
+        with self._lock:
+            return [
+                (self._texts[key], n)
+                for key, n in self._counts.most_common()
+                if key[0] == db_path
+            ]
+
+    @classmethod
+    def load(cls, log_path: str) -> "QueryLog":
+        """Read a JSONL query log written by :meth:`record`."""
+        log = cls()
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    log.record(entry["db"], entry["query"], persist=False)
+        return log
+
+
+_LOG = QueryLog(os.getenv("QUERY_LOG_PATH"))
+
+
+def get_query_log() -> QueryLog:
+    """The process-wide query log."""
+    return _LOG
+
+
+def record_query(db_path: str, query: str) -> None:
+    """Shortcut for ``get_query_log().record(db_path, query)``."""
+    _LOG.record(db_path, query)
+
+
+class ColumnUsage(NamedTuple):
+    equality: List[str]
+    range: List[str]
+    other: List[str]
+    # True when the query selects every column (``*`` or ``t.*``), so no index can cover it
+    all_columns: bool
+
+
+def column_usage(query: str, columns: Dict[str, List[str]]) -> Dict[str, ColumnUsage]:
+    """How each referenced table's columns are used by ``query``.
+
+    Columns compared with ``=``/``IN``/``IS`` in WHERE or ON are equality
+    columns, ones compared with ``<``/``>``/``BETWEEN``/``LIKE`` are range
+    columns, and any other reference (select list, GROUP BY, ORDER BY,
+    columns inside functions) only matters for covering.
+    """
+    aliases = table_aliases(query)
+    lowered = {t.lower(): t for t in columns}
+    tables = {lowered[t.lower()] for t in aliases.values() if t.lower() in lowered}
+    names = {t: {c.lower(): c for c in columns[t]} for t in tables}
+    usage = {t: {"equality": [], "range": [], "other": [], "all": False} for t in tables}
+
+    tokens = tokenize(query)
+    words = [t.text.strip('"`[]').lower() if t.kind in ("word", "quoted") else t.text for t in tokens]
+    clause = None
+    for i, (token, word) in enumerate(zip(tokens, words)):
+        prev = words[i - 1] if i > 0 else ""
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if token.kind == "word" and word in CLAUSES:
+            clause = word
+            continue
+        if word == "*" and clause == "select" and prev in ("select", ",", "distinct", "."):
+            if prev == ".":
+                table = aliases.get(words[i - 2])
+                targets = [lowered[table.lower()]] if table and table.lower() in lowered else []
+            else:
+                targets = list(tables)
+            for table in targets:
+                usage[table]["all"] = True
+            continue
+        if token.kind not in ("word", "quoted") or following in (".", "("):
+            continue
+
+        if prev == "." and i >= 2:
+            table = aliases.get(words[i - 2])
+            table = lowered.get(table.lower()) if table else None
+            if table is None or word not in names[table]:
+                continue
+        else:
+            owners = [t for t in tables if word in names[t]]
+            if len(owners) != 1:
+                continue
+            table = owners[0]
+        column = names[table][word]
+
+        # For qualified names the operator before the column sits before "alias."
+        before = words[i - 3] if prev == "." and i >= 3 else prev
+        kind = "other"
+        if clause in ("where", "on"):
+            if following in EQUALITY_OPS or before in EQUALITY_OPS:
+                kind = "equality"
+            elif following in RANGE_OPS or before in RANGE_OPS:
+                kind = "range"
+        if column not in usage[table][kind]:
+            usage[table][kind].append(column)
+
+    return {
+        table: ColumnUsage(u["equality"], u["range"], u["other"], u["all"])
+        for table, u in usage.items()
+    }
+
+
+def index_columns(usage: ColumnUsage) -> List[str]:
+    """Key columns (equalities, then one range) plus covering columns when they fit."""
+    key = list(usage.equality)
+    key += [c for c in usage.range if c not in key][:1]
+    if not key:
+        return []
+    rest = [c for c in usage.equality + usage.range + usage.other if c not in key]
+    if not usage.all_columns and len(key) + len(rest) <= MAX_INDEX_COLUMNS:
+        return key + rest
+    return key
+
+
+def index_name(table: str, columns: Sequence[str]) -> str:
+    return re.sub(r"\W", "_", f"idx_{table}_{'_'.join(columns)}").lower()
+
+
+def create_index_sql(table: str, columns: Sequence[str]) -> str:
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    return (
+        f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name(table, columns))} "
+        f"ON {quote_identifier(table)} ({cols})"
+    )
+
+
+def schema_copy(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """In-memory database with the same tables, indexes, views and planner statistics, but no rows.
+
+    Query plans only depend on the schema and ``sqlite_stat1``, so candidate
+    indexes can be tried here in microseconds instead of being built on the data.
+    """
+    copy = sqlite3.connect(":memory:")
+    rows = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END"
+    ).fetchall()
+    for (sql,) in rows:
+        copy.execute(sql)
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone()
+    if has_stats:
+        copy.execute("ANALYZE")
+        copy.execute("DELETE FROM sqlite_stat1")
+        copy.executemany(
+            "INSERT INTO sqlite_stat1 VALUES (?, ?, ?)",
+            conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall(),
+        )
+        # Reload the statistics into the planner
+        copy.execute("ANALYZE sqlite_master")
+    return copy
+
+
+class IndexProposal(NamedTuple):
+    table: str
+    columns: List[str]
+    statement: str
+    # Distinct queries whose plan changes, and how often they were run
+    queries: int
+    runs: int
+    # Estimated row visits of those queries (weighted by runs) without and with the index
+    before: float
+    after: float
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.after / self.before if self.before else 0.0
+
+
+class AdvisorReport(NamedTuple):
+    proposals: List[IndexProposal]
+    queries: int
+    runs: int
+    before: float
+    after: float
+
+    def format(self) -> str:
+        lines = [f"Analyzed {self.queries} distinct queries ({self.runs} runs)."]
+        if not self.proposals:
+            lines.append("No index would reduce the estimated row visits.")
+            return "\n".join(lines)
+        for p in self.proposals:
+            lines.append(f"{p.statement};")
+            lines.append(
+                f"    {p.queries} queries / {p.runs} runs: row visits "
+                f"{p.before:,.0f} -> {p.after:,.0f} (-{p.reduction:.1%})"
+            )
+        total = 1 - self.after / self.before if self.before else 0.0
+        lines.append(
+            f"Total estimated row visits: {self.before:,.0f} -> {self.after:,.0f} (-{total:.1%})"
+        )
+        return "\n".join(lines)
+
+
+def advise(db_path: str, queries: Sequence[Tuple[str, int]]) -> AdvisorReport:
+    """Propose indexes for ``queries``, given as ``(sql, runs)`` pairs.
+
+    Candidates come from each query's filter and join columns on tables its
+    plan reads in full. They are tried one at a time on a schema-only copy,
+    most promising first, and kept if they cut at least :data:`MIN_REDUCTION`
+    of the row visits of the queries whose plans they change.
+    """
+    schema = get_schema(db_path).tables
+    columns = {t: [c[1] for c in info["columns"]] for t, info in schema.items()}
+    table_rows = {t.name: t.rows for t in get_table_stats(db_path)}
+    with get_pool(db_path).connection() as conn:
+        copy = schema_copy(conn)
+
+    def cost(query: str) -> float:
+        return estimate_cost(explain(copy, query), table_rows, table_aliases(query)).cost
+
+    workload, current, candidates = [], {}, {}
+    for query, runs in queries:
+        try:
+            estimate = estimate_cost(explain(copy, query), table_rows, table_aliases(query))
+        except sqlite3.Error:
+            # Queries that no longer compile against the schema
+            continue
+        workload.append((query, runs))
+        current[query] = estimate.cost
+        full_reads = {t.lower() for t in estimate.scans}
+        for table, usage in column_usage(query, columns).items():
+            cols = index_columns(usage) if table.lower() in full_reads else []
+            if cols:
+                candidates.setdefault((table, tuple(cols)), 0.0)
+                candidates[(table, tuple(cols))] += runs * estimate.cost
+
+    # A candidate whose columns start with another's serves both
+    keys = sorted(candidates, key=lambda k: -len(k[1]))
+    merged: Dict[tuple, float] = {}
+    for key in keys:
+        wider = next((m for m in merged if m[0] == key[0] and m[1][: len(key[1])] == key[1]), None)
+        if wider is not None:
+            merged[wider] += candidates[key]
+        else:
+            merged[key] = candidates[key]
+
+    before_total = sum(runs * current[q] for q, runs in workload)
+    proposals = []
+    for table, cols in sorted(merged, key=lambda k: -merged[k]):
+        statement = create_index_sql(table, cols)
+        copy.execute(statement)
+        changed: List[Tuple[str, int, float]] = []
+        for query, runs in workload:
+            new = cost(query)
+            if new != current[query]:
+                changed.append((query, runs, new))
+        before = sum(runs * current[q] for q, runs, _ in changed)
+        after = sum(runs * new for _, runs, new in changed)
+        if before and after <= before * (1 - MIN_REDUCTION):
+            for query, _, new in changed:
+                current[query] = new
+            proposals.append(
+                IndexProposal(
+                    table, list(cols), statement, len(changed),
+                    sum(runs for _, runs, _ in changed), before, after,
+                )
+            )
+        else:
+            copy.execute(f"DROP INDEX {quote_identifier(index_name(table, cols))}")
+    copy.close()
+
+    after_total = sum(runs * current[q] for q, runs in workload)
+    return AdvisorReport(
+        proposals, len(workload), sum(r for _, r in workload), before_total, after_total
+    )
+
+
+def apply_indexes(db_path: str, target_path: str, proposals: Sequence[IndexProposal]) -> str:
+    """Copy ``db_path`` to ``target_path`` and build the proposed indexes there.
+
+    The copy is made with the SQLite backup API, page by page, so it is
+    consistent even while the agents keep reading the source. ``ANALYZE``
+    runs afterwards so the planner knows the new indexes' selectivity.
+    """
+    if path.abspath(db_path) == path.abspath(target_path):
+        raise ValueError("Indexes are built on a copy; choose a target other than the source")
+    source = sqlite3.connect(f"file:{quote(db_path)}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+        for proposal in proposals:
+            target.execute(proposal.statement)
+        target.execute("ANALYZE")
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+    return target_path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Propose indexes for the queries the agents run")
+    parser.add_argument("db_path", help="SQLite database the queries ran against")
+    parser.add_argument(
+        "--log",
+        default=os.getenv("QUERY_LOG_PATH"),
+        help="JSONL query log (defaults to QUERY_LOG_PATH)",
+    )
+    parser.add_argument("--min-runs", type=int, default=1, help="Ignore queries run fewer times")
+    parser.add_argument("--apply", metavar="TARGET", help="Build the indexes on a copy at TARGET")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.log:
+        raise SystemExit("No query log given; pass --log or set QUERY_LOG_PATH")
+    log = QueryLog.load(args.log)
+    queries = [(q, n) for q, n in log.queries(args.db_path) if n >= args.min_runs]
+    report = advise(args.db_path, queries)
+    print(report.format())
+    if args.apply and report.proposals:
+        apply_indexes(args.db_path, args.apply, report.proposals)
+        print(f"Built {len(report.proposals)} indexes on {args.apply}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import autogen
-from typing import List
+from typing import List, Optional
 
 
 def create_orchestrator_agent(config_list: List[dict]) -> autogen.AssistantAgent:
@@ -26,10 +26,8 @@ You are the Orchestrator Agent, the central command hub. Your task is to receive
         llm_config={"config_list": config_list}
     )
 
-def create_query_parser_agent(config_list: List[dict]) -> autogen.AssistantAgent:
-    return autogen.AssistantAgent(
-        name="Query_Parser",
-        system_message="""[Introduction]
+def create_query_parser_agent(config_list: List[dict], schema: Optional[str] = None) -> autogen.AssistantAgent:
+    system_message = """[Introduction]
 You are the Query Parser Agent. Your role is to analyze the structured database schema provided to you and generate the SQL queries that best answer the user's query.
 
 [Capabilities of the Agent]
@@ -45,7 +43,16 @@ You are the Query Parser Agent. Your role is to analyze the structured database
 
 [Examples]
 - When provided with a schema detailing tables like "orders" and "customers", and a query on sales performance, you generate SQL statements aggregating sales data based on available fields.
-- If the Executor returns an error, you review your SQL, adjust syntax or logic, and resend the corrected query through the Orchestrator.""",
+- If the Executor returns an error, you review your SQL, adjust syntax or logic, and resend the corrected query through the Orchestrator."""
+    if schema:
+        system_message += f"""
+
+[Database Schema]
+The schema below is generated from the live database (column types, keys, row counts and example values). Use it directly.
+{schema}"""
+    return autogen.AssistantAgent(
+        name="Query_Parser",
+        system_message=system_message,
         llm_config={"config_list": config_list}
     )
 
@@ -94,42 +101,3 @@ You are the Report Generator Agent. Your role is to compile the outputs and data
 - If inconsistencies in data are observed, include a note for further review rather than making assumptions.""",
         llm_config={"config_list": config_list}
     )
-
-def create_schema_provider_agent(config_list: List[dict]) -> autogen.AssistantAgent:
-    return autogen.AssistantAgent(
-        name="Schema_Provider",
-        system_message="""[Introduction]
-You are the Schema Provider. Your job is to extract and process the complete database schema using inbuilt, standardized SQL queries and provide it in a structured format for the Query Parser Agent.
-
-[Capabilities of the Agent]
-- You reliably extract current schema details from the ecommerce SQLite database.
-- You process and sanitize raw schema data into a clear, structured format.
-- You prevent hallucinations by ensuring data integrity.
-
-[Rules and Limitations]
-- You must not allow unverified or incomplete schema information to be returned.
-- Your outputs should be limited strictly to schema details without inferring additional context.
-- Always deliver processed, structured schema data to the Orchestrator.
-- You are not to execute any data-modifying queries; your role is read-only.
-
-[Examples]
-- Upon request from the Orchestrator, you run inbuilt queries to extract table names, field details, and relationships, then provide a structured output.
-
-Output Format: Schema Output
-
-1. **Tables**
-   - **{table_name}**
-     - {column_name}: {data_type}
-     - ...
-
-   - **{table_name}**
-     - {column_name}: {data_type}
-     - ...
-
-2. **Relationships**
-   - `{table_name}.{column_name}` → `{referenced_table}.{referenced_column}`
-   - ...
-   
-- When requested again, always ensure you return the latest schema without redundancies or extraneous information.""",
-        llm_config={"config_list": config_list}
-    )
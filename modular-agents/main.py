@@ -1,18 +1,23 @@
 import os
+import sys
+from os import path
+from typing import Optional
 from dotenv import load_dotenv
 import autogen
-import sqlite3
-from agents import (
+
+sys.path.append(path.join(path.dirname(__file__), ".."))
+from agents import (  # noqa: E402
     create_orchestrator_agent,
     create_query_parser_agent,
     create_executor_agent,
     create_report_generator_agent,
-    create_schema_provider_agent
 )
-from tools import query_executor, schema_provider
+from tools import query_executor, schema_provider  # noqa: E402
+from db_pool import get_pool  # noqa: E402
+from schema_summary import summarize_schema  # noqa: E402
 
 def check_db_connection(db_path: str) -> bool:
-    """Check if the database exists and is accessible.
+    """Check if the database exists and is accessible, and warm up the shared connection pool.
     
     Args:
         db_path (str): Path to the SQLite database file
@@ -21,7 +26,9 @@ def check_db_connection(db_path: str) -> bool:
         bool: True if database is accessible, False otherwise
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        pool = get_pool(db_path)
+        pool.warm_up()
+        with pool.connection() as conn:
             # Try to execute a simple query to verify connection
             cursor = conn.cursor()
             cursor.execute("SELECT 1")
@@ -31,7 +38,7 @@ def check_db_connection(db_path: str) -> bool:
         print(f"Database connection error: {str(e)}")
         return False
 
-def main():
+def main(query: Optional[str] = None):
     # Load environment variables
     load_dotenv()
     
@@ -53,23 +60,27 @@ def main():
     # Create function map for tools
     function_map = {
         "query_executor": lambda query: query_executor(query, db_path),
-        "schema_provider": lambda: schema_provider(db_path)
+        "schema_provider": lambda query=None: schema_provider(db_path, query)
     }
     
+    # Summarize the live schema once and hand it to the Query Parser directly,
+    # instead of spending a Schema_Provider agent round-trip on every query.
+    # On large databases only the tables relevant to the query are included.
+    schema = summarize_schema(db_path, query=query)
+
     # Create agents with function calling
     orchestrator = create_orchestrator_agent(autogen_config)
-    schema_provider_agent = create_schema_provider_agent(autogen_config)
-    query_parser = create_query_parser_agent(autogen_config)
+    query_parser = create_query_parser_agent(autogen_config, schema=schema)
     executor = create_executor_agent(autogen_config)
     report_generator = create_report_generator_agent(autogen_config)
     
     # Register functions with agents
-    for agent in [orchestrator, schema_provider_agent, query_parser, executor, report_generator]:
+    for agent in [orchestrator, query_parser, executor, report_generator]:
         agent.register_function(function_map)
     
     # Create group chat
     groupchat = autogen.GroupChat(
-        agents=[orchestrator, schema_provider_agent, query_parser, executor, report_generator],
+        agents=[orchestrator, query_parser, executor, report_generator],
         messages=[],
         max_round=10
     )
@@ -83,12 +94,14 @@ def main():
     return manager
 
 if __name__ == "__main__":
+    query = "What were the sales last 2 month?"
+
     # Initialize the system
-    manager = main()
+    manager = main(query)
     
     # Process a queryclear
     chat = manager.initiate_chat(
         manager.groupchat.agents[0],  # The orchestrator agent
-        message="What were the sales last 2 month?"
+        message=query
     )
     print(chat.summary())
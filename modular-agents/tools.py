@@ -1,70 +1,137 @@
-import sqlite3
-from typing import Dict, Any
+import sys
+from os import path
+from typing import Dict, Any, Optional
 
-def query_executor(query: str, db_path: str) -> Dict[str, Any]:
+sys.path.append(path.join(path.dirname(__file__), ".."))
+from db_pool import get_pool  # noqa: E402
+from index_advisor import record_query  # noqa: E402
+from query_cache import get_query_cache  # noqa: E402
+from query_guard import QueryError, get_query_guard  # noqa: E402
+from result_stream import (  # noqa: E402
+    PREVIEW_MAX_BYTES,
+    PREVIEW_MAX_ROWS,
+    ResultSummary,
+    iter_batches,
+    take_preview,
+)
+from schema_cache import format_schema, get_schema  # noqa: E402
+from schema_summary import select_tables  # noqa: E402
+
+def stream_query(
+    cursor,
+    max_rows: int = PREVIEW_MAX_ROWS,
+    max_bytes: int = PREVIEW_MAX_BYTES
+) -> Dict[str, Any]:
+    """Consume an executed cursor in batches, keeping only what fits the LLM budget.
+
+    Args:
+        cursor: Executed sqlite3 cursor
+        max_rows (int): Maximum number of rows returned to the model
+        max_bytes (int): Maximum size of the returned rows, in characters of their repr
+
+    Returns:
+        Dict[str, Any]: The leading rows, the total row count and, when rows were
+        left out, summary statistics over all of them
+    """
+    columns = [description[0] for description in cursor.description]
+    summary = ResultSummary(columns)
+    preview, truncated = [], False
+    for rows in iter_batches(cursor):
+        summary.update_rows(rows)
+        if not truncated:
+            kept, truncated = take_preview(rows, max_rows - len(preview), max_bytes - len(repr(preview)))
+            preview.extend(kept)
+    payload = {
+        "columns": columns,
+        "results": preview,
+        "row_count": summary.rows,
+        "truncated": truncated
+    }
+    if truncated:
+        payload["summary"] = summary.to_dict()
+    return payload
+
+def query_executor(
+    query: str,
+    db_path: str,
+    max_rows: int = PREVIEW_MAX_ROWS,
+    max_bytes: int = PREVIEW_MAX_BYTES
+) -> Dict[str, Any]:
     """Executes SQL queries against the database and returns results.
+
+    The query guard rejects, samples or limits expensive queries before they
+    run and stops them at its time limit. Rows are streamed from the cursor in
+    batches, so memory stays flat however large the result is. Only the rows
+    that fit the row/byte budget are returned; larger results come with their
+    total row count and per-column statistics.
     
     Args:
         query (str): The SQL query to execute
         db_path (str): Path to the SQLite database file
+        max_rows (int): Maximum number of rows returned
+        max_bytes (int): Maximum size of the returned rows, in characters
         
     Returns:
         Dict[str, Any]: Query results with columns and data, or error information
+        (with ``error_type`` and ``retryable`` when the guard stopped the query)
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query)
-            columns = [description[0] for description in cursor.description]
-            results = cursor.fetchall()
-            return {
-                "success": True,
-                "columns": columns,
-                "results": results
-            }
+        record_query(db_path, query)
+        cache = get_query_cache()
+        key = cache.key(db_path, query)
+        if key is not None:
+            key += (max_rows, max_bytes)
+        with get_pool(db_path).connection() as conn:
+            hit = cache.get(conn, key, query)
+            if hit is not None:
+                columns, payload = hit
+                payload = dict(payload, columns=columns)
+            else:
+                guard = get_query_guard()
+                decision = guard.check(conn, db_path, query)
+                with guard.deadline(conn):
+                    payload = stream_query(conn.execute(decision.query), max_rows, max_bytes)
+                if decision.notes:
+                    payload["notes"] = decision.notes
+                cache.put(key, payload, len(payload["columns"]), len(repr(payload)))
+            return {"success": True, **payload}
+    except QueryError as e:
+        # Rejected or timed-out queries carry their type so the agent can react
+        return {"success": False, **e.to_dict()}
     except Exception as e:
         return {
             "success": False,
             "error": str(e)
         }
 
-def schema_provider(db_path: str) -> Dict[str, Any]:
+def schema_provider(db_path: str, query: Optional[str] = None, top_k: int = 8) -> Dict[str, Any]:
     """Extracts and provides the database schema information.
+
+    The introspected schema is cached and only re-read when the database's
+    ``PRAGMA schema_version`` changes. When a query is given and the database
+    has more than ``top_k`` tables, only the tables most relevant to the query
+    and their foreign-key neighbours are returned.
     
     Args:
         db_path (str): Path to the SQLite database file
+        query (Optional[str]): The user query used to select relevant tables
+        top_k (int): Number of best-matching tables to return for a query
         
     Returns:
-        Dict[str, Any]: Database schema information or error details
+        Dict[str, Any]: Database schema information (raw and in the Schema Output
+        format) or error details
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Get all tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            schema_info = {}
-            for table in tables:
-                table_name = table[0]
-                # Get table structure
-                cursor.execute(f"PRAGMA table_info({table_name});")
-                columns = cursor.fetchall()
-                
-                # Get foreign key information
-                cursor.execute(f"PRAGMA foreign_key_list({table_name});")
-                foreign_keys = cursor.fetchall()
-                
-                schema_info[table_name] = {
-                    "columns": columns,
-                    "foreign_keys": foreign_keys
-                }
-            
-            return {
-                "success": True,
-                "schema": schema_info
-            }
+        snapshot = get_schema(db_path)
+        tables = snapshot.tables
+        if query:
+            names = [t.name for t in select_tables(db_path, query, top_k)]
+            tables = {name: snapshot.tables[name] for name in names}
+        return {
+            "success": True,
+            "schema": tables,
+            "formatted": snapshot.formatted if tables is snapshot.tables else format_schema(tables)
+        }
     except Exception as e:
         return {
             "success": False,
@@ -0,0 +1,236 @@
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from query_guard import QueryCancelled
+from results import QueryResult, python_scalar
+
+logger = logging.getLogger(__name__)
+
+# Aliases accepted from the LLM, mapped to the canonical function name
+FUNC_ALIASES = {
+    "sum": "sum",
+    "total": "sum",
+    "average": "average",
+    "avg": "average",
+    "mean": "average",
+    "min": "min",
+    "max": "max",
+    "median": "median",
+    "count": "count",
+    "count_all": "count_all",
+    "count_distinct": "count_distinct",
+    "nunique": "count_distinct",
+    "null_count": "null_count",
+    "stddev": "stddev",
+    "std": "stddev",
+    "variance": "variance",
+    "var": "variance",
+}
+
+PERCENTILE_RE = re.compile(r"^(?:p|percentile_?)(\d{1,2}(?:\.\d+)?|100)$")
+
+SUPPORTED_FUNCS = (
+    "sum, average, min, max, median, count, count_all, count_distinct, "
+    "null_count, stddev, variance, pNN (percentile, e.g. p90)"
+)
+
+# SQL templates for the functions SQLite can compute natively; anything else
+# (median, stddev, variance, percentiles) is computed in memory
+PUSHDOWN_SQL = {
+    # SUM of no rows is NULL in SQL but 0 in pandas
+    "sum": "COALESCE(SUM({col}), 0)",
+    "average": "AVG({col})",
+    "min": "MIN({col})",
+    "max": "MAX({col})",
+    "count": "COUNT({col})",
+    "count_all": "COUNT(*)",
+    "count_distinct": "COUNT(DISTINCT {col})",
+    "null_count": "COUNT(*) - COUNT({col})",
+}
+
+LEADING_COMMENTS_RE = re.compile(r"^(\s+|--[^\n]*(\n|$)|/\*.*?\*/)+", re.DOTALL)
+
+
+class AggregateSpec(BaseModel):
+    """One (column, function) pair to compute."""
+
+    column: str = Field(description="Column to aggregate ('*' is allowed for count_all)")
+    func: str = Field(description=f"Aggregate function: {SUPPORTED_FUNCS}")
+
+
+def normalize_func(func: str) -> str:
+    """Return the canonical name of an aggregate function, e.g. ``avg`` -> ``average``."""
+    func = func.strip().lower()
+    if func in FUNC_ALIASES:
+        return FUNC_ALIASES[func]
+    match = PERCENTILE_RE.match(func)
+    if match:
+        return f"p{match.group(1)}"
+    raise ValueError(f"Unsupported aggregate function: {func}. Supported: {SUPPORTED_FUNCS}")
+
+
+def _size(target) -> Any:
+    # DataFrame.size counts cells, GroupBy.size() counts rows per group
+    return len(target) if isinstance(target, pd.DataFrame) else target.size()
+
+
+def _apply(target, column: str, func: str) -> Any:
+    """Compute one null-aware aggregate over a DataFrame or a DataFrameGroupBy."""
+    if func == "count_all":
+        return _size(target)
+
+    series = target[column]
+    if func == "sum":
+        return series.sum()
+    if func == "average":
+        return series.mean()
+    if func == "min":
+        return series.min()
+    if func == "max":
+        return series.max()
+    if func == "median":
+        return series.median()
+    if func == "count":
+        return series.count()
+    if func == "count_distinct":
+        return series.nunique()
+    if func == "null_count":
+        return _size(target) - series.count()
+    if func == "stddev":
+        return series.std()
+    if func == "variance":
+        return series.var()
+    if func.startswith("p"):
+        return series.quantile(float(func[1:]) / 100)
+    raise ValueError(f"Unsupported aggregate function: {func}")
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _output_name(column: str, func: str) -> str:
+    return func if func == "count_all" else f"{func}_{column}"
+
+
+def plan_pushdown(
+    query: Optional[str],
+    specs: Sequence[Tuple[str, str]],
+    group_by: Sequence[str],
+) -> Optional[str]:
+    """Compile aggregates over ``query`` into a single SQL statement.
+
+    The original query is wrapped as a subquery, so WHERE/JOIN/LIMIT semantics
+    are preserved exactly.
+
+    Args:
+        query (str, optional): The SQL that produced the data
+        specs (Sequence[Tuple[str, str]]): Normalized (column, func) pairs
+        group_by (Sequence[str]): Columns to group by
+
+    Returns:
+        Optional[str]: The rewritten SQL, or None if it cannot be pushed down
+    """
+    if not query:
+        return None
+    body = LEADING_COMMENTS_RE.sub("", query).strip().rstrip(";").strip()
+    # Only a single plain SELECT (optionally with a CTE) can be wrapped safely
+    if ";" in body or not re.match(r"(?i)^(select|with)\b", body):
+        return None
+    if any(func not in PUSHDOWN_SQL for _, func in specs):
+        return None
+
+    keys = [_quote(key) for key in group_by]
+    select = list(keys)
+    for column, func in specs:
+        expr = PUSHDOWN_SQL[func].format(col=_quote(column))
+        select.append(f"{expr} AS {_quote(_output_name(column, func))}")
+
+    sql = f"SELECT {', '.join(select)} FROM (\n{body}\n) AS _src"
+    if keys:
+        sql += f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+    return sql
+
+
+def _scalars(values: Dict[str, Any], notes: Sequence[str]) -> Dict[str, Any]:
+    out = {name: python_scalar(value) for name, value in values.items()}
+    if notes:
+        out["notes"] = list(notes)
+    return out
+
+
+def aggregate(
+    result: QueryResult,
+    aggregations: Sequence[AggregateSpec],
+    group_by: Optional[List[str]] = None,
+    executor: Optional[Callable[[str], QueryResult]] = None,
+) -> Union[Dict[str, Any], QueryResult]:
+    """Compute several aggregates over a query result.
+
+    When ``executor`` is given and the result came from a plain SELECT, the
+    aggregates are pushed down into the database as one wrapped query. Otherwise
+    (or if the rewritten query fails) they are computed in memory in one
+    vectorized pass. Nulls are skipped by every function except ``count_all``
+    and ``null_count``.
+
+    Results the query guard sampled or limited are aggregated in memory, over
+    exactly the rows they hold; so are results read before the database last
+    changed, for which callers pass no ``executor``. Notes on the data (from the result, or from
+    the pushed-down query) are passed on: as a ``"notes"`` entry without
+    grouping, as the notes of the grouped result otherwise.
+
+    Args:
+        result (QueryResult): The data to aggregate
+        aggregations (Sequence[AggregateSpec]): (column, func) pairs to compute
+        group_by (List[str], optional): Columns to group by
+        executor (Callable[[str], QueryResult], optional): Runs SQL for pushdown
+
+    Returns:
+        Union[Dict[str, Any], QueryResult]: ``{"<func>_<column>": value}`` without
+        grouping, otherwise one row per group with the keys and each aggregate
+    """
+    if not aggregations:
+        raise ValueError("At least one aggregation is required")
+
+    group_by = list(group_by or [])
+    specs = []
+    for spec in aggregations:
+        func = normalize_func(spec.func)
+        if func != "count_all" and spec.column not in result:
+            raise KeyError(f"Column '{spec.column}' not found in query result")
+        specs.append((spec.column, func))
+    for key in group_by:
+        if key not in result:
+            raise KeyError(f"Group-by column '{key}' not found in query result")
+
+    # Renamed duplicate columns cannot be referenced from the wrapping query, and
+    # re-running a sampled or limited query would aggregate different rows than it returned
+    if executor is not None and result.has_sql_names and not result.notes:
+        sql = plan_pushdown(result.query, specs, group_by)
+        if sql is not None:
+            try:
+                pushed = executor(sql)
+                return pushed if group_by else _scalars(pushed[0], pushed.notes)
+            except QueryCancelled:
+                raise
+            except Exception as e:
+                logger.warning(f"Aggregate pushdown failed, computing in memory: {e}")
+
+    df = result.to_frame()
+    # Factorize the group keys once and reuse the grouping for every aggregate
+    target = df.groupby(group_by, dropna=False, sort=True) if group_by else df
+
+    values = {}
+    for column, func in specs:
+        values[_output_name(column, func)] = _apply(target, column, func)
+
+    if not group_by:
+        return _scalars(values, result.notes)
+
+    grouped = QueryResult.from_frame(pd.DataFrame(values).reset_index())
+    grouped.notes = list(result.notes)
+    return grouped
@@ -0,0 +1,267 @@
+import os
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Most points a line, area or scatter figure is built from, and most histogram bins
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "2000"))
+# Most bars in a bar chart and slices in a pie chart; the rest are folded into "Other"
+PLOT_MAX_BARS = int(os.getenv("PLOT_MAX_BARS", "200"))
+PLOT_TOP_N = int(os.getenv("PLOT_TOP_N", "20"))
+
+# Series longer than this many times the budget are min-max decimated before LTTB
+MINMAX_RATIO = 4
+
+OTHER_LABEL = "Other"
+
+
+class Downsampled(NamedTuple):
+    """Plot input after downsampling; the plot type and keys may change (histogram -> bar)."""
+
+    columns: Dict[str, np.ndarray]
+    plot_type: str
+    x_key: Optional[str]
+    y_key: Optional[str]
+    # Human-readable description of the reduction, None if the data was left as is
+    note: Optional[str]
+
+
+def _as_float(array: np.ndarray) -> Optional[np.ndarray]:
+    """The column as float64 (NULL -> NaN), or None if it is not numeric."""
+    if array.dtype.kind in "biuf":
+        return array.astype(np.float64)
+    try:
+        return np.asarray(array, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def _finite_mean(values: np.ndarray) -> float:
+    finite = values[np.isfinite(values)]
+    return float(finite.mean()) if len(finite) else 0.0
+
+
+def _take(columns: Dict[str, np.ndarray], index: np.ndarray) -> Dict[str, np.ndarray]:
+    return {name: array[index] for name, array in columns.items()}
+
+
+def stride_indices(n: int, n_out: int) -> np.ndarray:
+    """``n_out`` evenly spaced indices, for data that has no numeric order."""
+    return np.unique(np.linspace(0, n - 1, n_out).astype(np.int64))
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the minimum and maximum of ``n_out // 2`` equal-sized buckets.
+
+    A cheap, fully vectorized first pass that keeps every peak and trough.
+    """
+    n = len(y)
+    size = -(-n // max(n_out // 2, 1))
+    rows = -(-n // size)
+    low = np.full(rows * size, np.inf)
+    high = np.full(rows * size, -np.inf)
+    finite = np.isfinite(y)
+    low[:n] = np.where(finite, y, np.inf)
+    high[:n] = np.where(finite, y, -np.inf)
+    offsets = np.arange(rows) * size
+    picks = np.concatenate(
+        [
+            offsets + low.reshape(rows, size).argmin(axis=1),
+            offsets + high.reshape(rows, size).argmax(axis=1),
+        ]
+    )
+    return np.unique(picks[picks < n])
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of ``n_out`` points that keep the shape of a series.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    selected point and the average of the next bucket.
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n) if n <= n_out else np.array([0, n - 1])
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[hi : edges[i + 2]].mean()
+            next_y = _finite_mean(y[hi : edges[i + 2]])
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        out[i + 1] = a
+    return out
+
+
+def _downsample_line(columns, x_key, y_key, max_points):
+    n = len(columns[y_key])
+    y = _as_float(columns[y_key])
+    if y is None:
+        index = stride_indices(n, max_points)
+        return _take(columns, index), "evenly spaced"
+
+    x = _as_float(columns[x_key]) if x_key is not None else None
+    if x is None or not np.isfinite(x).all():
+        # Dates stored as text and other labels: the row order is the x order
+        x = np.arange(n, dtype=np.float64)
+
+    index = np.arange(n)
+    method = "LTTB"
+    if n > MINMAX_RATIO * max_points:
+        index = minmax_indices(y, MINMAX_RATIO * max_points)
+        method = "min-max + LTTB"
+    index = index[lttb_indices(x[index], y[index], max_points)]
+    return _take(columns, index), method
+
+
+def _downsample_scatter(columns, x_key, y_key, max_points):
+    n = len(columns[y_key])
+    x = _as_float(columns[x_key]) if x_key is not None else None
+    y = _as_float(columns[y_key])
+    if x is None or y is None:
+        return _take(columns, stride_indices(n, max_points)), "evenly spaced"
+
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return _take(columns, stride_indices(n, max_points)), "evenly spaced"
+
+    # One representative point per occupied cell of a side x side grid
+    side = max(int(np.sqrt(max_points)), 1)
+
+    def cells(values):
+        lo, hi = values[finite].min(), values[finite].max()
+        scaled = (values[finite] - lo) / ((hi - lo) or 1.0) * side
+        return np.clip(scaled.astype(np.int64), 0, side - 1)
+
+    _, first = np.unique(cells(x) * side + cells(y), return_index=True)
+    index = np.sort(np.flatnonzero(finite)[first])
+    return _take(columns, index), f"one point per cell of a {side}x{side} grid"
+
+
+def _downsample_histogram(columns, y_key, max_points):
+    values = columns[y_key]
+    numeric = _as_float(values)
+    if numeric is None:
+        counts = pd.Series(values).value_counts()
+        labels, counts = _fold_other(counts.index.to_numpy(dtype=object), counts.to_numpy(), max_points)
+        return {y_key: labels, "count": counts}, "pre-counted"
+
+    finite = numeric[np.isfinite(numeric)]
+    edges = np.histogram_bin_edges(finite, bins="auto") if len(finite) else np.array([0.0, 1.0])
+    if len(edges) - 1 > max_points:
+        edges = np.histogram_bin_edges(finite, bins=max_points)
+    counts, edges = np.histogram(finite, bins=edges)
+    return {y_key: (edges[:-1] + edges[1:]) / 2, "count": counts}, f"pre-binned into {len(counts)} bins"
+
+
+def _fold_other(labels: np.ndarray, values: np.ndarray, keep: int):
+    """Keep the ``keep - 1`` largest categories in their original order and sum the rest into "Other"."""
+    if len(labels) <= keep:
+        return labels, values
+    top = np.sort(np.argsort(-np.nan_to_num(values.astype(np.float64)), kind="stable")[: keep - 1])
+    rest = np.ones(len(labels), dtype=bool)
+    rest[top] = False
+    out_labels = np.empty(keep, dtype=object)
+    out_labels[: keep - 1] = labels[top]
+    out_labels[-1] = OTHER_LABEL
+    return out_labels, np.append(values[top], np.nansum(values[rest]))
+
+
+def _top_n(columns, x_key, y_key, keep):
+    y = _as_float(columns[y_key])
+    if y is None:
+        return None
+    n = len(y)
+    # Repeated categories are summed first, as the chart would stack them anyway
+    totals = pd.Series(y).groupby(pd.Series(columns[x_key]), sort=False, dropna=False).sum()
+    labels, values = totals.index.to_numpy(dtype=object), totals.to_numpy()
+    if len(totals) <= keep:
+        if n == len(totals):
+            return None
+        return {x_key: labels, y_key: values}, f"{n:,} rows summed into {len(totals):,} categories"
+    labels, values = _fold_other(labels, values, keep)
+    return {x_key: labels, y_key: values}, f"top {keep - 1} of {len(totals):,} categories + {OTHER_LABEL}"
+
+
+def _downsample_heatmap(columns, x_key, y_key, max_points):
+    # The figure pivots the first column after the keys, so the order of the columns is kept
+    value_key = list(columns)[2]
+    df = pd.DataFrame({x_key: columns[x_key], y_key: columns[y_key], value_key: columns[value_key]})
+    side = max(int(np.sqrt(max_points)), 1)
+    kept = []
+    for key in (x_key, y_key):
+        counts = df[key].value_counts(dropna=False)
+        if len(counts) > side:
+            df = df[df[key].isin(counts.index[:side])]
+            kept.append(f"top {side} of {len(counts):,} {key} values")
+    # One cell per (x, y) pair, which the pivot needs anyway
+    how = "mean" if _as_float(columns[value_key]) is not None else "first"
+    cells = df.groupby([x_key, y_key], sort=False, dropna=False)[value_key].agg(how).reset_index()
+    note = f"{len(columns[y_key]):,} rows reduced to {len(cells):,} cells ({how} per cell)"
+    if kept:
+        note += ", " + ", ".join(kept)
+    return {key: cells[key].to_numpy() for key in (x_key, y_key, value_key)}, note
+
+
+def downsample(
+    columns: Dict[str, np.ndarray],
+    plot_type: str,
+    x_key: Optional[str],
+    y_key: Optional[str],
+    max_points: int = PLOT_MAX_POINTS,
+) -> Downsampled:
+    """Reduce the data of a plot to a bounded size before the figure is built.
+
+    Line and area charts are decimated with min-max and LTTB, scatter plots
+    keep one point per grid cell, histograms are binned here instead of in
+    the browser, bar and pie charts are summed per category and keep their
+    largest categories plus "Other", and heatmaps keep one cell per (x, y)
+    pair on at most ``sqrt(max_points)`` values per axis. Data within the
+    budget is returned unchanged.
+
+    Args:
+        columns (Dict[str, np.ndarray]): Column arrays of the data to plot
+        plot_type (str): bar, line, scatter, pie, area, histogram or heatmap
+        x_key (str, optional): Column on the x axis (names for pie charts)
+        y_key (str, optional): Column on the y axis (values for pie charts)
+        max_points (int): Point budget for lines, scatter plots and histogram bins
+
+    Returns:
+        Downsampled: The columns to plot, the plot type and keys to use, and a note
+    """
+    plot_type = plot_type.lower()
+    unchanged = Downsampled(columns, plot_type, x_key, y_key, None)
+    if y_key is None or y_key not in columns:
+        return unchanged
+    n = len(columns[y_key])
+
+    reduced = None
+    if plot_type in ("line", "area") and n > max_points:
+        reduced, method = _downsample_line(columns, x_key, y_key, max_points)
+    elif plot_type == "scatter" and n > max_points:
+        reduced, method = _downsample_scatter(columns, x_key, y_key, max_points)
+    elif plot_type == "histogram" and n > max_points:
+        reduced, method = _downsample_histogram(columns, y_key, max_points)
+        note = f"{n:,} values {method}"
+        return Downsampled(reduced, "bar", y_key, "count", note)
+    elif plot_type in ("bar", "pie") and x_key is not None and x_key in columns:
+        top = _top_n(columns, x_key, y_key, PLOT_TOP_N if plot_type == "pie" else PLOT_MAX_BARS)
+        if top is not None:
+            reduced, note = top
+            return Downsampled(reduced, plot_type, x_key, y_key, note)
+    elif plot_type == "heatmap" and n > max_points and x_key in columns and len(columns) >= 3:
+        reduced, note = _downsample_heatmap(columns, x_key, y_key, max_points)
+        return Downsampled(reduced, plot_type, x_key, y_key, note)
+
+    if reduced is None:
+        return unchanged
+    shown = len(next(iter(reduced.values())))
+    return Downsampled(reduced, plot_type, x_key, y_key, f"{shown:,} of {n:,} points shown ({method})")
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from os import path
+from typing import Dict, Optional
+
+import numpy as np
+import plotly
+
+from figures import REPORT_TEMPLATE, FigureHandle, FigureSpec
+
+# Directory of the persistent figure cache; set to an empty string to keep figures in memory only
+FIGURE_CACHE_DIR = os.getenv(
+    "FIGURE_CACHE_DIR", path.join(path.expanduser("~"), ".cache", "analytics-agent", "figures")
+)
+FIGURE_CACHE_MAX_BYTES = int(os.getenv("FIGURE_CACHE_MAX_BYTES", str(256 * 2**20)))
+
+# Bump when build_figure changes its output, so stale figures are never served
+CACHE_VERSION = 1
+
+# Values of a text column converted to Python and hashed at a time
+FINGERPRINT_CHUNK = 8192
+
+
+def fingerprint(columns: Dict[str, np.ndarray]) -> "hashlib._Hash":
+    """Content hash of plot columns: names, dtypes and values."""
+    digest = hashlib.blake2b(digest_size=20)
+    for name, array in columns.items():
+        digest.update(f"{name}\0{array.dtype.str}\0{len(array)}\0".encode())
+        if array.dtype == object:
+            # Text, dates and mixed values; repr keeps 1 and "1" apart. Hashed in chunks,
+            # so a large unreduced column is never copied into one string
+            for start in range(0, len(array), FINGERPRINT_CHUNK):
+                digest.update(repr(array[start : start + FINGERPRINT_CHUNK].tolist()).encode())
+        else:
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest
+
+
+class FigureCache:
+    """Content-addressed cache of built figures, bounded in bytes.
+
+    Keys hash the plotted data together with everything else that goes into
+    :func:`figures.build_figure`, so an unchanged chart over unchanged data
+    is served without building it again, across sessions and, when
+    ``directory`` is set, across processes and runs. Figures are evicted
+    least recently used first once the total size exceeds ``max_bytes``.
+    """
+
+    def __init__(
+        self, directory: Optional[str] = FIGURE_CACHE_DIR or None, max_bytes: int = FIGURE_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        # Payloads when there is no directory
+        self._memory: Dict[str, str] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, entry.name[: -len(".json")], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+
+    def _file(self, key: str) -> str:
+        return path.join(self.directory, f"{key}.json")
+
+    def key(
+        self,
+        columns: Dict[str, np.ndarray],
+        plot_type: str,
+        x_key: Optional[str],
+        y_key: Optional[str],
+        title: str,
+        note: Optional[str] = None,
+        prebinned: bool = False,
+    ) -> str:
+        """Cache key of a figure, from the same arguments as :func:`figures.build_figure`."""
+        digest = fingerprint(columns)
+        build = [CACHE_VERSION, plotly.__version__, REPORT_TEMPLATE, plot_type.lower()]
+        digest.update(json.dumps(build + [x_key, y_key, title, note, prebinned]).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[FigureSpec]:
+        with self._lock:
+            known = key in self._index
+            if known:
+                self._index.move_to_end(key)
+            payload = self._memory.get(key)
+        if payload is None and self.directory:
+            # Unknown keys are still looked up: another process may have built the figure
+            try:
+                with open(self._file(key), encoding="utf-8") as f:
+                    payload = f.read()
+                # The file's mtime orders entries by last use when the index is reloaded
+                os.utime(self._file(key))
+            except FileNotFoundError:
+                payload = None
+        with self._lock:
+            if payload is None:
+                # Possibly evicted by another process sharing the directory
+                self._bytes -= self._index.pop(key, 0)
+                self.misses += 1
+                return None
+            if not known and key not in self._index:
+                self._index[key] = len(payload.encode("utf-8"))
+                self._bytes += self._index[key]
+            self.hits += 1
+        data = json.loads(payload)
+        return FigureSpec(data["spec"], data["title"], data["plot_type"], data["note"])
+
+    def put(self, key: str, figure: FigureSpec) -> None:
+        payload = json.dumps(
+            {"title": figure.title, "plot_type": figure.plot_type, "note": figure.note, "spec": figure.spec}
+        )
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if self.directory:
+            # Written under a temporary name and renamed, so readers never see a partial file
+            tmp = f"{self._file(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, self._file(key))
+
+        evicted = []
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = size
+            self._bytes += size
+            if not self.directory:
+                self._memory[key] = payload
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                old, old_size = self._index.popitem(last=False)
+                self._bytes -= old_size
+                self._memory.pop(old, None)
+                self.evictions += 1
+                evicted.append(old)
+        for old in evicted:
+            if self.directory:
+                try:
+                    os.remove(self._file(old))
+                except FileNotFoundError:
+                    pass
+
+    def put_when_built(self, key: str, handle: FigureHandle) -> None:
+        """Store the handle's figure once it is built; failed figures are not cached."""
+
+        def store(future):
+            if not future.cancelled() and future.exception() is None:
+                try:
+                    self.put(key, future.result())
+                except OSError:
+                    # A full or read-only cache directory must not fail the report
+                    pass
+
+        handle.future.add_done_callback(store)
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._index)
+            self._index.clear()
+            self._memory.clear()
+            self._bytes = 0
+        for key in keys:
+            if self.directory:
+                try:
+                    os.remove(self._file(key))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._bytes,
+            }
+
+
+_CACHE: Optional[FigureCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_figure_cache() -> FigureCache:
+    """The process-wide figure cache, configured from the environment."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = FigureCache()
+        return _CACHE
@@ -0,0 +1,312 @@
+import html
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+import plotly.offline
+import plotly.utils
+
+# Inline plotly.js into reports (~4.5 MB) so they open without network access
+REPORT_INLINE_PLOTLYJS = os.getenv("REPORT_INLINE_PLOTLYJS", "0").lower() in ("1", "true", "yes")
+
+# The plotly.js release bundled with the installed plotly.py, which writes typed arrays it can read
+PLOTLYJS_VERSION = plotly.offline.get_plotlyjs_version()
+PLOTLYJS_CDN_URL = f"https://cdn.plot.ly/plotly-{PLOTLYJS_VERSION}.min.js"
+
+# Template of every report figure; stored once per report instead of once per figure
+REPORT_TEMPLATE = "plotly_white"
+
+PLOT_TYPES = ("bar", "line", "scatter", "pie", "area", "histogram", "heatmap")
+
+# Processes building figures; 0 builds them in the calling thread
+PLOT_WORKERS = int(os.getenv("PLOT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Figures queued or being built at once; create_plot blocks until a slot frees up
+PLOT_MAX_PENDING = int(os.getenv("PLOT_MAX_PENDING", str(max(PLOT_WORKERS, 1) * 4)))
+# Seconds write_to_html waits for a figure that is still being built
+PLOT_RENDER_TIMEOUT = float(os.getenv("PLOT_RENDER_TIMEOUT", "120"))
+
+# Defines reportRender(id), which renders a figure once its placeholder scrolls near the
+# viewport. It goes in the report head, so each figure can register itself as it is written.
+LAZY_RENDER_SCRIPT = """
+<script>
+var reportRender = (function () {
+    var template = null;
+    function render(div) {
+        if (template === null) {
+            template = JSON.parse(document.getElementById("report-template").textContent);
+        }
+        var spec = JSON.parse(document.getElementById(div.id + "-spec").textContent);
+        spec.layout.template = template;
+        Plotly.newPlot(div, spec.data, spec.layout, {responsive: true});
+    }
+    if (!("IntersectionObserver" in window)) {
+        return function (id) { render(document.getElementById(id)); };
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                render(entry.target);
+            }
+        });
+    }, {rootMargin: "200px"});
+    return function (id) { observer.observe(document.getElementById(id)); };
+})();
+</script>
+"""
+
+
+class FigureSpec:
+    """A figure as a Plotly JSON spec, ready to be embedded in a report.
+
+    Numeric arrays are stored as base64-encoded typed arrays (plotly.py >= 6),
+    which is several times smaller than JSON number lists and parses faster.
+    ``str()`` gives a one-line description, which is what the LLM sees as the
+    tool result instead of the figure itself.
+    """
+
+    def __init__(self, spec: str, title: str, plot_type: str, note: Optional[str] = None):
+        self.spec = spec
+        self.title = title
+        self.plot_type = plot_type
+        self.note = note
+
+    @classmethod
+    def from_figure(cls, fig, title: str, plot_type: str, note: Optional[str] = None) -> "FigureSpec":
+        spec = json.loads(pio.to_json(fig, validate=False, remove_uids=True))
+        # The report supplies REPORT_TEMPLATE to every figure
+        spec.get("layout", {}).pop("template", None)
+        return cls(json.dumps(spec, separators=(",", ":")), title, plot_type, note)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.spec)
+
+    def __str__(self) -> str:
+        text = f"Created {self.plot_type} plot '{self.title}' ({self.nbytes:,} bytes), embedded by write_to_html"
+        return f"{text}; {self.note}" if self.note else text
+
+    __repr__ = __str__
+
+
+def build_figure(
+    columns: Dict[str, np.ndarray],
+    plot_type: str,
+    x_key: Optional[str],
+    y_key: Optional[str],
+    title: str,
+    note: Optional[str] = None,
+    prebinned: bool = False,
+) -> FigureSpec:
+    """Build a Plotly Express figure and serialize it; runs in a :class:`FigureRenderer` worker.
+
+    Args:
+        columns (Dict[str, np.ndarray]): Column arrays to plot, already downsampled
+        plot_type (str): One of :data:`PLOT_TYPES`
+        x_key (str, optional): Column on the x axis (names for pie charts)
+        y_key (str, optional): Column on the y axis (values for pie charts)
+        title (str): Title of the plot
+        note (str, optional): How the data was downsampled, shown as a subtitle
+        prebinned (bool): The data are histogram bins drawn as a bar chart
+
+    Returns:
+        FigureSpec: The serialized figure
+    """
+    # Create appropriate plot based on type
+    fig = None
+
+    if plot_type.lower() == "bar":
+        fig = px.bar(columns, x=x_key, y=y_key, title=title)
+    elif plot_type.lower() == "line":
+        fig = px.line(columns, x=x_key, y=y_key, title=title)
+    elif plot_type.lower() == "scatter":
+        fig = px.scatter(columns, x=x_key, y=y_key, title=title)
+    elif plot_type.lower() == "pie":
+        fig = px.pie(columns, values=y_key, names=x_key, title=title)
+    elif plot_type.lower() == "area":
+        fig = px.area(columns, x=x_key, y=y_key, title=title)
+    elif plot_type.lower() == "histogram":
+        fig = px.histogram(columns, x=y_key, title=title)
+    elif plot_type.lower() == "heatmap":
+        # For heatmap, additional logic might be needed to structure the data properly
+        if len(columns) >= 3:  # Need at least 3 columns for x, y, and value
+            pivot_df = pd.DataFrame(columns).pivot(
+                index=x_key, columns=y_key, values=list(columns)[2]
+            )
+            fig = px.imshow(pivot_df, title=title)
+        else:
+            raise ValueError("Heatmap requires at least 3 columns of data")
+    else:
+        raise ValueError(f"Unsupported plot type: {plot_type}")
+
+    if prebinned:
+        fig.update_layout(bargap=0)
+
+    # Update layout
+    fig.update_layout(
+        title={
+            "text": f"{title}<br><sup>{note}</sup>" if note else title,
+            "y": 0.95,
+            "x": 0.5,
+            "xanchor": "center",
+            "yanchor": "top",
+        },
+        xaxis_title=x_key,
+        yaxis_title=y_key,
+        template=REPORT_TEMPLATE,
+    )
+
+    return FigureSpec.from_figure(fig, title, plot_type, note)
+
+
+class FigureHandle:
+    """A figure being built in the background; :meth:`result` waits for its :class:`FigureSpec`."""
+
+    def __init__(self, future: Future, title: str, plot_type: str, note: Optional[str] = None):
+        self.future = future
+        self.title = title
+        self.plot_type = plot_type
+        self.note = note
+
+    @classmethod
+    def ready(cls, figure: FigureSpec) -> "FigureHandle":
+        """A handle for a figure that is already built."""
+        future: Future = Future()
+        future.set_result(figure)
+        return cls(future, figure.title, figure.plot_type, figure.note)
+
+    def result(self, timeout: Optional[float] = PLOT_RENDER_TIMEOUT) -> FigureSpec:
+        return self.future.result(timeout)
+
+    def __str__(self) -> str:
+        text = f"Created {self.plot_type} plot '{self.title}', embedded by write_to_html"
+        return f"{text}; {self.note}" if self.note else text
+
+    __repr__ = __str__
+
+
+class FigureRenderer:
+    """Builds figures in a process pool, so they neither hold the GIL nor block the event loop.
+
+    At most ``max_pending`` figures are queued or being built; further
+    submissions block the submitting tool thread until one finishes.
+    """
+
+    def __init__(self, workers: int = PLOT_WORKERS, max_pending: int = PLOT_MAX_PENDING):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking the threaded agent process is unsafe; forkserver children start clean
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._executor
+
+    def _reset(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(
+        self,
+        columns: Dict[str, np.ndarray],
+        plot_type: str,
+        x_key: Optional[str],
+        y_key: Optional[str],
+        title: str,
+        note: Optional[str] = None,
+        prebinned: bool = False,
+    ) -> FigureHandle:
+        """Queue a figure for :func:`build_figure`."""
+        args = (columns, plot_type, x_key, y_key, title, note, prebinned)
+        if self.workers <= 0:
+            # Errors are kept on the handle as in the pool, so the report shows them in place of the figure
+            future: Future = Future()
+            try:
+                future.set_result(build_figure(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return FigureHandle(future, title, plot_type, note)
+
+        self._slots.acquire()
+        try:
+            pool = self._pool()
+            try:
+                future = pool.submit(build_figure, *args)
+            except BrokenProcessPool:
+                # A crashed worker breaks the whole pool; start a fresh one once
+                self._reset(pool)
+                future = self._pool().submit(build_figure, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return FigureHandle(future, title, plot_type, note)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_RENDERER: Optional[FigureRenderer] = None
+_RENDERER_LOCK = threading.Lock()
+
+
+def get_figure_renderer() -> FigureRenderer:
+    """The process-wide figure renderer, configured from the environment."""
+    global _RENDERER
+    with _RENDERER_LOCK:
+        if _RENDERER is None:
+            _RENDERER = FigureRenderer()
+        return _RENDERER
+
+
+def plotly_script(inline: bool = REPORT_INLINE_PLOTLYJS) -> str:
+    """The single plotly.js ``<script>`` tag of a report."""
+    if inline:
+        return f'<script type="text/javascript">{plotly.offline.get_plotlyjs()}</script>'
+    return f'<script src="{PLOTLYJS_CDN_URL}" charset="utf-8"></script>'
+
+
+def template_script(template: str = REPORT_TEMPLATE) -> str:
+    """The shared layout template, read by :data:`LAZY_RENDER_SCRIPT`."""
+    spec = json.dumps(pio.templates[template].to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder)
+    spec = spec.replace("</", "<\\/")
+    return f"<script type='application/json' id='report-template'>{spec}</script>"
+
+
+def figure_error_html(title: str, error: BaseException) -> str:
+    """Stand-in for a figure that failed to build, so the rest of the report is still written."""
+    return f"<p class='plot-error'><em>Plot '{html.escape(title)}' could not be rendered: {html.escape(str(error))}</em></p>"
+
+
+def figure_html(figure: FigureSpec, plot_id: str) -> str:
+    """Placeholder div plus the figure's JSON spec, registered with :data:`LAZY_RENDER_SCRIPT`.
+
+    The snippet is self-contained, so figures can be appended to a report one at a time.
+    """
+    # "</" would end the script element early; JSON allows escaping the slash
+    spec = figure.spec.replace("</", "<\\/")
+    return (
+        f"<div id='{plot_id}' class='plotly-graph' "
+        f"aria-label='{html.escape(figure.title, quote=True)}'></div>\n"
+        f"<script type='application/json' id='{plot_id}-spec'>{spec}</script>\n"
+        f"<script>reportRender('{plot_id}');</script>"
+    )
+
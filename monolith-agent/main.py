@@ -1,24 +1,34 @@
 import asyncio
 from datetime import datetime
+import functools
 import logging
-import markdown
 import os
 from os import path
-import re
-import sqlite3
+import sys
+import textwrap
 import traceback
 from typing import Any, List, Optional
 from typing_extensions import Annotated
 
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.messages import TextMessage, ToolCallExecutionEvent
 from autogen_core import CancellationToken
 from autogen_core.tools import FunctionTool
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from dotenv import load_dotenv, find_dotenv
-import pandas as pd
-import plotly.express as px
-import plotly.io as pio
+
+sys.path.append(path.join(path.dirname(__file__), ".."))
+from db_pool import get_pool  # noqa: E402
+from index_advisor import record_query  # noqa: E402
+from query_cache import db_marker, get_query_cache  # noqa: E402
+from query_guard import QueryError, StatementInterrupter, get_query_guard  # noqa: E402
+from aggregate import SUPPORTED_FUNCS, AggregateSpec, aggregate  # noqa: E402
+from downsample import downsample  # noqa: E402
+from figure_cache import get_figure_cache  # noqa: E402
+from figures import PLOT_TYPES, FigureHandle, get_figure_renderer  # noqa: E402
+from results import QueryResult  # noqa: E402
+from schema_summary import summarize_schema  # noqa: E402
+from session import ReportSession  # noqa: E402
 
 
 class CustomFormatter(logging.Formatter):
@@ -60,143 +70,146 @@ load_dotenv(find_dotenv())
 DB_PATH = f"{path.dirname(__file__)}/../analytics.db"
 
 
-RESPONSE_STATE = {
-    "data": [],
-    "plot": [],
-    "aggregate": [],
-    "markdown": [],
-}
-
+def run_sql(query: str, cancellation_token: Optional[CancellationToken] = None) -> QueryResult:
+    """
+    Run SQL on the pooled connection, serving repeated queries from the result cache
 
-def execute_query(query: Annotated[str, "SQL query to execute"]) -> List[dict]:
-    """Execute SQL query and return results as a list of dictionaries"""
+    Queries go through the query guard first: too expensive ones are rejected,
+    expensive ones are sampled or limited, and all run under a time limit.
+    Cancelling ``cancellation_token`` interrupts the running statement.
+    """
+    cache = get_query_cache()
+    guard = get_query_guard()
+    interrupter = StatementInterrupter()
+    if cancellation_token is not None:
+        cancellation_token.add_callback(lambda: interrupter.interrupt("cancelled"))
+    # Recurring queries feed the index advisor, cache hits included
+    record_query(DB_PATH, query)
+    # Taken before the query runs, so a write that lands mid-query makes it stale
+    marker = db_marker(DB_PATH)
+    key = cache.key(DB_PATH, query)
+    with get_pool(DB_PATH).connection() as conn:
+        hit = cache.get(conn, key, query)
+        if hit is not None:
+            columns, cached = hit
+            return cached.renamed(columns, query=query)
+        decision = guard.check(conn, DB_PATH, query)
+        with guard.deadline(conn, interrupter):
+            # The result keeps the SQL as written, so aggregate pushdown never wraps a rewrite
+            result = QueryResult.from_cursor(
+                conn.execute(decision.query), query=query, max_rows=guard.max_rows
+            )
+        result.notes = decision.notes + result.notes
+        result.db_marker = marker
+    cache.put(key, result, len(result.columns), result.nbytes)
+    return result
+
+
+def execute_query(
+    query: Annotated[str, "SQL query to execute"],
+    cancellation_token: Optional[CancellationToken] = None,
+) -> QueryResult:
+    """Execute SQL query and return results as a columnar QueryResult"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(query)
-        columns = [column[0] for column in cursor.description]
-        data = cursor.fetchall()
-        conn.close()
-        # Convert data to list of dictionaries
-        results = [{columns[i]: row[i] for i in range(len(columns))} for row in data]
+        results = run_sql(query, cancellation_token)
         # logger.debug(f"Executed query: {query}")
         # logger.debug(f"Results: {results}")
         # logger.debug("\n\n")
         return results
+    except QueryError as e:
+        # Already structured (rejected, timed out, cancelled); pass it on as is
+        logger.warning(f"Query not completed: {e}")
+        raise
     except Exception as e:
         logger.error(f"Error executing query: {e}")
         raise ValueError(f"Error executing query: {e}")
 
 
-execute_query_tool = FunctionTool(
-    execute_query,
-    name="execute_query",
-    description="Execute SQL query on the SQLite database",
-)
-
-
-def calculate_aggregate(col: str, aggregate_func: str) -> Any:
-    """Calculate aggregate values (sum, average, etc.) for a given list of data"""
-    rows = RESPONSE_STATE["data"][-1]
+def calculate_aggregate(
+    session: ReportSession,
+    aggregations: Annotated[
+        List[AggregateSpec], "List of (column, func) pairs to compute in one call"
+    ],
+    group_by: Annotated[
+        Optional[List[str]], "Optional columns to group the aggregates by"
+    ] = None,
+    cancellation_token: Optional[CancellationToken] = None,
+) -> Any:
+    """Calculate several aggregate values (sum, average, percentiles, etc.), optionally grouped, for the latest query result"""
     try:
-        aggregate_func = aggregate_func.lower()
-        if aggregate_func == "sum":
-            return sum(item[col] for item in rows)
-        elif aggregate_func == "average":
-            return sum(item[col] for item in rows) / len(rows)
-        elif aggregate_func == "min":
-            return min(item[col] for item in rows)
-        elif aggregate_func == "max":
-            return max(item[col] for item in rows)
-        elif aggregate_func == "count":
-            return len(rows)
-        else:
-            raise ValueError(f"Unsupported aggregate function: {aggregate_func}")
+        rows = session.latest_data()
+        executor = functools.partial(run_sql, cancellation_token=cancellation_token)
+        if rows.db_marker is None or rows.db_marker != db_marker(DB_PATH):
+            # Re-running the query on changed data would aggregate other rows than the result holds
+            executor = None
+        return aggregate(rows, aggregations, group_by, executor=executor)
     except Exception as e:
         logger.error(f"Error calculating aggregate: {e}")
         logger.error(traceback.format_exc())
         raise ValueError(f"Error calculating aggregate: {e}")
 
 
-calculate_aggregate_tool = FunctionTool(
-    calculate_aggregate,
-    name="calculate_aggregate",
-    description="Calculate aggregate values for a given data series",
-)
-
-
 def create_plot(
+    session: ReportSession,
     plot_type: str,
     x_key: Optional[str] = None,
     y_key: Optional[str] = None,
     title: str = "Data Visualization",
-) -> dict:
+) -> FigureHandle:
     """
     Create different types of plots based on data characteristics using plotly
 
     Parameters:
-    data: List of dictionaries containing the data to plot
+    session: Report session holding the data to plot
     plot_type: Type of plot (bar, line, scatter, pie, area, histogram)
-    x_key: Dictionary key to use for x-axis values
-    y_key: Dictionary key to use for y-axis values
+    x_key: Column name to use for x-axis values
+    y_key: Column name to use for y-axis values
     title: Title of the plot
 
     Returns:
-    dict: Plotly figure object as JSON-serializable dict
+    FigureHandle: The figure being built in the background, embedded into the report by write_to_html
     """
-    data = RESPONSE_STATE["data"][-1]
     try:
+        data = session.latest_data()
 
-        # Convert list of dicts to DataFrame for easier plotting
-        df = pd.DataFrame(data)
+        # Plotly express takes the column arrays as-is, no per-row conversion
+        df = data.to_dict()
 
         # If keys aren't specified, use the first two columns
-        if x_key is None and len(df.columns) > 0:
-            x_key = df.columns[0]
-
-        if y_key is None and len(df.columns) > 1:
-            y_key = df.columns[1]
-
-        # Create appropriate plot based on type
-        fig = None
-
-        if plot_type.lower() == "bar":
-            fig = px.bar(df, x=x_key, y=y_key, title=title)
-        elif plot_type.lower() == "line":
-            fig = px.line(df, x=x_key, y=y_key, title=title)
-        elif plot_type.lower() == "scatter":
-            fig = px.scatter(df, x=x_key, y=y_key, title=title)
-        elif plot_type.lower() == "pie":
-            fig = px.pie(df, values=y_key, names=x_key, title=title)
-        elif plot_type.lower() == "area":
-            fig = px.area(df, x=x_key, y=y_key, title=title)
-        elif plot_type.lower() == "histogram":
-            fig = px.histogram(df, x=y_key, title=title)
-        elif plot_type.lower() == "heatmap":
-            # For heatmap, additional logic might be needed to structure the data properly
-            if len(df.columns) >= 3:  # Need at least 3 columns for x, y, and value
-                pivot_df = df.pivot(index=x_key, columns=y_key, values=df.columns[2])
-                fig = px.imshow(pivot_df, title=title)
-            else:
-                raise ValueError("Heatmap requires at least 3 columns of data")
-        else:
-            raise ValueError(f"Unsupported plot type: {plot_type}")
+        if x_key is None and len(data.columns) > 0:
+            x_key = data.columns[0]
 
-        # Update layout
-        fig.update_layout(
-            title={
-                "text": title,
-                "y": 0.95,
-                "x": 0.5,
-                "xanchor": "center",
-                "yanchor": "top",
-            },
-            xaxis_title=x_key,
-            yaxis_title=y_key,
-            template="plotly_white",
-        )
+        if y_key is None and len(data.columns) > 1:
+            y_key = data.columns[1]
 
-        return fig.to_html(include_plotlyjs="cdn", full_html=False)
+        # Check the arguments here, so mistakes reach the LLM as this call's error
+        if plot_type.lower() not in PLOT_TYPES:
+            raise ValueError(f"Unsupported plot type: {plot_type}")
+        for key in (x_key, y_key):
+            if key is not None and key not in data:
+                raise KeyError(f"Column '{key}' not found in the latest query result")
+        if plot_type.lower() == "heatmap" and len(data.columns) < 3:
+            raise ValueError("Heatmap requires at least 3 columns of data")
+
+        # Keep the figure size bounded however many rows there are
+        reduced = downsample(df, plot_type, x_key, y_key)
+        df, x_key, y_key = reduced.columns, reduced.x_key, reduced.y_key
+        prebinned = plot_type.lower() == "histogram" and reduced.plot_type == "bar"
+        plot_type = reduced.plot_type
+
+        # The same chart over the same data is served from the figure cache
+        cache = get_figure_cache()
+        cache_key = cache.key(df, plot_type, x_key, y_key, title, reduced.note, prebinned)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return FigureHandle.ready(cached)
+
+        # Figure construction and serialization are CPU-bound, so they run in a worker process
+        handle = get_figure_renderer().submit(
+            df, plot_type, x_key, y_key, title, note=reduced.note, prebinned=prebinned
+        )
+        cache.put_when_built(cache_key, handle)
+        return handle
 
     except Exception as e:
         logger.error(f"Error creating plot: {e}")
@@ -204,14 +217,6 @@ def create_plot(
         raise ValueError(f"Error creating plot: {e}")
 
 
-# Create function tool instance
-create_plot_tool = FunctionTool(
-    create_plot,
-    name="create_plot",
-    description="Create a plotly visualization from a list of dictionaries. Specify x_key and y_key as the dictionary keys to use for plotting.",
-)
-
-
 def create_report_analysis(title: str, sections: list) -> str:
     """
     Generate a markdown report from provided sections
@@ -255,97 +260,24 @@ def create_report_analysis(title: str, sections: list) -> str:
         raise ValueError(f"Error creating report: {e}")
 
 
-def write_to_html(output_file: str = "report.html") -> str:
+def write_to_html(session: ReportSession, output_file: str = "report.html") -> str:
     """
-    Convert markdown report to HTML with plotly visualizations and write to file
+    Finish the HTML report and move it to its final path
+
+    Markdown sections and plots are written to the report as they are produced,
+    so this only waits for plots still being built and closes the document.
 
     Parameters:
-    markdown_content (str): Markdown content with plot data in comments
+    session (ReportSession): Report session whose report is being written
     output_file (str): Path to output HTML file
 
     Returns:
     str: Path to the created HTML file
     """
-    markdown_content = "\n".join(RESPONSE_STATE["markdown"])
+    output_file = session.output_file or output_file
 
     try:
-
-        # HTML template with plotly.js included
-        html_template = """<!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Data Analysis Report</title>
-            <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-            <style>
-                body {{
-                    line-height: 1.6;
-                    max-width: 1000px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    color: #333;
-                }}
-                .plotly-graph {{
-                    width: 100%;
-                    height: 450px;
-                    margin: 20px 0;
-                    border: 1px solid #e0e0e0;
-                    border-radius: 5px;
-                }}
-                h1 {{ color: #2c3e50; margin-top: 0.5em; }}
-                h2 {{ color: #3498db; margin-top: 1em; }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 15px 0;
-                }}
-                th, td {{
-                    text-align: left;
-                    padding: 12px;
-                    border-bottom: 1px solid #ddd;
-                }}
-                th {{ background-color: #f8f8f8; }}
-            </style>
-        </head>
-        <body>
-            <div id="report-s1">
-            {content}
-            </div>
-            <br>
-            <hr>
-            <div id="report-s2">
-            {plot_content}
-            </div>
-        </body>
-        </html>
-        """
-
-        # Convert markdown to HTML (excluding plot comments)
-        html_content = markdown.markdown(
-            re.sub(r"<!-- plot \d+ -->", "", markdown_content),
-            extensions=["tables"],
-        )
-
-        # Extract plot data from comments and create plotting scripts
-        plot_contents = RESPONSE_STATE["plot"]
-        parsed_plot_contents = []
-        for _pid, plot_data in enumerate(plot_contents):
-            plot_id = f"plot_{_pid}"
-            plot_html = f"""
-            <div id='{plot_id}' class='plotly-graph'>{plot_data}</div>
-            """
-            parsed_plot_contents.append(plot_html)
-
-        # Combine HTML content with plot scripts
-        final_html = html_template.format(
-            content=html_content, plot_content="\n".join(parsed_plot_contents)
-        )
-
-        # Write to file
-        file_path = path.join(path.dirname(__file__), output_file)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(final_html)
-
+        session.report.finish(path.join(path.dirname(__file__), output_file))
         return output_file
 
     except Exception as e:
@@ -354,29 +286,50 @@ def write_to_html(output_file: str = "report.html") -> str:
         raise ValueError(f"Error writing to HTML: {e}")
 
 
-create_plot_tool = FunctionTool(
-    create_plot,
-    name="create_plot",
-    description="Create a plotly visualization based on data and plot type",
-)
-
-create_report_analysis_tool = FunctionTool(
-    create_report_analysis,
-    name="create_report",
-    description="Generate a markdown report with sections containing inferences and describing data",
-)
-
-write_to_html_tool = FunctionTool(
-    write_to_html,
-    name="write_to_html",
-    description="Convert markdown report to HTML and add on the interactive visualizations",
-)
+def build_tools(session: ReportSession) -> List[FunctionTool]:
+    """Create the agent tools bound to one report session"""
+
+    def bind(tool_name, func):
+        # The session is bound up front, so it never appears in the tool schema
+        return functools.partial(session.results.recording(tool_name, func), session)
+
+    return [
+        FunctionTool(
+            session.results.recording("execute_query", execute_query),
+            name="execute_query",
+            description="Execute SQL query on the SQLite database",
+        ),
+        FunctionTool(
+            bind("create_plot", create_plot),
+            name="create_plot",
+            description="Create a plotly visualization based on data and plot type",
+        ),
+        FunctionTool(
+            bind("calculate_aggregate", calculate_aggregate),
+            name="calculate_aggregate",
+            description=(
+                "Calculate several aggregate values over the latest query result in one call. "
+                f"Supported functions: {SUPPORTED_FUNCS}. Nulls are ignored. "
+                "Pass group_by to get one row of aggregates per group."
+            ),
+        ),
+        FunctionTool(
+            session.results.recording("create_report", create_report_analysis),
+            name="create_report",
+            description="Generate a markdown report with sections containing inferences and describing data",
+        ),
+        FunctionTool(
+            functools.partial(write_to_html, session),
+            name="write_to_html",
+            description="Convert markdown report to HTML and add on the interactive visualizations",
+        ),
+    ]
 
 
 SYSTEM_MESSAGE = """You are a data analytics dashboard agent capable of:
     - Converting natural language requests into SQL queries and Querying a SQLite database containing sales and marketing data
     - Creating appropriate visualizations using queried data
-    - Calculating aggregate values (sum, average, etc.) for data series which can then be used to make inferences regarding data
+    - Calculating several aggregate values (sum, average, percentiles, stddev, etc.) at once, optionally grouped, which can then be used to make inferences regarding data
     - Generating comprehensive reports with insights
     - Writing the report to an HTML file with embedded visualizations
 
@@ -391,17 +344,16 @@ SYSTEM_MESSAGE = """You are a data analytics dashboard agent capable of:
     7. You write the report to an HTML file (make sure that write_to_html is the last function called).
     9. Terminate the conversation.
 
-    Database schema:
-    - sales(id, date, product_id, customer_id, quantity, unit_price, total_price, (FK) product_id, (FK) customer_id)
-    - products(id, name, category, subcategory, cost, price)
-    - customers(id, name, region, segment, join_date)
-    - marketing(id, campaign, start_date, end_date, spend, channel, target_region, target_segment)
+    Database schema (generated from the live database):
+    {schema}
 
     Additional instructions:
     - Use the tools provided. If you need to use a tool, respond with the tool name and its parameters.
     - Do not provide any false information.
     - If the data from the previous response is needed to call a function, make sure to include it in the next response.
     - Avoid where queries with date ranges when using the execute_query tool since the database is small.
+    - If a query result carries notes (sampled or limited data), mention this in the report and prefer aggregating in SQL.
+    - Prefer the rollup_* tables, when listed in the schema, for totals by period, category, region or segment; they are pre-aggregated and much faster than joining sales.
     - Make sure that write_to_html is the last function called.
     """
 
@@ -450,73 +402,116 @@ SYSTEM_MESSAGE = """You are a data analytics dashboard agent capable of:
 #     await model_client.close()
 
 
-# Main execution function
-async def main():
-    global RESPONSE_STATE
+def build_system_message(task: Optional[str] = None) -> str:
+    """
+    System message with the schema summarized from the live database
 
-    model_client = OpenAIChatCompletionClient(
+    Parameters:
+    task (str): The report task; on large databases only the tables relevant to it are described
+
+    Returns:
+    str: The system message for the report agent
+    """
+    schema = textwrap.indent(summarize_schema(DB_PATH, query=task), "    ").lstrip()
+    return SYSTEM_MESSAGE.format(schema=schema)
+
+
+def create_model_client(model: str = "gpt-4o-mini") -> OpenAIChatCompletionClient:
+    """Create the chat completion client shared by report agents"""
+    return OpenAIChatCompletionClient(
         # model="gemini-2.0-flash",
         # api_key=os.environ["GEMINI_API_KEY"],
-        model="gpt-4o-mini",
+        model=model,
         api_key=os.environ["OPENAI_API_KEY"],
         parallel_tool_calls=False,
     )
+
+
+async def run_report(
+    task: str,
+    model_client: OpenAIChatCompletionClient,
+    session: Optional[ReportSession] = None,
+    max_iterations: int = 8,
+) -> ReportSession:
+    """
+    Run the agent loop for one report task with its own agent and session
+
+    Parameters:
+    task (str): Natural language description of the report to create
+    model_client (OpenAIChatCompletionClient): Model client, may be shared between reports
+    session (ReportSession): Session to collect results in, a new one is created if omitted
+    max_iterations (int): Maximum number of agent turns before giving up
+
+    Returns:
+    ReportSession: The session holding the data, plots and markdown of the report
+    """
+    session = session or ReportSession()
     looped_assistant = AssistantAgent(
         name="LoopedAssistant",
         model_client=model_client,
-        system_message=SYSTEM_MESSAGE,
-        tools=[
-            execute_query_tool,
-            create_plot_tool,
-            calculate_aggregate_tool,
-            create_report_analysis_tool,
-            write_to_html_tool,
-        ],
+        system_message=build_system_message(task),
+        tools=build_tools(session),
     )
 
-    init_message = [
-        TextMessage(
-            content="Create a quarterly sales analysis report with visualizations of \
-                revenue by product category, any other interesting data visualized and recommendations for next quarter.",
-            source="user",
-        )
-    ]
+    init_message = [TextMessage(content=task, source="user")]
     counter = 0
     while True:
-        response = await looped_assistant.on_messages(
-            messages=init_message,
-            cancellation_token=CancellationToken(),
-        )
-        func_name = None
+        cancellation_token = CancellationToken()
+        try:
+            response = await looped_assistant.on_messages(
+                messages=init_message,
+                cancellation_token=cancellation_token,
+            )
+        except asyncio.CancelledError:
+            # Propagate timeouts/cancellation of the report to running tool calls
+            cancellation_token.cancel()
+            session.report.abort("the report run was cancelled or timed out")
+            raise
         for _ in response.inner_messages:
             logger.debug(_.content)
             if isinstance(_.content[0], str):
                 continue
             logger.info(_.content[0].name)
-            func_name = _.content[0].name
+            if isinstance(_, ToolCallExecutionEvent):
+                # Fetch the native results by call ID instead of parsing the tool output
+                for result in _.content:
+                    if result.is_error or result.name == "write_to_html":
+                        continue
+                    session.claim(result.call_id, result.name)
         logger.info(response.chat_message.content + "\n\n")
-        if response.chat_message.type == "ToolCallSummaryMessage":
-            if func_name == "execute_query":
-                RESPONSE_STATE["data"].append(eval(response.chat_message.content))
-            elif func_name == "create_plot":
-                RESPONSE_STATE["plot"].append(response.chat_message.content)
-            elif func_name == "calculate_aggregate":
-                RESPONSE_STATE["aggregate"].append(
-                    eval(response.chat_message.content)
-                )
-            elif func_name == "create_report":
-                RESPONSE_STATE["markdown"].append(response.chat_message.content)
 
         if isinstance(response.chat_message, TextMessage):
             if response.chat_message.source == "LoopedAssistant":
-                logger.warning("Reached the end of the conversation.")
+                logger.warning(
+                    f"[{session.session_id}] Reached the end of the conversation."
+                )
                 break
 
         counter += 1
-        if counter > 8:
+        if counter > max_iterations:
             break
 
-    await model_client.close()
+    if not session.report.finished:
+        # Keep what was written so far readable even though write_to_html was never called
+        session.report.abort("the agent stopped before writing the report")
+    return session
+
+
+# Main execution function
+async def main():
+    get_pool(DB_PATH).warm_up()
+
+    model_client = create_model_client()
+    try:
+        await run_report(
+            "Create a quarterly sales analysis report with visualizations of \
+                revenue by product category, any other interesting data visualized and recommendations for next quarter.",
+            model_client,
+        )
+    finally:
+        await model_client.close()
+        # Waits for the figure worker processes to exit
+        get_figure_renderer().shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+import html
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, TextIO
+
+import markdown
+
+from figures import (
+    LAZY_RENDER_SCRIPT,
+    PLOT_RENDER_TIMEOUT,
+    FigureHandle,
+    figure_error_html,
+    figure_html,
+    plotly_script,
+    template_script,
+)
+
+logger = logging.getLogger(__name__)
+
+PLOT_COMMENT_RE = re.compile(r"<!-- plot \d+ -->")
+
+# Flex order of the first figure, after the sections (1) and the divider (2)
+FIGURE_ORDER = 3
+
+# Everything before the first section. Content is appended in arrival order;
+# the flex ``order`` keeps the text above the divider and the figures below it,
+# in the order they were created rather than built.
+REPORT_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Data Analysis Report</title>
+    {plotly_script}
+    {template_script}
+    {lazy_render_script}
+    <style>
+        body {{
+            line-height: 1.6;
+            max-width: 1000px;
+            margin: 0 auto;
+            padding: 20px;
+            color: #333;
+        }}
+        #report {{ display: flex; flex-direction: column; }}
+        .report-section {{ order: 1; }}
+        .report-divider {{ order: 2; }}
+        .report-incomplete {{ order: 0; color: #c0392b; }}
+        .plotly-graph {{
+            width: 100%;
+            height: 450px;
+            margin: 20px 0;
+            border: 1px solid #e0e0e0;
+            border-radius: 5px;
+        }}
+        h1 {{ color: #2c3e50; margin-top: 0.5em; }}
+        h2 {{ color: #3498db; margin-top: 1em; }}
+        table {{
+            border-collapse: collapse;
+            width: 100%;
+            margin: 15px 0;
+        }}
+        th, td {{
+            text-align: left;
+            padding: 12px;
+            border-bottom: 1px solid #ddd;
+        }}
+        th {{ background-color: #f8f8f8; }}
+    </style>
+</head>
+<body>
+<main id="report">
+<div class="report-divider"><br><hr></div>
+"""
+
+REPORT_FOOT = """</main>
+</body>
+</html>
+"""
+
+
+class ReportWriter:
+    """HTML report written to disk piece by piece while a session runs.
+
+    Markdown sections are converted and appended as soon as they are produced,
+    and figures as soon as they are built, each flushed right away. Only the
+    piece being written is held in memory, and whatever was produced before a
+    crash or timeout is already on disk as a readable report: every figure
+    snippet registers its own rendering, so nothing depends on a closing
+    script. :meth:`finish` adds the closing tags.
+
+    The file is created on the first write. Content produced after
+    :meth:`finish` is appended after the closing tags, where browsers still
+    show it; content produced after :meth:`abort` is dropped.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.finished = False
+        self.aborted = False
+        self.sections = 0
+        self.figures = 0
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+        self._started = False
+        # Figures announced but not yet written, by creation index
+        self._pending: Dict[int, FigureHandle] = {}
+
+    def _write(self, text: str) -> None:
+        """Append ``text`` and flush; the caller holds the lock."""
+        if self.aborted:
+            return
+        if self._file is None:
+            if not self._started:
+                self._file = open(self.file_path, "w", encoding="utf-8")
+                self._file.write(
+                    REPORT_HEAD.format(
+                        plotly_script=plotly_script(),
+                        template_script=template_script(),
+                        lazy_render_script=LAZY_RENDER_SCRIPT,
+                    )
+                )
+                self._started = True
+            else:
+                self._file = open(self.file_path, "a", encoding="utf-8")
+        self._file.write(text)
+        self._file.flush()
+
+    def add_markdown(self, text: str) -> None:
+        """Convert a markdown report section and append it."""
+        body = markdown.markdown(PLOT_COMMENT_RE.sub("", text), extensions=["tables"])
+        with self._lock:
+            self._write(f"<section class='report-section'>\n{body}\n</section>\n")
+            self.sections += 1
+
+    def add_figure(self, handle: FigureHandle) -> None:
+        """Append a figure once it is built, from whichever thread completes it."""
+        with self._lock:
+            index = self.figures
+            self.figures += 1
+            self._pending[index] = handle
+        handle.future.add_done_callback(lambda _: self._write_figure(index))
+
+    def _write_figure(self, index: int, error: Optional[BaseException] = None) -> None:
+        # Popped and written under one hold of the lock: finish() takes it to write the
+        # closing tags, so a figure it no longer sees as pending is already in the file
+        with self._lock:
+            handle = self._pending.pop(index, None)
+            if handle is None:
+                # Already written by the other of finish() and the done callback
+                return
+            if error is None:
+                try:
+                    chunk = figure_html(handle.result(timeout=0), f"plot_{index}")
+                except Exception as e:
+                    error = e
+            if error is not None:
+                logger.error(f"Error rendering plot '{handle.title}': {error}")
+                chunk = figure_error_html(handle.title, error)
+            # Written when built; the order style places it by creation
+            self._write(f"<div class='report-figure' style='order: {FIGURE_ORDER + index}'>\n{chunk}\n</div>\n")
+
+    def finish(self, file_path: Optional[str] = None, timeout: float = PLOT_RENDER_TIMEOUT) -> str:
+        """Wait for figures still being built, close the report and move it to ``file_path``.
+
+        Returns:
+            str: Path of the finished report
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            pending = list(self._pending.items())
+        for index, handle in pending:
+            try:
+                handle.future.exception(max(deadline - time.monotonic(), 0))
+            except Exception:
+                pass
+            if handle.future.done():
+                self._write_figure(index)
+            else:
+                self._write_figure(index, TimeoutError(f"not built within {timeout:.0f}s"))
+
+        # Done callbacks still writing hold the lock, so the closing tags go after their figures
+        with self._lock:
+            if not self.finished:
+                self._write(REPORT_FOOT)
+                self.finished = True
+            self._close()
+            if file_path and os.path.abspath(file_path) != os.path.abspath(self.file_path):
+                os.replace(self.file_path, file_path)
+                self.file_path = file_path
+        return self.file_path
+
+    def abort(self, reason: str) -> None:
+        """Close an unfinished report, marking it as incomplete."""
+        with self._lock:
+            if self.finished or self.aborted:
+                return
+            if self._started:
+                self._write(
+                    "<p class='report-incomplete'><strong>Incomplete report:</strong> "
+                    f"{html.escape(reason)}</p>\n"
+                )
+                self._write(REPORT_FOOT)
+            self.aborted = True
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
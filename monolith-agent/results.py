@@ -0,0 +1,212 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from result_stream import (
+    FETCH_BATCH_SIZE,
+    PREVIEW_MAX_BYTES,
+    PREVIEW_MAX_ROWS,
+    ResultSummary,
+    concat_arrays,
+    iter_batches,
+    take_preview,
+    to_array,
+)
+
+# Rows are materialised for the LLM in chunks of this size, never all at once
+ROW_CHUNK_SIZE = 1024
+
+
+def _unique_names(columns: List[str]) -> List[str]:
+    # Joins like "SELECT s.id, p.id" repeat names; suffix them so no column is lost
+    seen = {}
+    names = []
+    for name in columns:
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def _to_python(array: np.ndarray) -> list:
+    values = array.tolist()
+    if array.dtype.kind == "f" and np.isnan(array).any():
+        values = [None if v != v else v for v in values]
+    return values
+
+
+def python_scalar(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        value = value.item()
+    return None if isinstance(value, float) and value != value else value
+
+
+class QueryResult:
+    """Column-oriented result of a SQL query.
+
+    Each column is held as a single NumPy array, so plotting and aggregation
+    work on the arrays directly. Row dictionaries are only built lazily when
+    something iterates the result or when it is rendered as text for the LLM.
+    """
+
+    def __init__(
+        self, columns: List[str], arrays: List[np.ndarray], query: Optional[str] = None
+    ):
+        if len(columns) != len(arrays):
+            raise ValueError("Number of column names and arrays must match")
+        # SQL that produced this result, if any; used for aggregate pushdown
+        self.query = query
+        self.columns = _unique_names(columns)
+        # False when duplicate names had to be suffixed, i.e. the names differ from the SQL's
+        self.has_sql_names = self.columns == list(columns)
+        self._arrays = dict(zip(self.columns, arrays))
+        self._num_rows = len(arrays[0]) if arrays else 0
+        # Caveats shown to the LLM with the data, e.g. that the query was sampled
+        self.notes: List[str] = []
+        # query_cache.db_marker of the database when the rows were read, if known
+        self.db_marker: Optional[tuple] = None
+
+    @classmethod
+    def from_cursor(
+        cls,
+        cursor,
+        query: Optional[str] = None,
+        batch_size: int = FETCH_BATCH_SIZE,
+        max_rows: Optional[int] = None,
+    ) -> "QueryResult":
+        """Build a result from an executed sqlite3 cursor.
+
+        Rows are fetched in ``fetchmany`` batches and packed into column arrays
+        batch by batch, so the full list of row tuples never exists at once.
+        Unlike the preview, plots and aggregates need every row, so the arrays
+        hold the whole result: ``max_rows`` bounds it, cutting off larger
+        results with a note.
+        """
+        columns = [column[0] for column in cursor.description]
+        parts: List[List[np.ndarray]] = [[] for _ in columns]
+        fetched, truncated = 0, False
+        for rows in iter_batches(cursor, batch_size):
+            if max_rows is not None and fetched + len(rows) > max_rows:
+                rows = rows[: max_rows - fetched]
+                truncated = True
+            fetched += len(rows)
+            for column_parts, values in zip(parts, zip(*rows)):
+                column_parts.append(to_array(values))
+            if truncated:
+                break
+        if not parts or not parts[0]:
+            result = cls.from_rows(columns, [], query=query)
+        else:
+            result = cls(columns, [concat_arrays(p) for p in parts], query=query)
+        if truncated:
+            result.notes.append(f"Truncated to the first {max_rows:,} rows; add filters or aggregate in SQL.")
+        return result
+
+    @classmethod
+    def from_rows(
+        cls,
+        columns: List[str],
+        rows: Sequence[Sequence[Any]],
+        query: Optional[str] = None,
+    ) -> "QueryResult":
+        """Build a result from row tuples, transposing them into columns in one pass."""
+        if rows:
+            arrays = [to_array(values) for values in zip(*rows)]
+        else:
+            arrays = [np.empty(0, dtype=object) for _ in columns]
+        return cls(columns, arrays, query=query)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "QueryResult":
+        """Build a result from a DataFrame, reusing its column arrays."""
+        columns = [str(c) for c in df.columns]
+        return cls(columns, [df[c].to_numpy() for c in df.columns])
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> "QueryResult":
+        """Build a result from a list of dictionaries (the legacy row format)."""
+        columns = list(records[0].keys()) if records else []
+        return cls.from_rows(columns, [tuple(r[c] for c in columns) for r in records])
+
+    def renamed(self, columns: List[str], query: Optional[str] = None) -> "QueryResult":
+        """A result sharing this one's arrays under new column names (no copy)."""
+        result = QueryResult(columns, [self._arrays[c] for c in self.columns], query=query)
+        result.notes = list(self.notes)
+        result.db_marker = self.db_marker
+        return result
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._arrays
+
+    def __getitem__(self, key):
+        """``result["col"]`` returns a column array, ``result[i]`` a row dictionary."""
+        if isinstance(key, str):
+            try:
+                return self._arrays[key]
+            except KeyError:
+                raise KeyError(f"Column '{key}' not found in query result")
+        return {c: python_scalar(self._arrays[c][key]) for c in self.columns}
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.rows()
+
+    def rows(self, limit: Optional[int] = None) -> Iterator[dict]:
+        """Lazily yield rows as dictionaries of plain Python values (NaN -> None)."""
+        n = self._num_rows if limit is None else min(limit, self._num_rows)
+        arrays = [self._arrays[c] for c in self.columns]
+        for start in range(0, n, ROW_CHUNK_SIZE):
+            stop = min(start + ROW_CHUNK_SIZE, n)
+            chunk = [_to_python(a[start:stop]) for a in arrays]
+            for values in zip(*chunk):
+                yield dict(zip(self.columns, values))
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """Column name -> array mapping, accepted directly by plotly express."""
+        return dict(self._arrays)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self._arrays, columns=self.columns, copy=False)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self._arrays.values())
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-column count, nulls, range and mean or most common values."""
+        summary = ResultSummary(self.columns)
+        summary.update_arrays([self._arrays[c] for c in self.columns])
+        return summary.to_dict()
+
+    def preview(
+        self, max_rows: int = PREVIEW_MAX_ROWS, max_bytes: int = PREVIEW_MAX_BYTES
+    ) -> Any:
+        """What the LLM gets to see of this result.
+
+        Results within the row and byte budget are the legacy list of row
+        dictionaries. Larger ones become the leading rows that fit, the total
+        row count and summary statistics over all rows.
+        """
+        rows, truncated = take_preview(self.rows(max_rows + 1), max_rows, max_bytes)
+        if not truncated:
+            return {"rows": rows, "notes": self.notes} if self.notes else rows
+        preview = {
+            "total_rows": self._num_rows,
+            "shown_rows": len(rows),
+            "rows": rows,
+            "summary": self.summary(),
+            "note": "Only the first rows are shown; plots and aggregates use all rows.",
+        }
+        if self.notes:
+            preview["notes"] = self.notes
+        return preview
+
+    def __repr__(self) -> str:
+        return repr(self.preview())
+
+    __str__ = __repr__
@@ -0,0 +1,179 @@
+"""Run many report tasks concurrently.
+
+Each line of the tasks file is a JSON object::
+
+    {"id": "q3-sales", "task": "Create a quarterly sales report ...", "timeout": 300}
+
+``id`` and ``timeout`` are optional. Every task gets its own agent and
+session and writes ``<output-dir>/<id>.html``.
+
+Usage::
+
+    python runner.py tasks.jsonl --concurrency 8 --timeout 600 --output-dir reports
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from os import path
+import re
+import time
+from typing import Any, Dict, List
+
+from figures import get_figure_renderer
+from main import DB_PATH, create_model_client, get_pool, logger, run_report
+from query_cache import get_query_cache
+from session import ReportSession
+
+# Task IDs name the report file, so they must stay a plain file name inside the output directory
+TASK_ID_RE = re.compile(r"[\w.-]+")
+
+
+def load_tasks(tasks_file: str) -> List[Dict[str, Any]]:
+    """Read report tasks from a JSONL file, assigning IDs to tasks without one"""
+    tasks = []
+    seen = {}
+    with open(tasks_file, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                task = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_no} of {tasks_file}: {e}")
+            if not task.get("task"):
+                raise ValueError(f"Missing 'task' on line {line_no} of {tasks_file}")
+            task_id = str(task.setdefault("id", f"report_{line_no}"))
+            if not TASK_ID_RE.fullmatch(task_id) or not task_id.strip("."):
+                raise ValueError(
+                    f"Invalid id {task_id!r} on line {line_no} of {tasks_file}: "
+                    "use letters, digits, '_', '-' and '.' only"
+                )
+            if task_id in seen:
+                # Both tasks would write the same report file
+                raise ValueError(
+                    f"Duplicate id {task_id!r} on lines {seen[task_id]} and {line_no} of {tasks_file}"
+                )
+            seen[task_id] = line_no
+            task["id"] = task_id
+            tasks.append(task)
+    return tasks
+
+
+async def run_task(
+    task: Dict[str, Any],
+    model_client,
+    semaphore: asyncio.Semaphore,
+    output_dir: str,
+    timeout: float,
+    max_iterations: int,
+) -> Dict[str, Any]:
+    """Run one report task under the concurrency limit and its own timeout"""
+    output_file = path.abspath(path.join(output_dir, f"{task['id']}.html"))
+    session = ReportSession(session_id=task["id"], output_file=output_file)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                run_report(task["task"], model_client, session, max_iterations),
+                timeout=task.get("timeout", timeout),
+            )
+            status = "ok" if session.report.finished else "no_report"
+            error = None
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"Timed out after {task.get('timeout', timeout)}s"
+        except Exception as e:
+            status, error = "error", str(e)
+        elapsed = time.perf_counter() - start
+        # Whatever was written before a timeout or error stays on disk as a partial report
+        session.report.abort(error or "the agent stopped before writing the report")
+
+    if error:
+        logger.error(f"[{task['id']}] {status}: {error}")
+    else:
+        logger.info(f"[{task['id']}] {status} in {elapsed:.1f}s")
+    return {
+        "id": task["id"],
+        "status": status,
+        "output_file": output_file if path.exists(output_file) else None,
+        "error": error,
+        "elapsed": round(elapsed, 3),
+    }
+
+
+async def run_batch(
+    tasks: List[Dict[str, Any]],
+    concurrency: int = 4,
+    timeout: float = 600.0,
+    output_dir: str = "reports",
+    max_iterations: int = 8,
+    model: str = "gpt-4o-mini",
+) -> List[Dict[str, Any]]:
+    """
+    Run report tasks concurrently
+
+    Parameters:
+    tasks (list): Tasks as loaded by load_tasks
+    concurrency (int): Maximum number of reports running at once
+    timeout (float): Default per-task timeout in seconds
+    output_dir (str): Directory the HTML reports are written to
+    max_iterations (int): Maximum agent turns per report
+    model (str): Model used by every report agent
+
+    Returns:
+    list: One status dictionary per task, in input order
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    os.makedirs(output_dir, exist_ok=True)
+    get_pool(DB_PATH, size=max(4, concurrency)).warm_up()
+
+    model_client = create_model_client(model)
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(
+            *[
+                run_task(task, model_client, semaphore, output_dir, timeout, max_iterations)
+                for task in tasks
+            ]
+        )
+    finally:
+        await model_client.close()
+        # Waits for the figure worker processes to exit
+        get_figure_renderer().shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run report tasks concurrently")
+    parser.add_argument("tasks_file", help="JSONL file with one report task per line")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-task timeout in seconds")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--max-iterations", type=int, default=8)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--summary", help="Optional path to write the per-task status as JSON")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    results = await run_batch(
+        load_tasks(args.tasks_file),
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        output_dir=args.output_dir,
+        max_iterations=args.max_iterations,
+        model=args.model,
+    )
+    ok = sum(r["status"] == "ok" for r in results)
+    logger.info(f"Finished {len(results)} reports: {ok} ok, {len(results) - ok} failed")
+    logger.info(f"Query cache: {get_query_cache().stats()}")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
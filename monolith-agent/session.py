@@ -0,0 +1,83 @@
+import uuid
+from collections import OrderedDict
+from os import path
+from typing import Any, List, Optional
+
+from report_writer import ReportWriter
+from results import QueryResult
+from store import ResultStore
+
+
+class ReportSession:
+    """State of one report run, passed to the tools instead of a module global.
+
+    Query results are kept as a bounded history: once more than
+    ``max_datasets`` are held, the least recently used dataset is evicted. The
+    newest dataset is never evicted, so ``latest_data`` is always available.
+    Plots and markdown sections go straight to the report writer, which
+    appends them to the HTML file as they are produced; aggregates are kept.
+    """
+
+    def __init__(
+        self,
+        session_id: Optional[str] = None,
+        max_datasets: int = 8,
+        output_file: Optional[str] = None,
+    ):
+        if max_datasets < 1:
+            raise ValueError("max_datasets must be at least 1")
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.max_datasets = max_datasets
+        # When set, the report is always written here regardless of what the LLM asks for
+        self.output_file = output_file
+        # Eviction is driven by the dataset history below, not by the store itself
+        self.results = ResultStore(max_results=None)
+
+        self._datasets: "OrderedDict[str, None]" = OrderedDict()
+        self._latest_data_key: Optional[str] = None
+        self.aggregates: List[Any] = []
+        # Written under a working name until write_to_html moves it to the requested path
+        self.report = ReportWriter(
+            output_file or path.join(path.dirname(__file__), f"report_{self.session_id}.partial.html")
+        )
+
+    def claim(self, call_id: str, tool_name: str) -> Any:
+        """Fetch the native result of a finished tool call and file it in the session."""
+        key = self.results.claim(call_id, tool_name)
+        value = self.results.get(key)
+        if tool_name == "execute_query":
+            self._add_dataset(key)
+            return value
+
+        if tool_name == "create_plot":
+            self.report.add_figure(value)
+        elif tool_name == "calculate_aggregate":
+            self.aggregates.append(value)
+        elif tool_name == "create_report":
+            self.report.add_markdown(value)
+        self.results.discard(key)
+        return value
+
+    def _add_dataset(self, key: str) -> None:
+        self._datasets[key] = None
+        self._latest_data_key = key
+        while len(self._datasets) > self.max_datasets:
+            evicted, _ = self._datasets.popitem(last=False)
+            self.results.discard(evicted)
+
+    def latest_data(self) -> QueryResult:
+        """The most recently produced query result."""
+        if self._latest_data_key is None:
+            raise ValueError("No query result available, call execute_query first")
+        return self.get_data(self._latest_data_key)
+
+    def get_data(self, key: str) -> QueryResult:
+        """A query result by tool-call ID, marking it as recently used."""
+        if key not in self._datasets:
+            raise KeyError(f"No query result for call '{key}' (it may have been evicted)")
+        self._datasets.move_to_end(key)
+        return self.results.get(key)
+
+    @property
+    def dataset_ids(self) -> List[str]:
+        return list(self._datasets)
@@ -0,0 +1,83 @@
+import functools
+import itertools
+import threading
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class ResultStore:
+    """Native tool results, keyed by the tool-call ID that produced them.
+
+    Tools wrapped with :meth:`recording` push their return value into a pending
+    queue for their tool name. When the agent loop sees the matching
+    ``FunctionExecutionResult`` it calls :meth:`claim` to bind that value to the
+    call ID, so the loop gets the original object back by reference instead of
+    re-parsing the string the LLM was shown.
+
+    Pending values are matched to call IDs in completion order per tool name,
+    which is exact as long as the model client runs with
+    ``parallel_tool_calls=False``.
+
+    Claimed results are kept in LRU order; once more than ``max_results`` are
+    held, the least recently used ones are dropped.
+    """
+
+    def __init__(self, max_results: Optional[int] = 64):
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Deque[Any]] = defaultdict(deque)
+        self._results: "OrderedDict[str, Any]" = OrderedDict()
+        self._anonymous_ids = itertools.count()
+
+    def record(self, tool_name: str, value: Any) -> None:
+        """Queue the native result of one ``tool_name`` call until it is claimed."""
+        with self._lock:
+            self._pending[tool_name].append(value)
+
+    def claim(self, call_id: str, tool_name: str) -> str:
+        """Bind the oldest pending ``tool_name`` result to ``call_id``.
+
+        Returns:
+            str: The key the result is stored under (``call_id`` unless it was empty)
+
+        Raises:
+            KeyError: If the tool has no pending result
+        """
+        with self._lock:
+            pending = self._pending.get(tool_name)
+            if not pending:
+                raise KeyError(f"No pending result for tool '{tool_name}'")
+            value = pending.popleft()
+            # Some model providers leave call IDs empty
+            key = call_id or f"{tool_name}:{next(self._anonymous_ids)}"
+            self._results[key] = value
+            self._results.move_to_end(key)
+            if self.max_results is not None:
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+            return key
+
+    def get(self, call_id: str) -> Any:
+        with self._lock:
+            value = self._results[call_id]
+            self._results.move_to_end(call_id)
+            return value
+
+    def discard(self, call_id: str) -> None:
+        with self._lock:
+            self._results.pop(call_id, None)
+
+    def __contains__(self, call_id: str) -> bool:
+        with self._lock:
+            return call_id in self._results
+
+    def recording(self, tool_name: str, func: Callable) -> Callable:
+        """Wrap a tool function so every successful return value is recorded."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            value = func(*args, **kwargs)
+            self.record(tool_name, value)
+            return value
+
+        return wrapper
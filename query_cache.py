@@ -0,0 +1,269 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from os import path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<space>\s+)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    | (?P<op><>|!=|<=|>=|==|\|\||.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Words that can follow a table name in FROM/JOIN and are therefore never an alias
+CLAUSE_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross",
+    "natural", "on", "using", "group", "order", "limit", "offset", "union",
+    "except", "intersect", "having", "window", "indexed", "not", "select",
+}
+
+# Functions and literals whose result changes between calls; queries using them are not cached
+NONDETERMINISTIC = {
+    "random", "randomblob", "current_date", "current_time", "current_timestamp",
+    "changes", "total_changes", "last_insert_rowid", "'now'",
+}
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+def tokenize(query: str) -> List[Token]:
+    """Split SQL into significant tokens, dropping whitespace and comments."""
+    return [
+        Token(m.lastgroup, m.group(), m.start(), m.end())
+        for m in TOKEN_RE.finditer(query)
+        if m.lastgroup not in ("space", "comment")
+    ]
+
+
+def _strip_semicolons(tokens: List[Token]) -> List[Token]:
+    while tokens and tokens[-1].text == ";":
+        tokens = tokens[:-1]
+    return tokens
+
+
+def normalize_sql(query: str) -> Optional[str]:
+    """Canonical form of a read-only query, or None if it must not be cached.
+
+    Whitespace, comments, keyword/identifier case, the optional ``AS`` keyword
+    and table alias names are normalized away, so trivially different
+    spellings of the same query share one cache entry. Only single
+    SELECT/WITH statements without nondeterministic functions are cacheable.
+    """
+    tokens = _strip_semicolons(tokenize(query))
+    if not tokens or tokens[0].text.lower() not in ("select", "with"):
+        return None
+    if any(t.text == ";" for t in tokens):
+        return None
+
+    words = []
+    for t in tokens:
+        # SQLite identifiers are case-insensitive; string literals are not
+        text = t.text.lower() if t.kind == "word" else t.text
+        if text in NONDETERMINISTIC or (t.kind == "string" and text.lower() == "'now'"):
+            return None
+        words.append(text)
+
+    # Drop optional AS (column aliases, table aliases, CTE definitions)
+    kinds = [t.kind for t in tokens]
+    keep = [i for i, w in enumerate(words) if not (kinds[i] == "word" and w == "as")]
+    words = [words[i] for i in keep]
+    kinds = [kinds[i] for i in keep]
+
+    # Rename table aliases in order of appearance: FROM sales s / FROM sales x -> _t1
+    aliases: Dict[str, str] = {}
+    definitions = set()
+    in_from = False
+    for i, w in enumerate(words):
+        if kinds[i] == "word" and w in ("from", "join"):
+            in_from = True
+            table_at = i + 1
+        elif w == "," and in_from:
+            table_at = i + 1
+        elif kinds[i] == "word" and w in CLAUSE_KEYWORDS:
+            in_from = w in ("join", "inner", "left", "right", "full", "outer", "cross", "natural")
+            continue
+        else:
+            continue
+        alias_at = table_at + 1
+        if (
+            table_at < len(words)
+            and kinds[table_at] in ("word", "quoted")
+            and alias_at < len(words)
+            and kinds[alias_at] == "word"
+            and words[alias_at] not in CLAUSE_KEYWORDS
+            and (alias_at + 1 >= len(words) or words[alias_at + 1] != ".")
+        ):
+            aliases.setdefault(words[alias_at], f"_t{len(aliases) + 1}")
+            definitions.add(alias_at)
+
+    def is_qualifier(i: int) -> bool:
+        return kinds[i] == "word" and i + 1 < len(words) and words[i + 1] == "."
+
+    # An alias that is never used as a qualifier is dropped altogether
+    used = {w for i, w in enumerate(words) if is_qualifier(i) and w in aliases}
+    out = []
+    for i, w in enumerate(words):
+        if i in definitions:
+            if w not in used:
+                continue
+            w = aliases[w]
+        elif w in aliases and is_qualifier(i):
+            w = aliases[w]
+        out.append(w)
+    return " ".join(out)
+
+
+def strip_statement(query: str) -> str:
+    """The query without leading/trailing comments and trailing semicolons."""
+    tokens = _strip_semicolons(tokenize(query))
+    if not tokens:
+        return ""
+    return query[tokens[0].start : tokens[-1].end]
+
+
+def probe_columns(conn: sqlite3.Connection, query: str) -> List[str]:
+    """Output column names of ``query`` without running it.
+
+    ``LIMIT 0`` on the wrapping select lets SQLite skip evaluation entirely,
+    so this costs a statement prepare. Unaliased expressions are named after
+    their exact spelling, which is why a cache hit re-reads the names.
+    """
+    cursor = conn.execute(f"SELECT * FROM (\n{strip_statement(query)}\n) LIMIT 0")
+    return [column[0] for column in cursor.description]
+
+
+def db_marker(db_path: str) -> Tuple[int, ...]:
+    """Change marker of a database file: mtime and size of the file and its WAL.
+
+    ``PRAGMA data_version`` is only meaningful per connection, so it cannot be
+    compared across pooled connections; the file stats change on every commit.
+    """
+    marker = []
+    for p in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(p)
+            marker.extend((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            marker.extend((0, 0))
+    return tuple(marker)
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    num_columns: int
+    nbytes: int
+
+
+class QueryCache:
+    """Size-bounded LRU cache of query results keyed on normalized SQL.
+
+    Keys combine the database path, its change marker and the normalized SQL,
+    so any write to the database invalidates every entry for it.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: Optional[int] = 512 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+
+    def key(self, db_path: str, query: str) -> Optional[tuple]:
+        """Cache key for ``query``, or None if the query is not cacheable.
+
+        Compute the key before executing the query, so a write that lands
+        mid-query leaves the entry under the old marker where it is never hit.
+        """
+        normalized = normalize_sql(query)
+        if normalized is None:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        db_path = path.abspath(db_path)
+        return (db_path, db_marker(db_path), normalized)
+
+    def get(
+        self, conn: sqlite3.Connection, key: Optional[tuple], query: str
+    ) -> Optional[Tuple[List[str], Any]]:
+        """Look up a cached result.
+
+        Returns:
+            Optional[Tuple[List[str], Any]]: The output column names of ``query``
+            as written and the cached value, or None on a miss
+        """
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            try:
+                columns = probe_columns(conn, query)
+            except sqlite3.Error:
+                columns = None
+            if columns is not None and len(columns) == entry.num_columns:
+                with self._lock:
+                    self.hits += 1
+                return columns, entry.value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: Optional[tuple], value: Any, num_columns: int, nbytes: int = 0) -> None:
+        if key is None or (self.max_bytes is not None and nbytes > self.max_bytes):
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = CacheEntry(value, num_columns, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_CACHE = QueryCache()
+
+
+def get_query_cache() -> QueryCache:
+    """The process-wide query result cache."""
+    return _CACHE
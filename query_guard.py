@@ -0,0 +1,419 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from query_cache import CLAUSE_KEYWORDS, strip_statement, tokenize
+from schema_summary import get_table_stats
+
+# Estimated row visits above which a query is sampled, and above which it is rejected
+SAMPLE_COST = float(os.getenv("QUERY_SAMPLE_COST", "5e6"))
+MAX_COST = float(os.getenv("QUERY_MAX_COST", "5e7"))
+
+# Queries estimated to return more rows than this get a LIMIT
+MAX_RESULT_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100000"))
+
+# Wall-clock limit per query, in seconds; the statement is interrupted when it passes
+TIME_LIMIT = float(os.getenv("QUERY_TIME_LIMIT", "30"))
+
+# Sampling keeps at least one row in this many; anything sparser is rejected instead
+MAX_SAMPLE_FACTOR = 1000
+
+# Rows assumed for an indexed equality lookup and for unknown tables (SQLite uses similar guesses)
+SEARCH_ROWS = 10
+UNKNOWN_ROWS = 1000
+
+# SQLite VM instructions between checks of the interrupt flag while a statement runs
+PROGRESS_INTERVAL = 1000
+
+# A top-level call of one of these bounds the number of output rows, so no LIMIT is needed
+AGGREGATE_FUNCS = {"count", "sum", "avg", "min", "max", "total", "group_concat"}
+
+
+class QueryError(ValueError):
+    """A query that was not run to completion, reported to the agent as structured data.
+
+    ``str()`` gives JSON, so the error reaches the model intact through tool
+    frameworks that turn exceptions into text.
+    """
+
+    error_type = "error"
+    # Whether running the same query again can succeed
+    retryable = False
+
+    def __init__(self, message: str, elapsed: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.elapsed = elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "error_type": self.error_type,
+            "error": self.message,
+            "retryable": self.retryable,
+        }
+        if self.elapsed is not None:
+            out["elapsed"] = round(self.elapsed, 3)
+        return out
+
+    def __str__(self) -> str:
+        return json.dumps(self.to_dict())
+
+
+class QueryRejected(QueryError):
+    """The query was estimated to be too expensive to run."""
+
+    error_type = "rejected"
+
+
+class QueryTimeout(QueryError):
+    """The query ran past its time limit and was interrupted."""
+
+    error_type = "timeout"
+
+
+class QueryCancelled(QueryError):
+    """The query was interrupted because its caller was cancelled."""
+
+    error_type = "cancelled"
+    retryable = True
+
+
+class StatementInterrupter:
+    """Stops the statement running on a connection from any thread.
+
+    :meth:`interrupt` calls ``sqlite3.Connection.interrupt``, which makes the
+    running statement fail with ``OperationalError: interrupted`` at its next
+    VM step. That call does nothing when no statement is running yet, so
+    while attached a progress handler also checks :attr:`reason` every
+    :data:`PROGRESS_INTERVAL` VM steps, stopping a statement that started
+    just after the interrupt. The first reason given wins.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.reason: Optional[str] = None
+
+    def interrupt(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+            # Under the lock: attached() takes it to detach, so the connection
+            # cannot go back to the pool and be interrupted mid-way through another query
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    @contextmanager
+    def attached(self, conn: sqlite3.Connection):
+        """Route interrupts to ``conn`` while the block runs."""
+        with self._lock:
+            self._conn = conn
+            reason = self.reason
+        # A non-zero return aborts the statement as conn.interrupt() would
+        conn.set_progress_handler(lambda: self.reason is not None, PROGRESS_INTERVAL)
+        try:
+            if reason is not None:
+                # Interrupted before the statement started
+                raise sqlite3.OperationalError("interrupted")
+            yield
+        finally:
+            # Detached before the connection can be released; waits out an interrupt() in flight
+            with self._lock:
+                self._conn = None
+            conn.set_progress_handler(None, 0)
+
+
+class PlanEstimate(NamedTuple):
+    cost: float
+    rows: float
+    # Base tables read in full (scans and automatic indexes), with their row counts
+    scans: Dict[str, int]
+
+
+class GuardDecision(NamedTuple):
+    """What to run instead of the original query, and why."""
+
+    query: str
+    estimate: PlanEstimate
+    notes: List[str]
+
+
+class _Node:
+    __slots__ = ("detail", "children")
+
+    def __init__(self, detail: str):
+        self.detail = detail
+        self.children: List["_Node"] = []
+
+
+def explain(conn: sqlite3.Connection, query: str) -> List[_Node]:
+    """``EXPLAIN QUERY PLAN`` output as a tree of plan nodes."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {strip_statement(query)}").fetchall()
+    nodes = {0: _Node("")}
+    for node_id, parent, _notused, detail in rows:
+        node = nodes[node_id] = _Node(detail)
+        nodes.get(parent, nodes[0]).children.append(node)
+    return nodes[0].children
+
+
+def table_aliases(query: str) -> Dict[str, str]:
+    """Map every alias and table name in FROM/JOIN clauses to the table name."""
+    tokens = tokenize(query)
+    words = [t.text.lower() if t.kind == "word" else t.text for t in tokens]
+    aliases = {}
+    in_from = False
+    for i, w in enumerate(words):
+        if w in ("from", "join"):
+            in_from = True
+        elif w == "," and in_from:
+            pass
+        else:
+            if tokens[i].kind == "word" and w in CLAUSE_KEYWORDS:
+                in_from = False
+            continue
+        if i + 1 >= len(tokens) or tokens[i + 1].kind not in ("word", "quoted"):
+            continue
+        table = tokens[i + 1].text.strip('"`[]')
+        aliases[table.lower()] = table
+        j = i + 2
+        if j < len(words) and words[j] == "as":
+            j += 1
+        if j < len(tokens) and tokens[j].kind == "word" and words[j] not in CLAUSE_KEYWORDS:
+            aliases[words[j]] = table
+    return aliases
+
+
+def _plan_name(detail: str) -> str:
+    # "SCAN sales", "SEARCH s USING INDEX ...", "MATERIALIZE t" -> second word
+    parts = detail.split()
+    return parts[1].lower() if len(parts) > 1 else ""
+
+
+def estimate_cost(
+    plan: List[_Node], table_rows: Dict[str, int], aliases: Dict[str, str]
+) -> PlanEstimate:
+    """Estimate row visits and output rows of a query plan.
+
+    Loops in one query block are nested, so their row estimates multiply:
+    a full scan contributes the table's row count, a primary-key lookup one
+    row and an index lookup :data:`SEARCH_ROWS`. Materialized subqueries and
+    CTEs are costed once; correlated subqueries once per outer row.
+    """
+    lowered = {name.lower(): rows for name, rows in table_rows.items()}
+    derived: Dict[str, float] = {}
+    scans: Dict[str, int] = {}
+
+    def rows_of(name: str) -> float:
+        if name in derived:
+            return derived[name]
+        table = aliases.get(name, name).lower()
+        return lowered.get(table, UNKNOWN_ROWS)
+
+    def block(nodes: List[_Node], outer: float) -> Tuple[float, float]:
+        cost, loop = 0.0, 1.0
+        for node in nodes:
+            detail = node.detail
+            if detail.startswith("SCAN CONSTANT ROW"):
+                continue
+            if detail.startswith("SCAN "):
+                name = _plan_name(detail)
+                loop *= max(rows_of(name), 1)
+                table = aliases.get(name, name)
+                if table.lower() in lowered:
+                    scans[table] = lowered[table.lower()]
+                cost += outer * loop
+            elif detail.startswith("SEARCH "):
+                name = _plan_name(detail)
+                total = max(rows_of(name), 1)
+                if "PRIMARY KEY" in detail or "(rowid=" in detail:
+                    factor = 1.0
+                elif "AUTOMATIC" in detail:
+                    # The temporary index is built by one pass over the table
+                    cost += outer * total
+                    table = aliases.get(name, name)
+                    if table.lower() in lowered:
+                        scans[table] = lowered[table.lower()]
+                    factor = min(SEARCH_ROWS, total)
+                elif any(op in detail for op in ("<", ">")):
+                    factor = max(total / 4, 1)
+                else:
+                    factor = min(SEARCH_ROWS, total)
+                loop *= factor
+                cost += outer * loop
+            elif detail.startswith(("MATERIALIZE", "CO-ROUTINE")):
+                sub_cost, sub_rows = block(node.children, 1.0)
+                derived[_plan_name(detail)] = sub_rows
+                cost += sub_cost
+            elif detail.startswith("CORRELATED"):
+                cost += block(node.children, outer * loop)[0]
+            elif detail.startswith("COMPOUND"):
+                parts = [block(child.children, outer) for child in node.children]
+                cost += sum(c for c, _ in parts)
+                loop *= max(sum(r for _, r in parts), 1)
+            elif detail.startswith("USE TEMP B-TREE"):
+                cost += outer * loop * math.log2(loop + 1)
+            elif node.children:
+                cost += block(node.children, outer * loop)[0]
+        return cost, loop
+
+    cost, rows = block(plan, 1.0)
+    return PlanEstimate(cost, rows, scans)
+
+
+def _top_level_words(query: str) -> List[str]:
+    """Lowercased keywords of the outermost query (outside any parentheses)."""
+    depth, words = 0, []
+    for t in tokenize(query):
+        if t.text == "(":
+            depth += 1
+        elif t.text == ")":
+            depth -= 1
+        elif depth == 0 and t.kind == "word":
+            words.append(t.text.lower())
+    return words
+
+
+def _top_level_calls(query: str) -> List[str]:
+    """Lowercased names of the functions called in the outermost query, e.g. ``sum`` in ``SUM(x)``."""
+    tokens = tokenize(query)
+    depth, calls = 0, []
+    for i, t in enumerate(tokens):
+        if t.text == "(":
+            if depth == 0 and i > 0 and tokens[i - 1].kind == "word":
+                calls.append(tokens[i - 1].text.lower())
+            depth += 1
+        elif t.text == ")":
+            depth -= 1
+    return calls
+
+
+def sample_table(query: str, table: str, factor: int) -> str:
+    """Rewrite FROM/JOIN references to ``table`` to read every ``factor``-th row."""
+    tokens = tokenize(query)
+    words = [t.text.lower() if t.kind == "word" else t.text for t in tokens]
+    sample = f'(SELECT * FROM "{table}" WHERE rowid % {factor} = 0)'
+    out, last = [], 0
+    in_from = False
+    for i, w in enumerate(words):
+        if w in ("from", "join"):
+            in_from = True
+        elif not (w == "," and in_from):
+            if tokens[i].kind == "word" and w in CLAUSE_KEYWORDS:
+                in_from = False
+            continue
+        if i + 1 >= len(tokens) or tokens[i + 1].text.strip('"`[]').lower() != table.lower():
+            continue
+        target = tokens[i + 1]
+        following = words[i + 2] if i + 2 < len(words) else ""
+        has_alias = following == "as" or (
+            i + 2 < len(tokens) and tokens[i + 2].kind == "word" and following not in CLAUSE_KEYWORDS
+        )
+        out.append(query[last : target.start])
+        # Without an alias the sample keeps the table's name, so qualified columns still resolve
+        out.append(sample if has_alias else f'{sample} AS "{table}"')
+        last = target.end
+    out.append(query[last:])
+    return "".join(out)
+
+
+class QueryGuard:
+    """Pre-execution check of LLM-written SQL against cost and size thresholds.
+
+    The plan from ``EXPLAIN QUERY PLAN`` is costed with the tables' row
+    counts. Queries above ``max_cost`` are rejected. Queries above
+    ``sample_cost`` read a systematic sample of their largest scanned table
+    instead. Queries expected to return more than ``max_rows`` rows get a
+    LIMIT. :meth:`deadline` interrupts whatever still runs too long.
+    """
+
+    def __init__(
+        self,
+        sample_cost: float = SAMPLE_COST,
+        max_cost: float = MAX_COST,
+        max_rows: int = MAX_RESULT_ROWS,
+        time_limit: float = TIME_LIMIT,
+    ):
+        self.sample_cost = sample_cost
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.time_limit = time_limit
+
+    def check(self, conn: sqlite3.Connection, db_path: str, query: str) -> GuardDecision:
+        """Decide how ``query`` runs.
+
+        Raises:
+            QueryRejected: If the query is too expensive even when sampled
+        """
+        # On the caller's connection: a second one from the same pool could wait forever
+        table_rows = {t.name: t.rows for t in get_table_stats(db_path, conn=conn)}
+        estimate = estimate_cost(explain(conn, query), table_rows, table_aliases(query))
+        notes = []
+
+        if estimate.cost > self.sample_cost:
+            largest = max(estimate.scans, key=estimate.scans.get, default=None)
+            factor = math.ceil(estimate.cost / self.sample_cost)
+            if estimate.cost > self.max_cost or largest is None or factor > MAX_SAMPLE_FACTOR:
+                raise QueryRejected(
+                    f"Query rejected: estimated {estimate.cost:,.0f} row visits exceeds the "
+                    f"limit of {self.max_cost:,.0f}. Add filters, join on keys, or aggregate in SQL."
+                )
+            query = sample_table(query, largest, factor)
+            notes.append(
+                f"Sampled 1 in {factor} rows of {largest} (estimated {estimate.cost:,.0f} row "
+                f"visits); counts and sums are about 1/{factor} of the full values."
+            )
+
+        top = _top_level_words(query)
+        aggregated = AGGREGATE_FUNCS & set(_top_level_calls(query))
+        if estimate.rows > self.max_rows and "limit" not in top and not aggregated:
+            query = f"{strip_statement(query)}\nLIMIT {self.max_rows}"
+            notes.append(f"Limited to {self.max_rows} rows (estimated {estimate.rows:,.0f}).")
+        return GuardDecision(query, estimate, notes)
+
+    @contextmanager
+    def deadline(
+        self, conn: sqlite3.Connection, interrupter: Optional[StatementInterrupter] = None
+    ):
+        """Interrupt statements on ``conn`` that run past :attr:`time_limit`.
+
+        A timer thread calls ``conn.interrupt()`` at the deadline; callers pass
+        their own ``interrupter`` to also stop the statement on cancellation.
+
+        Raises:
+            QueryTimeout: If the deadline interrupted the statement
+            QueryCancelled: If ``interrupter`` was triggered for any other reason
+        """
+        interrupter = interrupter or StatementInterrupter()
+        timer = threading.Timer(self.time_limit, interrupter.interrupt, args=("timeout",))
+        timer.daemon = True
+        start = time.monotonic()
+        timer.start()
+        try:
+            with interrupter.attached(conn):
+                yield
+        except sqlite3.OperationalError as e:
+            if str(e) != "interrupted" or interrupter.reason is None:
+                raise
+            elapsed = time.monotonic() - start
+            if interrupter.reason == "timeout":
+                raise QueryTimeout(
+                    f"Query exceeded the time limit of {self.time_limit:g}s and was stopped. "
+                    "Add filters, join on keys, or aggregate in SQL.",
+                    elapsed,
+                ) from e
+            raise QueryCancelled(f"Query {interrupter.reason} before it finished.", elapsed) from e
+        finally:
+            timer.cancel()
+
+
+_GUARD = QueryGuard()
+
+
+def get_query_guard() -> QueryGuard:
+    """The process-wide query guard, configured from the environment."""
+    return _GUARD
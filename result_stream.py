@@ -0,0 +1,194 @@
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rows pulled from SQLite per fetchmany() call
+FETCH_BATCH_SIZE = 5000
+
+# Budget for the part of a result that is placed in the LLM context
+PREVIEW_MAX_ROWS = int(os.getenv("PREVIEW_MAX_ROWS", "50"))
+PREVIEW_MAX_BYTES = int(os.getenv("PREVIEW_MAX_BYTES", "16000"))
+
+# Distinct values tracked per text column; beyond this the distinct count is a lower bound
+MAX_TRACKED_VALUES = 1000
+TOP_VALUES = 3
+
+
+def iter_batches(cursor, batch_size: int = FETCH_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """Yield the rows of an executed cursor in ``fetchmany`` batches."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def to_array(values: Sequence[Any]) -> np.ndarray:
+    """Pack one column of SQLite values into a NumPy array.
+
+    Integer columns become int64, numeric columns with NULLs become float64
+    (NULL -> NaN) and anything else (text, dates, blobs, mixed types) is kept
+    as an object array so no value is coerced.
+    """
+    kinds = {type(v) for v in values}
+    nullable = type(None) in kinds
+    kinds.discard(type(None))
+    try:
+        if kinds and kinds <= {int}:
+            return np.array(values, dtype=np.float64 if nullable else np.int64)
+        if kinds and kinds <= {int, float}:
+            return np.array(values, dtype=np.float64)
+    except OverflowError:
+        pass
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+def concat_arrays(parts: List[np.ndarray]) -> np.ndarray:
+    """Join per-batch column arrays, widening to object if the batches disagree.
+
+    Batches are copied into one preallocated array and dropped from
+    ``parts`` (which is left empty) as they go, so widening converts one
+    batch at a time rather than making a second full copy of the column.
+    """
+    if len(parts) == 1:
+        return parts.pop()
+    widen = any(p.dtype == object for p in parts)
+    out = np.empty(sum(len(p) for p in parts), dtype=object if widen else np.result_type(*parts))
+    offset = 0
+    for i, part in enumerate(parts):
+        if widen and part.dtype != object:
+            # astype(object) turns NumPy scalars back into plain Python values
+            part = part.astype(object)
+        out[offset : offset + len(part)] = part
+        offset += len(part)
+        parts[i] = None
+    parts.clear()
+    return out
+
+
+def _plain(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ColumnSummary:
+    """Running statistics of one column, updated one batch at a time."""
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        # "number", "text" or "mixed"; None until a non-null value is seen
+        self.kind: Optional[str] = None
+        self._values: Counter = Counter()
+        self._overflow = False
+
+    def _merge_kind(self, kind: str) -> None:
+        if self.kind is None:
+            self.kind = kind
+        elif self.kind != kind:
+            self.kind = "mixed"
+
+    def _merge_range(self, low: Any, high: Any) -> None:
+        if self.kind == "mixed":
+            self.min = self.max = None
+            return
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def update(self, array: np.ndarray) -> None:
+        if array.dtype.kind in "iuf":
+            valid = array[~np.isnan(array)] if array.dtype.kind == "f" else array
+            self.nulls += len(array) - len(valid)
+            if len(valid):
+                self.count += len(valid)
+                self.total += float(valid.sum())
+                self._merge_kind("number")
+                self._merge_range(_plain(valid.min()), _plain(valid.max()))
+            return
+
+        valid = [v for v in array if v is not None]
+        self.nulls += len(array) - len(valid)
+        if not valid:
+            return
+        self.count += len(valid)
+        numbers = [v for v in valid if isinstance(v, (int, float))]
+        if numbers:
+            self.total += float(sum(numbers))
+        if len(numbers) != len(valid):
+            self._merge_kind("text" if not numbers else "mixed")
+        else:
+            self._merge_kind("number")
+        try:
+            self._merge_range(min(valid), max(valid))
+        except TypeError:
+            self.kind = "mixed"
+            self.min = self.max = None
+        if self.kind != "number":
+            for value in valid:
+                if value in self._values or len(self._values) < MAX_TRACKED_VALUES:
+                    self._values[value] += 1
+                else:
+                    self._overflow = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"count": self.count, "nulls": self.nulls}
+        if self.min is not None:
+            out["min"], out["max"] = self.min, self.max
+        if self.kind == "number" and self.count:
+            out["mean"] = round(self.total / self.count, 6)
+        elif self._values:
+            distinct = len(self._values)
+            out["distinct"] = f">={distinct}" if self._overflow else distinct
+            out["top"] = self._values.most_common(TOP_VALUES)
+        return out
+
+
+class ResultSummary:
+    """Row count and per-column statistics of a result, built without holding it."""
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        self.rows = 0
+        self._columns = [ColumnSummary() for _ in self.columns]
+
+    def update_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        """Add a batch of row tuples."""
+        if rows:
+            self.update_arrays([to_array(values) for values in zip(*rows)])
+
+    def update_arrays(self, arrays: Sequence[np.ndarray]) -> None:
+        """Add a batch given as one array per column."""
+        if not arrays:
+            return
+        self.rows += len(arrays[0])
+        for summary, array in zip(self._columns, arrays):
+            summary.update(array)
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: s.to_dict() for name, s in zip(self.columns, self._columns)}
+
+
+def take_preview(
+    rows: Iterable[Any],
+    max_rows: int = PREVIEW_MAX_ROWS,
+    max_bytes: int = PREVIEW_MAX_BYTES,
+) -> Tuple[List[Any], bool]:
+    """The leading rows that fit in the row and byte budget.
+
+    Returns:
+        Tuple[List[Any], bool]: The preview rows and whether rows were left out
+    """
+    preview = []
+    size = 0
+    for row in rows:
+        size += len(repr(row)) + 2
+        if len(preview) >= max_rows or size > max_bytes:
+            return preview, True
+        preview.append(row)
+    return preview, False
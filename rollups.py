@@ -0,0 +1,218 @@
+"""Materialized rollup tables for the dimensions reports aggregate on.
+
+Each rollup pre-aggregates a fact table joined to its dimensions, e.g. daily
+sales by product category, customer region and segment. The tables live in
+the database itself. The schema prompt therefore lists them, with their
+description, next to the base tables, and the agents query them like any
+other table.
+
+Refreshes are incremental: the highest fact-table rowid already rolled up
+is kept in ``rollup_state``, and only newer rows are aggregated and merged
+into the existing groups. This assumes the fact table is append-only;
+rebuild with ``--full`` after updating or deleting fact rows or changing
+dimension attributes. A rollup whose table definition changed is rebuilt
+automatically.
+
+Dimensions are NOT NULL: facts without a matching dimension row are
+grouped under :data:`UNKNOWN`, since NULL keys would never conflict and
+each refresh would add another NULL group instead of merging into it.
+
+Usage::
+
+    python rollups.py analytics.db          # build or incrementally refresh
+    python rollups.py analytics.db --full   # rebuild from scratch
+"""
+
+import argparse
+import sqlite3
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from schema_cache import quote_identifier
+
+# Bookkeeping table holding each rollup's refresh watermark
+STATE_TABLE = "rollup_state"
+
+# Dimension value of facts whose dimension is missing (e.g. a sale of an unknown product)
+UNKNOWN = "(unknown)"
+
+
+class Rollup(NamedTuple):
+    name: str
+    # Fact table whose rowid is the refresh watermark
+    source: str
+    # Shown to the LLM with the table in the schema prompt
+    description: str
+    # Group-by columns; together they are unique, and the select must never produce NULL for them
+    dimensions: List[Tuple[str, str]]
+    # Columns that follow from the dimensions (e.g. month from day)
+    derived: List[Tuple[str, str]]
+    # Additive measures, merged by summing
+    measures: List[Tuple[str, str]]
+    # Produces dimensions, derived columns and measures for source rows with rowid in (:low, :high]
+    select: str
+
+
+DAILY_SALES = Rollup(
+    name="rollup_daily_sales",
+    source="sales",
+    description=(
+        "Pre-aggregated sales per day, product category, customer region and segment. "
+        "Prefer it over joining sales, products and customers for totals by "
+        "day/month/quarter, category, region or segment. "
+        f"Missing categories, regions and segments are '{UNKNOWN}'"
+    ),
+    dimensions=[("day", "TEXT"), ("category", "TEXT"), ("region", "TEXT"), ("segment", "TEXT")],
+    derived=[("month", "TEXT"), ("quarter", "TEXT")],
+    measures=[("orders", "INTEGER"), ("units", "INTEGER"), ("revenue", "REAL")],
+    select=f"""
+    SELECT
+        COALESCE(date(s.date), '{UNKNOWN}') AS day,
+        COALESCE(p.category, '{UNKNOWN}') AS category,
+        COALESCE(c.region, '{UNKNOWN}') AS region,
+        COALESCE(c.segment, '{UNKNOWN}') AS segment,
+        strftime('%Y-%m', s.date) AS month,
+        strftime('%Y', s.date) || '-Q' || ((CAST(strftime('%m', s.date) AS INTEGER) + 2) / 3) AS quarter,
+        COUNT(*) AS orders,
+        SUM(s.quantity) AS units,
+        SUM(s.total_price) AS revenue
+    FROM sales s
+    LEFT JOIN products p ON p.id = s.product_id
+    LEFT JOIN customers c ON c.id = s.customer_id
+    WHERE s.rowid > :low AND s.rowid <= :high
+    GROUP BY 1, 2, 3, 4
+    """,
+)
+
+ROLLUPS = [DAILY_SALES]
+
+
+class RefreshResult(NamedTuple):
+    name: str
+    # "full" or "incremental"
+    mode: str
+    source_rows: int
+    watermark: int
+    seconds: float
+
+
+def create_table_sql(rollup: Rollup) -> str:
+    # The leading comment is picked up by the schema prompt as the table's description
+    lines = [f"    {quote_identifier(name)} {col_type} NOT NULL" for name, col_type in rollup.dimensions]
+    columns = rollup.derived + rollup.measures
+    lines += [f"    {quote_identifier(name)} {col_type}" for name, col_type in columns]
+    key = ", ".join(quote_identifier(name) for name, _ in rollup.dimensions)
+    lines.append(f"    UNIQUE ({key})")
+    return (
+        f"CREATE TABLE {quote_identifier(rollup.name)} (\n"
+        f"    -- {rollup.description}\n" + ",\n".join(lines) + "\n)"
+    )
+
+
+def upsert_sql(rollup: Rollup) -> str:
+    columns = [name for name, _ in rollup.dimensions + rollup.derived + rollup.measures]
+    key = ", ".join(quote_identifier(name) for name, _ in rollup.dimensions)
+    merge = ", ".join(
+        f"{quote_identifier(name)} = {quote_identifier(name)} + excluded.{quote_identifier(name)}"
+        for name, _ in rollup.measures
+    )
+    # The SELECT has a WHERE clause, which keeps ON CONFLICT unambiguous for the parser
+    return (
+        f"INSERT INTO {quote_identifier(rollup.name)} "
+        f"({', '.join(quote_identifier(c) for c in columns)})\n"
+        f"{rollup.select}\n"
+        f"ON CONFLICT ({key}) DO UPDATE SET {merge}"
+    )
+
+
+def _table_sql(conn: sqlite3.Connection, name: str) -> Optional[str]:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return _table_sql(conn, name) is not None
+
+
+def refresh_rollup(conn: sqlite3.Connection, rollup: Rollup, full: bool = False) -> RefreshResult:
+    """Bring one rollup up to date with its source table, in a single transaction."""
+    start = time.perf_counter()
+    with conn:
+        # Explicit, since sqlite3 would otherwise run the DDL below outside the transaction
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} "
+            "(name TEXT PRIMARY KEY, watermark INTEGER NOT NULL, refreshed_at TEXT NOT NULL)"
+        )
+        row = conn.execute(
+            f"SELECT watermark FROM {STATE_TABLE} WHERE name = ?", (rollup.name,)
+        ).fetchone()
+        low = row[0] if row else 0
+        high = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(rollup.source)}").fetchone()[0] or 0
+
+        # A source that shrank was rewritten, so its rowids no longer line up with the watermark;
+        # a table built from an older definition cannot be merged into
+        if full or row is None or high < low or _table_sql(conn, rollup.name) != create_table_sql(rollup):
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(rollup.name)}")
+            conn.execute(create_table_sql(rollup))
+            low, mode = 0, "full"
+        else:
+            mode = "incremental"
+
+        source_rows = conn.execute(
+            f"SELECT COUNT(*) FROM {quote_identifier(rollup.source)} WHERE rowid > ? AND rowid <= ?",
+            (low, high),
+        ).fetchone()[0]
+        if source_rows:
+            conn.execute(upsert_sql(rollup), {"low": low, "high": high})
+        conn.execute(
+            f"INSERT INTO {STATE_TABLE} (name, watermark, refreshed_at) VALUES (?, ?, datetime('now')) "
+            "ON CONFLICT (name) DO UPDATE SET watermark = excluded.watermark, "
+            "refreshed_at = excluded.refreshed_at",
+            (rollup.name, high),
+        )
+    return RefreshResult(rollup.name, mode, source_rows, high, time.perf_counter() - start)
+
+
+def refresh_rollups(
+    conn: sqlite3.Connection, rollups: Optional[Sequence[Rollup]] = None, full: bool = False
+) -> List[RefreshResult]:
+    """Refresh every rollup whose source table exists.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to the database
+        rollups (Optional[Sequence[Rollup]]): Rollups to refresh (default: all)
+        full (bool): Rebuild from scratch instead of merging new source rows
+
+    Returns:
+        List[RefreshResult]: One entry per refreshed rollup
+    """
+    results = []
+    for rollup in ROLLUPS if rollups is None else rollups:
+        if _table_exists(conn, rollup.source):
+            results.append(refresh_rollup(conn, rollup, full))
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or refresh the rollup tables")
+    parser.add_argument("db_path", help="SQLite database to refresh")
+    parser.add_argument("--full", action="store_true", help="Rebuild instead of refreshing incrementally")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn = sqlite3.connect(args.db_path, timeout=30)
+    try:
+        for result in refresh_rollups(conn, full=args.full):
+            print(
+                f"{result.name}: {result.mode} refresh of {result.source_rows} source rows "
+                f"in {result.seconds:.2f}s (watermark {result.watermark})"
+            )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+from os import path
+from typing import Dict, List, NamedTuple, Optional
+
+from db_pool import borrow
+
+
+class SchemaSnapshot(NamedTuple):
+    """Introspected schema of a database at one ``PRAGMA schema_version``."""
+
+    version: int
+    tables: Dict[str, Dict[str, List[tuple]]]
+    formatted: str
+
+
+def quote_identifier(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def introspect(conn: sqlite3.Connection) -> Dict[str, Dict[str, List[tuple]]]:
+    """Raw table, column and foreign-key information for every table.
+
+    Returns:
+        Dict[str, Dict[str, List[tuple]]]: ``{table: {"columns": PRAGMA table_info rows,
+        "foreign_keys": PRAGMA foreign_key_list rows}}``
+    """
+    tables = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
+    ).fetchall()
+    schema_info = {}
+    for (table_name,) in tables:
+        schema_info[table_name] = {
+            "columns": conn.execute(f"PRAGMA table_info({quote_identifier(table_name)});").fetchall(),
+            "foreign_keys": conn.execute(
+                f"PRAGMA foreign_key_list({quote_identifier(table_name)});"
+            ).fetchall(),
+        }
+    return schema_info
+
+
+def relationships(tables: Dict[str, Dict[str, List[tuple]]]) -> List[tuple]:
+    """``(table, column, referenced_table, referenced_column)`` for every foreign key.
+
+    A foreign key declared without a target column references the primary key
+    of the other table, which is resolved here.
+    """
+    out = []
+    for table_name, info in tables.items():
+        for fk in info["foreign_keys"]:
+            # (id, seq, table, from, to, on_update, on_delete, match)
+            ref_table, from_col, to_col = fk[2], fk[3], fk[4]
+            if to_col is None:
+                ref_columns = tables.get(ref_table, {}).get("columns", [])
+                pks = [c[1] for c in ref_columns if c[5]]
+                to_col = pks[0] if pks else "rowid"
+            out.append((table_name, from_col, ref_table, to_col))
+    return out
+
+
+def format_schema(tables: Dict[str, Dict[str, List[tuple]]]) -> str:
+    """Render the schema in the Schema_Provider output format."""
+    lines = ["1. **Tables**"]
+    for table_name, info in tables.items():
+        lines.append(f"   - **{table_name}**")
+        for column in info["columns"]:
+            # (cid, name, type, notnull, dflt_value, pk)
+            lines.append(f"     - {column[1]}: {column[2] or 'ANY'}")
+        lines.append("")
+
+    lines.append("2. **Relationships**")
+    rels = relationships(tables)
+    for table_name, from_col, ref_table, to_col in rels:
+        lines.append(f"   - `{table_name}.{from_col}` → `{ref_table}.{to_col}`")
+    if not rels:
+        lines.append("   - (none)")
+    return "\n".join(lines)
+
+
+class SchemaCache:
+    """Introspected schemas, re-read only when ``PRAGMA schema_version`` changes.
+
+    Checking the version is a single header read, so repeated schema requests
+    cost one integer comparison instead of a PRAGMA per table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, SchemaSnapshot] = {}
+        self.refreshes = 0
+
+    def get(self, db_path: str, conn: Optional[sqlite3.Connection] = None) -> SchemaSnapshot:
+        """Current schema of ``db_path``, from cache when the schema is unchanged.
+
+        ``conn`` is used instead of a pooled connection when the caller holds one.
+        """
+        key = path.abspath(db_path)
+        with borrow(db_path, conn) as conn:
+            version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+            with self._lock:
+                snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+
+            # Read schema and version in one transaction so they belong together
+            conn.execute("BEGIN")
+            try:
+                version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+                tables = introspect(conn)
+            finally:
+                conn.rollback()
+
+        snapshot = SchemaSnapshot(version, tables, format_schema(tables))
+        with self._lock:
+            self._snapshots[key] = snapshot
+            self.refreshes += 1
+        return snapshot
+
+    def invalidate(self, db_path: Optional[str] = None) -> None:
+        with self._lock:
+            if db_path is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(path.abspath(db_path), None)
+
+
+_CACHE = SchemaCache()
+
+
+def get_schema_cache() -> SchemaCache:
+    """The process-wide schema cache."""
+    return _CACHE
+
+
+def get_schema(db_path: str, conn: Optional[sqlite3.Connection] = None) -> SchemaSnapshot:
+    """Shortcut for ``get_schema_cache().get(db_path, conn)``."""
+    return _CACHE.get(db_path, conn)
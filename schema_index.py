@@ -0,0 +1,163 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+# Words that say nothing about which table a question is about
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how",
+    "in", "is", "it", "me", "of", "on", "or", "per", "show", "that", "the",
+    "this", "to", "was", "were", "what", "which", "with", "each", "all",
+    "give", "list", "many", "much",
+}
+
+# Query terms missing from the index are matched to index terms at least this trigram-similar
+FUZZY_THRESHOLD = 0.5
+
+# How often each part of a table contributes its terms to the table's document
+FIELD_WEIGHTS = {"table": 3, "column": 2, "value": 1, "comment": 1}
+
+WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def _stem(word: str) -> str:
+    """Crude plural folding, enough to match ``customers`` with ``customer``."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased, plural-folded words of ``text``, splitting snake_case and camelCase."""
+    out = []
+    for word in WORD_RE.findall(text or ""):
+        word = word.lower()
+        if word not in STOPWORDS:
+            out.append(_stem(word))
+    return out
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SchemaIndex:
+    """In-process BM25 index with one document per table.
+
+    A table's document holds the terms of its name, column names, example
+    values and comments, weighted by :data:`FIELD_WEIGHTS`. Query terms that
+    do not occur anywhere are matched to the most similar index terms by
+    character trigrams, so misspellings and partial names still score.
+    """
+
+    def __init__(self, documents: Dict[str, List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._tf = {table: Counter(doc) for table, doc in documents.items()}
+        self._length = {table: len(doc) for table, doc in documents.items()}
+        self._avg_length = sum(self._length.values()) / max(len(documents), 1) or 1.0
+        df = Counter(term for tf in self._tf.values() for term in tf)
+        n = len(documents)
+        self._idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+        self._trigrams = {term: trigrams(term) for term in df}
+
+    @classmethod
+    def from_tables(cls, tables: Sequence) -> "SchemaIndex":
+        """Build the index from :class:`schema_summary.TableStats`."""
+        documents = {}
+        for table in tables:
+            doc = terms(table.name) * FIELD_WEIGHTS["table"]
+            for column in table.columns:
+                doc += terms(column.name) * FIELD_WEIGHTS["column"]
+                for value in column.values or ():
+                    doc += terms(value) * FIELD_WEIGHTS["value"]
+            doc += terms(table.comments) * FIELD_WEIGHTS["comment"]
+            documents[table.name] = doc
+        return cls(documents)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Index terms matching a query term, with a weight for fuzzy matches."""
+        if term in self._idf:
+            return [(term, 1.0)]
+        grams = trigrams(term)
+        matches = []
+        for candidate, candidate_grams in self._trigrams.items():
+            similarity = len(grams & candidate_grams) / len(grams | candidate_grams)
+            if similarity >= FUZZY_THRESHOLD:
+                matches.append((candidate, similarity))
+        return sorted(matches, key=lambda m: -m[1])[:3]
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Tables ranked by BM25 score against ``query``; tables scoring zero are left out."""
+        weights: Dict[str, float] = Counter()
+        for term in terms(query):
+            for match, weight in self._expand(term):
+                weights[match] = max(weights[match], weight)
+
+        scores = []
+        for table, tf in self._tf.items():
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._length[table] / self._avg_length)
+            for term, weight in weights.items():
+                f = tf.get(term)
+                if f:
+                    score += weight * self._idf[term] * f * (self.k1 + 1) / (f + norm)
+            if score > 0:
+                scores.append((table, score))
+        scores.sort(key=lambda s: -s[1])
+        return scores[:k] if k is not None else scores
+
+
+def neighbours(tables: Sequence) -> Dict[str, Set[str]]:
+    """Tables linked to each table by a foreign key, in either direction.
+
+    Uses each column's ``reference``, which :func:`schema_summary.collect_stats`
+    fills from declared foreign keys and, for databases written without
+    constraints, from the references it infers.
+    """
+    links: Dict[str, Set[str]] = {t.name: set() for t in tables}
+    for table in tables:
+        for column in table.columns:
+            if not column.reference:
+                continue
+            target = column.reference.split(".", 1)[0]
+            if target in links and target != table.name:
+                links[table.name].add(target)
+                links[target].add(table.name)
+    return links
+
+
+def relevant_tables(
+    tables: Sequence, query: str, top_k: int = 8, index: Optional[SchemaIndex] = None
+) -> List:
+    """The ``top_k`` tables most relevant to ``query`` plus their foreign-key neighbours.
+
+    Args:
+        tables (Sequence[TableStats]): All tables of the database
+        query (str): The user's question or task
+        top_k (int): Number of best-scoring tables to keep before adding neighbours
+        index (Optional[SchemaIndex]): Prebuilt index over ``tables``
+
+    Returns:
+        List[TableStats]: Matching tables by descending relevance, followed by
+        their neighbours; all tables if there are at most ``top_k`` of them or
+        nothing in the query matches
+    """
+    if len(tables) <= top_k:
+        return list(tables)
+    index = index or SchemaIndex.from_tables(tables)
+    hits = [name for name, _ in index.search(query, top_k)]
+    if not hits:
+        return list(tables)
+
+    by_name = {t.name: t for t in tables}
+    links = neighbours(tables)
+    selected = list(hits)
+    for name in hits:
+        for neighbour in sorted(links[name]):
+            if neighbour not in selected:
+                selected.append(neighbour)
+    return [by_name[name] for name in selected]
@@ -0,0 +1,291 @@
+import sqlite3
+import threading
+from os import path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from db_pool import borrow
+from query_cache import TOKEN_RE, db_marker
+from rollups import STATE_TABLE
+from schema_cache import quote_identifier, get_schema, relationships
+from schema_index import SchemaIndex, relevant_tables
+
+# Rows scanned per column when looking for low-cardinality values
+SAMPLE_ROWS = 10000
+
+# Tables larger than this report an estimated (max rowid) instead of an exact row count
+EXACT_COUNT_LIMIT = 1_000_000
+
+# Bookkeeping tables that say nothing about the data
+HIDDEN_TABLES = {STATE_TABLE}
+
+
+class ColumnStats(NamedTuple):
+    name: str
+    type: str
+    pk: bool
+    reference: Optional[str]
+    values: Optional[List[str]]
+
+
+class TableStats(NamedTuple):
+    name: str
+    rows: int
+    rows_estimated: bool
+    columns: List[ColumnStats]
+    comments: str = ""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English/SQL)."""
+    return len(text) // 4 + 1
+
+
+def _is_numeric(col_type: Optional[str]) -> bool:
+    col_type = (col_type or "").upper()
+    return any(t in col_type for t in ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC"))
+
+
+def _row_count(conn, table: str):
+    table = quote_identifier(table)
+    try:
+        max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    except Exception:
+        # WITHOUT ROWID tables
+        max_rowid = EXACT_COUNT_LIMIT
+    if max_rowid > EXACT_COUNT_LIMIT:
+        return max_rowid, True
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], False
+
+
+def _low_cardinality_values(conn, table: str, column: str, max_distinct: int):
+    """Distinct values of a column if a sample shows few of them, each repeated.
+
+    Columns where most sampled values are unique (names, dates on small tables)
+    are skipped, since listing them says nothing about the domain.
+    """
+    table, column = quote_identifier(table), quote_identifier(column)
+    rows = conn.execute(
+        f"SELECT {column}, COUNT(*) AS n FROM "
+        f"(SELECT {column} FROM {table} LIMIT {SAMPLE_ROWS}) "
+        f"WHERE {column} IS NOT NULL "
+        f"GROUP BY 1 ORDER BY n DESC LIMIT {max_distinct + 1}"
+    ).fetchall()
+    if not rows or len(rows) > max_distinct:
+        return None
+    if sum(n for _, n in rows) < 2 * len(rows):
+        return None
+    return [str(value) for value, _ in rows]
+
+
+def _table_comments(conn) -> Dict[str, str]:
+    """SQL comments written inside each table's CREATE statement."""
+    comments = {}
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type='table'"):
+        found = [
+            m.group().strip("-/* \n")
+            for m in TOKEN_RE.finditer(sql or "")
+            if m.lastgroup == "comment"
+        ]
+        comments[name] = " ".join(found)
+    return comments
+
+
+def _key_column(info) -> Optional[str]:
+    """The single primary-key column of a table, else its ``id`` column if it has one."""
+    pks = [c[1] for c in info["columns"] if c[5]]
+    if len(pks) == 1:
+        return pks[0]
+    if not pks and any(c[1].lower() == "id" for c in info["columns"]):
+        return next(c[1] for c in info["columns"] if c[1].lower() == "id")
+    return None
+
+
+def inferred_references(schema) -> Dict[Tuple[str, str], str]:
+    """Links implied by naming: ``product_id`` -> ``products.id`` when nothing is declared.
+
+    Tables written by pandas ``to_sql`` (such as the bundled analytics.db,
+    which predates the generator's DDL) declare no keys at all, and without
+    these links the prompt would not say how the tables join. A ``<name>_id``
+    column refers to the key of the table called ``<name>`` or its plural,
+    if there is exactly one such table.
+    """
+    by_name = {name.lower(): name for name in schema}
+    refs = {}
+    for table, info in schema.items():
+        for column in (c[1] for c in info["columns"]):
+            lowered = column.lower()
+            if not lowered.endswith("_id") or len(lowered) <= 3:
+                continue
+            stem = lowered[:-3]
+            names = {stem, f"{stem}s", f"{stem}es"}
+            if stem.endswith("y"):
+                names.add(f"{stem[:-1]}ies")
+            targets = [by_name[n] for n in names if n in by_name and by_name[n] != table]
+            if len(targets) != 1:
+                continue
+            key = _key_column(schema[targets[0]])
+            if key is not None:
+                refs[(table, column)] = f"{targets[0]}.{key}"
+    return refs
+
+
+def collect_stats(
+    db_path: str, max_distinct: int = 12, conn: Optional[sqlite3.Connection] = None
+) -> List[TableStats]:
+    """Row counts, types, keys and low-cardinality values for every table.
+
+    ``conn`` is used instead of a pooled connection when the caller holds one.
+    """
+    schema = get_schema(db_path, conn).tables
+    refs = inferred_references(schema)
+    # Declared foreign keys take precedence over the naming convention
+    refs.update({(t, c): f"{rt}.{rc}" for t, c, rt, rc in relationships(schema)})
+
+    stats = []
+    with borrow(db_path, conn) as conn:
+        comments = _table_comments(conn)
+        for table, info in schema.items():
+            if table in HIDDEN_TABLES:
+                continue
+            rows, estimated = _row_count(conn, table)
+            columns = []
+            for _cid, name, col_type, _notnull, _default, pk in info["columns"]:
+                reference = refs.get((table, name))
+                values = None
+                # Keys and numbers are rarely useful as example values
+                if not pk and reference is None and not _is_numeric(col_type):
+                    values = _low_cardinality_values(conn, table, name, max_distinct)
+                columns.append(
+                    ColumnStats(name, col_type or "ANY", bool(pk), reference, values)
+                )
+            stats.append(TableStats(table, rows, estimated, columns, comments.get(table, "")))
+    return stats
+
+
+def render_table(table: TableStats, max_values: int, with_counts: bool = True) -> str:
+    """One compact line per table: ``- sales (100 rows): id INTEGER PK, ... -- comment``."""
+    parts = []
+    for column in table.columns:
+        part = f"{column.name} {column.type}"
+        if column.pk:
+            part += " PK"
+        if column.reference:
+            part += f" -> {column.reference}"
+        if column.values and max_values > 0:
+            shown = column.values[:max_values]
+            more = ", ..." if len(column.values) > max_values else ""
+            part += " [" + ", ".join(shown) + more + "]"
+        parts.append(part)
+    header = f"- {table.name}"
+    if with_counts:
+        header += f" ({'~' if table.rows_estimated else ''}{table.rows} rows)"
+    line = f"{header}: {', '.join(parts)}"
+    if with_counts and table.comments:
+        line += f" -- {table.comments}"
+    return line
+
+
+def render_schema(tables: Sequence[TableStats], token_budget: int = 1500) -> str:
+    """Render tables within ``token_budget``, dropping detail before dropping tables.
+
+    Detail is reduced in steps: fewer example values, then no example values,
+    then no row counts or table comments. If the bare schema still does not fit, trailing tables
+    are replaced by a note listing their names.
+    """
+    for max_values, with_counts in ((12, True), (5, True), (2, True), (0, True), (0, False)):
+        text = "\n".join(render_table(t, max_values, with_counts) for t in tables)
+        if estimate_tokens(text) <= token_budget:
+            return text
+
+    lines = []
+    for i, table in enumerate(tables):
+        line = render_table(table, 0, False)
+        rest = [t.name for t in tables[i + 1 :]]
+        note = f"- (omitted for length: {', '.join([table.name] + rest)})"
+        if estimate_tokens("\n".join(lines + [line, note])) > token_budget:
+            lines.append(note)
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+_STATS: Dict[tuple, List[TableStats]] = {}
+_INDEXES: Dict[tuple, SchemaIndex] = {}
+_LOCK = threading.Lock()
+
+
+def _cache_key(db_path: str, max_distinct: int, conn: Optional[sqlite3.Connection] = None) -> tuple:
+    db_path = path.abspath(db_path)
+    return (db_path, get_schema(db_path, conn).version, db_marker(db_path), max_distinct)
+
+
+def _evict_older(cache: dict, key: tuple) -> None:
+    # Entries for older versions of this database are no longer reachable
+    for old in [k for k in cache if k[0] == key[0] and k != key]:
+        del cache[old]
+
+
+def get_table_stats(
+    db_path: str, max_distinct: int = 12, conn: Optional[sqlite3.Connection] = None
+) -> List[TableStats]:
+    """Cached :func:`collect_stats`, recomputed when the schema or the data changes.
+
+    Callers that hold a pooled connection pass it as ``conn``.
+    """
+    key = _cache_key(db_path, max_distinct, conn)
+    with _LOCK:
+        stats = _STATS.get(key)
+    if stats is None:
+        stats = collect_stats(key[0], max_distinct, conn)
+        with _LOCK:
+            _evict_older(_STATS, key)
+            _STATS[key] = stats
+    return stats
+
+
+def get_schema_index(db_path: str, max_distinct: int = 12) -> SchemaIndex:
+    """Cached :class:`SchemaIndex` over :func:`get_table_stats`."""
+    key = _cache_key(db_path, max_distinct)
+    with _LOCK:
+        index = _INDEXES.get(key)
+    if index is None:
+        index = SchemaIndex.from_tables(get_table_stats(db_path, max_distinct))
+        with _LOCK:
+            _evict_older(_INDEXES, key)
+            _INDEXES[key] = index
+    return index
+
+
+def select_tables(
+    db_path: str, query: Optional[str] = None, top_k: int = 8, max_distinct: int = 12
+) -> List[TableStats]:
+    """All tables, or only those relevant to ``query`` when the schema is large."""
+    tables = get_table_stats(db_path, max_distinct)
+    if not query or len(tables) <= top_k:
+        return tables
+    return relevant_tables(tables, query, top_k, get_schema_index(db_path, max_distinct))
+
+
+def summarize_schema(
+    db_path: str,
+    token_budget: int = 1500,
+    max_distinct: int = 12,
+    query: Optional[str] = None,
+    top_k: int = 8,
+) -> str:
+    """Token-budgeted description of the live database schema for LLM prompts.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+        token_budget (int): Approximate maximum size of the summary in tokens
+        max_distinct (int): Columns with at most this many distinct values list them
+        query (Optional[str]): The user's question; when given and the database has
+            more than ``top_k`` tables, only the most relevant tables and their
+            foreign-key neighbours are described
+        top_k (int): Number of best-matching tables kept for a query
+
+    Returns:
+        str: One line per table with column types, keys, foreign keys, row counts
+        and example values of low-cardinality columns
+    """
+    return render_schema(select_tables(db_path, query, top_k, max_distinct), token_budget)
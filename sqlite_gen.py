@@ -1,34 +1,255 @@
+"""Generate the synthetic analytics database with built-in trends.
+
+Datasets are reproducible: the same seed, tier and anchor date always give
+the same rows, so tool timings can be compared across runs and machines.
+Tiers scale all tables together, in the spirit of TPC-H scale factors.
+
+Large sales tables are generated in fixed-size ID-range shards, each with its
+own RNG stream spawned from the seed, by a pool of worker processes. Workers
+write their shard to a temporary database, and the shards are merged into the
+output in bulk. Because the shard layout is fixed, the data for a seed does not
+depend on the number of workers.
+
+Usage::
+
+    python sqlite_gen.py                                  # demo data in analytics.db
+    python sqlite_gen.py --tier 1m --seed 7 --anchor-date 2025-01-01 -o bench_1m.db
+    python sqlite_gen.py --tier 1k --sales 5000           # override a single table size
+    python sqlite_gen.py --tier 100m --workers 16 -o bench_100m.db
+    python sqlite_gen.py --append-days 7 -o analytics.db  # add a week of new data
+"""
+
+import argparse
+import os
 import sqlite3
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from datetime import datetime, timedelta
 import random
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from rollups import refresh_rollups
+
+SALES_COLUMNS = ["id", "date", "product_id", "customer_id", "quantity", "unit_price", "total_price"]
+
+# Sales rows generated and inserted per batch
+SALES_CHUNK_SIZE = 100_000
+
+# Sales rows per shard; fixed so the data for a seed does not depend on the number of workers
+SHARD_SIZE = 2_000_000
+# Shards generated or waiting to be merged, per worker; each is a temporary file next to the output
+SHARD_WINDOW = 2
+
+
+class DatasetScale(NamedTuple):
+    products: int
+    customers: int
+    campaigns: int
+    sales: int
+
+
+# Benchmark tiers, named after their number of sales
+TIERS = {
+    "demo": DatasetScale(products=40, customers=20, campaigns=5, sales=100),
+    "1k": DatasetScale(products=40, customers=100, campaigns=10, sales=1_000),
+    "1m": DatasetScale(products=1_000, customers=20_000, campaigns=200, sales=1_000_000),
+    "100m": DatasetScale(products=10_000, customers=1_000_000, campaigns=2_000, sales=100_000_000),
+}
+
+# Trends shared by the generators:
+# 1. Certain regions prefer certain product categories
+REGION_CATEGORY_BOOST = {
+    "North": "Electronics",
+    "South": "Furniture",
+    "East": "Clothing",
+    "West": "Office Supplies",
+    "Central": "Electronics",
+}
+
+# 2. Customer segments have different quantity patterns
+SEGMENT_QUANTITY = {
+    "Consumer": (1, 3),
+    "Corporate": (3, 10),
+    "Home Office": (1, 5),
+    "Small Business": (2, 8),
+}
+
+# 3. Different campaign channels have different effectiveness
+CHANNEL_BOOST = {
+    "Social Media": 1.3,
+    "Email": 1.2,
+    "Search": 1.25,
+    "Display": 1.15,
+    "TV": 1.4,
+    "Print": 1.1,
+}
+
+
+def seed_streams(seed: Optional[int], *key: int):
+    """Independent random streams for the dimension tables and the sales, derived from ``seed``.
+
+    Different ``key`` values (e.g. the first new ID of an append) give unrelated
+    streams for the same seed.
+
+    Returns:
+        Tuple[random.Random, np.random.SeedSequence]: RNG for the dimension
+        tables and the seed sequence the sales shards are spawned from
+    """
+    dims_seq, sales_seq = np.random.SeedSequence(seed, spawn_key=key).spawn(2)
+    return random.Random(int(dims_seq.generate_state(1)[0])), sales_seq
+
+
+def create_database(
+    db_path="analytics.db",
+    scale: DatasetScale = TIERS["demo"],
+    seed: Optional[int] = None,
+    end_date: Optional[datetime] = None,
+    workers: Optional[int] = None,
+):
+    """Create (or recreate) the database with generated data.
+
+    Args:
+        db_path (str): SQLite file to write
+        scale (DatasetScale): Number of rows per table
+        seed (Optional[int]): Seed for all random draws; None picks a fresh one
+        end_date (Optional[datetime]): Last day of generated activity (default: today)
+        workers (Optional[int]): Processes generating sales shards (default: CPU count)
+
+    Returns:
+        int: The seed used, to reproduce the dataset
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**32)
+    end_date = end_date or datetime.combine(datetime.now().date(), datetime.min.time())
+    rnd, sales_seq = seed_streams(seed)
 
-
-def create_database():
     # Connect to database (creates it if it doesn't exist)
-    conn = sqlite3.connect("analytics.db")
+    conn = sqlite3.connect(db_path)
+    # Bulk-load settings; the journal mode is reset once the data is in
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
     cursor = conn.cursor()
 
     # Create tables
     create_tables(cursor)
 
     # Generate data with trends
-    products_df = generate_products(40)
-    customers_df = generate_customers(20)
-    marketing_df = generate_marketing(5)
-    sales_df = generate_sales(100, products_df, customers_df, marketing_df)
-
-    # Insert data into tables
-    products_df.to_sql("products", conn, if_exists="replace", index=False)
-    customers_df.to_sql("customers", conn, if_exists="replace", index=False)
-    marketing_df.to_sql("marketing", conn, if_exists="replace", index=False)
-    sales_df.to_sql("sales", conn, if_exists="replace", index=False)
-
-    # Commit changes and close connection
+    products_df = generate_products(scale.products, rnd)
+    customers_df = generate_customers(scale.customers, rnd, end_date)
+    marketing_df = generate_marketing(scale.campaigns, rnd, end_date)
+
+    # Insert data into the tables created above, keeping their keys
+    products_df.to_sql("products", conn, if_exists="append", index=False)
+    customers_df.to_sql("customers", conn, if_exists="append", index=False)
+    marketing_df.to_sql("marketing", conn, if_exists="append", index=False)
     conn.commit()
+    generate_sales_sharded(
+        conn, db_path, scale.sales, products_df, customers_df, marketing_df, sales_seq, end_date, workers
+    )
+
+    # Build the rollup tables and close connection
+    refresh_rollups(conn, full=True)
+    conn.execute("PRAGMA journal_mode=DELETE")
     conn.close()
 
     print("Database created successfully with sample data.")
+    return seed
+
+
+def _parse_day(value: str) -> datetime:
+    return datetime.strptime(value[:10], "%Y-%m-%d")
+
+
+def append_database(
+    db_path="analytics.db",
+    days: int = 1,
+    num_sales: Optional[int] = None,
+    num_campaigns: Optional[int] = None,
+    seed: Optional[int] = None,
+    workers: Optional[int] = None,
+):
+    """Append the next ``days`` days of sales and campaigns to an existing database.
+
+    New rows continue from the current maximum IDs and the last sale date and
+    follow the same trends; existing rows are left untouched. The rollup
+    tables are then refreshed incrementally.
+
+    Args:
+        db_path (str): Database created by :func:`create_database`
+        days (int): Number of days to add after the last sale date
+        num_sales (Optional[int]): New sales (default: the current sales per day times ``days``, at least 1)
+        num_campaigns (Optional[int]): New campaigns (default: the current campaign start rate times ``days``)
+        seed (Optional[int]): Seed for all random draws; None picks a fresh one
+        workers (Optional[int]): Processes generating sales shards (default: CPU count)
+
+    Returns:
+        int: The seed used, to reproduce the appended rows
+    """
+    if days < 1:
+        raise ValueError(f"days must be at least 1, got {days}")
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**32)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        last_id, first_day, last_day, total = conn.execute(
+            "SELECT MAX(id), MIN(date), MAX(date), COUNT(*) FROM sales"
+        ).fetchone()
+        if last_id is None:
+            raise ValueError(f"{db_path} has no sales to continue from; create it first")
+        products_df = pd.read_sql("SELECT * FROM products ORDER BY id", conn)
+        customers_df = pd.read_sql("SELECT * FROM customers ORDER BY id", conn)
+        marketing_df = pd.read_sql("SELECT * FROM marketing ORDER BY id", conn)
+
+        start_date = _parse_day(last_day) + timedelta(days=1)
+        end_date = start_date + timedelta(days=days - 1)
+        if num_sales is None:
+            span = (_parse_day(last_day) - _parse_day(first_day)).days + 1
+            # At least one, so a sparse database still grows by the requested days
+            num_sales = max(1, round(total / span * days))
+        if num_campaigns is None:
+            starts = pd.to_datetime(marketing_df["start_date"])
+            span = (starts.max() - starts.min()).days + 1 if len(starts) else 365
+            num_campaigns = round(len(marketing_df) / span * days)
+
+        rnd, sales_seq = seed_streams(seed, last_id + 1)
+        new_campaigns = generate_marketing(
+            num_campaigns, rnd, end_date, start_date, int(marketing_df["id"].max() or 0) + 1
+        )
+        if len(new_campaigns):
+            new_campaigns.to_sql("marketing", conn, if_exists="append", index=False)
+            conn.commit()
+            marketing_df = pd.concat([marketing_df, new_campaigns], ignore_index=True)
+
+        # Campaigns started earlier still boost sales in the new days while they run
+        generate_sales_sharded(
+            conn,
+            db_path,
+            num_sales,
+            products_df,
+            customers_df,
+            marketing_df,
+            sales_seq,
+            end_date,
+            workers,
+            start_id=last_id + 1,
+            start_date=start_date,
+        )
+        refresh_rollups(conn)
+    finally:
+        conn.close()
+
+    print(
+        f"Appended {num_sales} sales and {len(new_campaigns)} campaigns "
+        f"for {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}."
+    )
+    return seed
 
 
 def create_tables(cursor):
@@ -99,7 +320,8 @@ def create_tables(cursor):
     )
 
 
-def generate_products(num_products):
+def generate_products(num_products, rnd=None):
+    rnd = rnd if rnd is not None else random
     categories = ["Electronics", "Furniture", "Office Supplies", "Clothing"]
     electronics_subcategories = ["Phones", "Computers", "Tablets", "Accessories"]
     furniture_subcategories = ["Chairs", "Tables", "Storage", "Furnishings"]
@@ -123,31 +345,31 @@ def generate_products(num_products):
 
     products = []
     for i in range(1, num_products + 1):
-        category = random.choice(categories)
-        subcategory = random.choice(category_map[category])
+        category = rnd.choice(categories)
+        subcategory = rnd.choice(category_map[category])
         price_range = category_price_ranges[category]
 
-        base_cost = round(random.uniform(price_range[0], price_range[1]), 2)
+        base_cost = round(rnd.uniform(price_range[0], price_range[1]), 2)
 
         # Higher margin for Electronics and Furniture (another trend)
         if category in ["Electronics", "Furniture"]:
-            margin = random.uniform(0.4, 0.6)  # 40% to 60% margin
+            margin = rnd.uniform(0.4, 0.6)  # 40% to 60% margin
         else:
-            margin = random.uniform(0.2, 0.4)  # 20% to 40% margin
+            margin = rnd.uniform(0.2, 0.4)  # 20% to 40% margin
 
         price = round(base_cost * (1 + margin), 2)
 
         # Add some product naming pattern
         if category == "Electronics":
-            name = f"{subcategory[:-1]} Pro {random.randint(1, 10)}"
+            name = f"{subcategory[:-1]} Pro {rnd.randint(1, 10)}"
         elif category == "Furniture":
             styles = ["Modern", "Classic", "Executive", "Ergonomic"]
-            name = f"{random.choice(styles)} {subcategory[:-1]}"
+            name = f"{rnd.choice(styles)} {subcategory[:-1]}"
         elif category == "Office Supplies":
-            name = f"{subcategory} Set {chr(65 + random.randint(0, 25))}"
+            name = f"{subcategory} Set {chr(65 + rnd.randint(0, 25))}"
         else:  # Clothing
             styles = ["Casual", "Formal", "Premium", "Basic"]
-            name = f"{random.choice(styles)} {subcategory} Item {random.randint(1, 20)}"
+            name = f"{rnd.choice(styles)} {subcategory} Item {rnd.randint(1, 20)}"
 
         products.append(
             {
@@ -163,7 +385,8 @@ def generate_products(num_products):
     return pd.DataFrame(products)
 
 
-def generate_customers(num_customers):
+def generate_customers(num_customers, rnd=None, end_date=None):
+    rnd = rnd if rnd is not None else random
     regions = ["North", "South", "East", "West", "Central"]
     segments = ["Consumer", "Corporate", "Home Office", "Small Business"]
 
@@ -177,24 +400,24 @@ def generate_customers(num_customers):
     }
 
     # Create end date as today
-    end_date = datetime.now()
+    end_date = end_date or datetime.now()
     # Create start date as 3 years ago
     start_date = end_date - timedelta(days=3 * 365)
 
     customers = []
     for i in range(1, num_customers + 1):
-        region = random.choice(regions)
+        region = rnd.choice(regions)
 
         # Apply regional segment bias (70% chance of the dominant segment)
-        if random.random() < 0.7:
+        if rnd.random() < 0.7:
             segment = region_segment_bias[region]
         else:
             other_segments = [s for s in segments if s != region_segment_bias[region]]
-            segment = random.choice(other_segments)
+            segment = rnd.choice(other_segments)
 
         # Generate join date
         days_between = (end_date - start_date).days
-        join_date = start_date + timedelta(days=random.randint(0, days_between))
+        join_date = start_date + timedelta(days=rnd.randint(0, days_between))
 
         # Generate customer name
         first_names = [
@@ -221,7 +444,7 @@ def generate_customers(num_customers):
             "Moore",
             "Taylor",
         ]
-        name = f"{random.choice(first_names)} {random.choice(last_names)}"
+        name = f"{rnd.choice(first_names)} {rnd.choice(last_names)}"
 
         customers.append(
             {
@@ -236,7 +459,8 @@ def generate_customers(num_customers):
     return pd.DataFrame(customers)
 
 
-def generate_marketing(num_campaigns):
+def generate_marketing(num_campaigns, rnd=None, end_date=None, start_date=None, start_id=1):
+    rnd = rnd if rnd is not None else random
     channels = ["Social Media", "Email", "Search", "Display", "TV", "Print"]
     regions = ["North", "South", "East", "West", "Central", None]  # None for nationwide
     segments = [
@@ -248,33 +472,38 @@ def generate_marketing(num_campaigns):
     ]  # None for all segments
 
     # End date as today
-    end_date = datetime.now()
-    # Start date as 2 years ago
-    start_date = end_date - timedelta(days=2 * 365)
+    end_date = end_date or datetime.now()
+    if start_date is None:
+        # Start date as 2 years ago, campaigns start within the first year
+        start_date = end_date - timedelta(days=2 * 365)
+        start_window = 365
+    else:
+        # Appended campaigns start within the given period
+        start_window = (end_date - start_date).days
 
     campaigns = []
-    for i in range(1, num_campaigns + 1):
+    for i in range(start_id, start_id + num_campaigns):
         # Generate campaign dates
-        campaign_start = start_date + timedelta(days=random.randint(0, 365))
+        campaign_start = start_date + timedelta(days=rnd.randint(0, start_window))
         # Campaign duration between 7 and 60 days
-        duration = random.randint(7, 60)
+        duration = rnd.randint(7, 60)
         campaign_end = campaign_start + timedelta(days=duration)
 
         # Channel affects spend (trend)
-        channel = random.choice(channels)
+        channel = rnd.choice(channels)
         if channel in ["TV", "Print"]:
-            base_spend = random.uniform(20000, 50000)
+            base_spend = rnd.uniform(20000, 50000)
         elif channel in ["Social Media", "Display"]:
-            base_spend = random.uniform(5000, 20000)
+            base_spend = rnd.uniform(5000, 20000)
         else:
-            base_spend = random.uniform(2000, 10000)
+            base_spend = rnd.uniform(2000, 10000)
 
         # Longer campaigns cost more
         spend = round(base_spend * (duration / 30), 2)
 
         # Some campaigns target specific regions/segments
-        target_region = random.choice(regions)
-        target_segment = random.choice(segments)
+        target_region = rnd.choice(regions)
+        target_segment = rnd.choice(segments)
 
         # Campaign name with quarter/year
         quarter = (campaign_start.month - 1) // 3 + 1
@@ -296,131 +525,302 @@ def generate_marketing(num_campaigns):
     return pd.DataFrame(campaigns)
 
 
-def generate_sales(num_sales, products_df, customers_df, marketing_df):
-    # Set date range for sales data
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=365 * 2)  # 2 years of data
+def campaign_boost_grid(marketing_df, start_day, num_days, regions, segments):
+    """Best campaign boost for every (day, region, segment) of the sales period.
 
-    # Convert marketing dates to datetime for comparison
-    marketing_data = []
-    for _, campaign in marketing_df.iterrows():
-        marketing_data.append(
-            {
-                "id": campaign["id"],
-                "start_date": datetime.strptime(campaign["start_date"], "%Y-%m-%d"),
-                "end_date": datetime.strptime(campaign["end_date"], "%Y-%m-%d"),
-                "channel": campaign["channel"],
-                "target_region": campaign["target_region"],
-                "target_segment": campaign["target_segment"],
-            }
+    Sale dates are whole days, so this dense grid serves as the interval index
+    over the campaigns: each sale looks up its boost directly instead of
+    scanning every campaign.
+    """
+    grid = np.ones((num_days, len(regions), len(segments)))
+    for campaign in marketing_df.itertuples(index=False):
+        first = max(int((np.datetime64(campaign.start_date, "D") - start_day).astype(int)), 0)
+        last = min(int((np.datetime64(campaign.end_date, "D") - start_day).astype(int)), num_days - 1)
+        if first > last:
+            continue
+        # Campaigns without a target region/segment apply to all of them
+        region = slice(None) if pd.isna(campaign.target_region) else regions.index(campaign.target_region)
+        segment = (
+            slice(None) if pd.isna(campaign.target_segment) else segments.index(campaign.target_segment)
         )
-
-    sales = []
-    for i in range(1, num_sales + 1):
-        # Generate random date within range
-        days_between = (end_date - start_date).days
-        sale_date = start_date + timedelta(days=random.randint(0, days_between))
-
-        # Introduce seasonality - more sales in Q4 (Oct-Dec)
-        month = sale_date.month
-        if month in [10, 11, 12]:  # Q4 boost
-            if random.random() < 0.3:  # 30% chance to regenerate date to fall in Q4
-                q4_start = datetime(sale_date.year, 10, 1)
-                q4_end = min(datetime(sale_date.year, 12, 31), end_date)
-                if q4_end > q4_start:  # Ensure valid date range
-                    days_in_q4 = (q4_end - q4_start).days
-                    sale_date = q4_start + timedelta(days=random.randint(0, days_in_q4))
-
-        # Random select customer and product
-        customer_id = random.choice(customers_df["id"].tolist())
-        product_id = random.choice(products_df["id"].tolist())
-
-        # Get customer and product details
-        customer = customers_df[customers_df["id"] == customer_id].iloc[0]
-        product = products_df[products_df["id"] == product_id].iloc[0]
-
-        # Apply trends:
-        # 1. Certain regions prefer certain product categories
-        region_category_boost = {
-            "North": "Electronics",
-            "South": "Furniture",
-            "East": "Clothing",
-            "West": "Office Supplies",
-            "Central": "Electronics",
-        }
-
-        # 2. Customer segments have different quantity patterns
-        segment_quantity = {
-            "Consumer": (1, 3),
-            "Corporate": (3, 10),
-            "Home Office": (1, 5),
-            "Small Business": (2, 8),
-        }
-
-        # Base quantity
-        quantity_range = segment_quantity[customer["segment"]]
-        base_quantity = random.randint(quantity_range[0], quantity_range[1])
-
-        # Apply region-category boost
-        if product["category"] == region_category_boost[customer["region"]]:
-            quantity = int(base_quantity * random.uniform(1.2, 1.5))  # 20-50% boost
-        else:
-            quantity = base_quantity
-
-        # Check if sale happened during a marketing campaign
-        campaign_boost = 1.0
-        for campaign in marketing_data:
-            if (
-                sale_date >= campaign["start_date"]
-                and sale_date <= campaign["end_date"]
-            ):
-
-                # Check if campaign targets this customer's region/segment
-                region_match = (
-                    campaign["target_region"] is None
-                    or campaign["target_region"] == customer["region"]
-                )
-                segment_match = (
-                    campaign["target_segment"] is None
-                    or campaign["target_segment"] == customer["segment"]
-                )
-
-                # If campaign targets this customer, boost quantity
-                if region_match and segment_match:
-                    # Different channels have different effectiveness
-                    channel_boost = {
-                        "Social Media": 1.3,
-                        "Email": 1.2,
-                        "Search": 1.25,
-                        "Display": 1.15,
-                        "TV": 1.4,
-                        "Print": 1.1,
-                    }
-                    campaign_boost = max(
-                        campaign_boost, channel_boost[campaign["channel"]]
-                    )
-
-        # Apply campaign boost
-        quantity = int(quantity * campaign_boost)
-
-        # Calculate total price
-        unit_price = product["price"]
-        total_price = round(quantity * unit_price, 2)
-
-        sales.append(
+        cells = grid[first : last + 1, region, segment]
+        np.maximum(cells, CHANNEL_BOOST[campaign.channel], out=cells)
+    return grid
+
+
+def iter_sales(
+    num_sales,
+    products_df,
+    customers_df,
+    marketing_df,
+    rng=None,
+    end_date=None,
+    start_id=1,
+    chunk_size=SALES_CHUNK_SIZE,
+    start_date=None,
+):
+    """Generate sales in DataFrame chunks of ``chunk_size`` rows, vectorized with NumPy.
+
+    Sales fall between ``start_date`` (default: 2 years before ``end_date``)
+    and ``end_date``, both inclusive.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    end_date = end_date or datetime.now()
+    start_date = start_date or end_date - timedelta(days=365 * 2)  # 2 years of data
+    start_day = np.datetime64(start_date.date(), "D")
+    end_day = np.datetime64(end_date.date(), "D")
+    num_days = int((end_day - start_day).astype(int)) + 1
+
+    # Encode the trend inputs as integer codes so every lookup is an array index
+    regions = list(REGION_CATEGORY_BOOST)
+    segments = list(SEGMENT_QUANTITY)
+    categories = sorted(set(products_df["category"]) | set(REGION_CATEGORY_BOOST.values()))
+    customer_region = pd.Categorical(customers_df["region"], categories=regions).codes
+    customer_segment = pd.Categorical(customers_df["segment"], categories=segments).codes
+    product_category = pd.Categorical(products_df["category"], categories=categories).codes
+    region_boost_category = np.array([categories.index(REGION_CATEGORY_BOOST[r]) for r in regions])
+    segment_low = np.array([SEGMENT_QUANTITY[s][0] for s in segments])
+    segment_high = np.array([SEGMENT_QUANTITY[s][1] for s in segments])
+    customer_ids = customers_df["id"].to_numpy()
+    product_ids = products_df["id"].to_numpy()
+    product_price = products_df["price"].to_numpy(dtype=np.float64)
+    boost_grid = campaign_boost_grid(marketing_df, start_day, num_days, regions, segments)
+
+    for offset in range(0, num_sales, chunk_size):
+        n = min(chunk_size, num_sales - offset)
+
+        # Random date within range
+        dates = start_day + rng.integers(0, num_days, n)
+
+        # Introduce seasonality - 30% of Q4 sales are redrawn to fall in Q4 again
+        month = dates.astype("M8[M]").astype(np.int64) % 12 + 1
+        redraw = (month >= 10) & (rng.random(n) < 0.3)
+        if redraw.any():
+            years = dates[redraw].astype("M8[Y]")
+            q4_start = np.maximum((years.astype("M8[M]") + 9).astype("M8[D]"), start_day)
+            q4_end = np.minimum((years + 1).astype("M8[D]") - 1, end_day)
+            span = (q4_end - q4_start).astype(np.int64)
+            redrawn = q4_start + rng.integers(0, span + 1)
+            dates[redraw] = np.where(span > 0, redrawn, dates[redraw])
+        days = (dates - start_day).astype(np.int64)
+
+        # Random customer and product
+        customer = rng.integers(0, len(customers_df), n)
+        product = rng.integers(0, len(products_df), n)
+        region = customer_region[customer]
+        segment = customer_segment[customer]
+
+        # Customer segments have different quantity patterns
+        quantity = rng.integers(segment_low[segment], segment_high[segment] + 1)
+
+        # Certain regions prefer certain product categories (20-50% boost)
+        boosted = product_category[product] == region_boost_category[region]
+        quantity = np.where(boosted, (quantity * rng.uniform(1.2, 1.5, n)).astype(np.int64), quantity)
+
+        # Campaigns targeting the customer's region/segment boost quantity
+        quantity = (quantity * boost_grid[days, region, segment]).astype(np.int64)
+
+        unit_price = product_price[product]
+        yield pd.DataFrame(
             {
-                "id": i,
-                "date": sale_date.strftime("%Y-%m-%d"),
-                "product_id": product_id,
-                "customer_id": customer_id,
+                "id": np.arange(start_id + offset, start_id + offset + n),
+                "date": np.datetime_as_string(dates, unit="D"),
+                "product_id": product_ids[product],
+                "customer_id": customer_ids[customer],
                 "quantity": quantity,
                 "unit_price": unit_price,
-                "total_price": total_price,
+                "total_price": np.round(quantity * unit_price, 2),
             }
         )
 
-    return pd.DataFrame(sales)
+
+def generate_sales(num_sales, products_df, customers_df, marketing_df, rng=None, end_date=None):
+    chunks = list(iter_sales(num_sales, products_df, customers_df, marketing_df, rng, end_date))
+    if not chunks:
+        return pd.DataFrame(columns=SALES_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def insert_sales(conn, chunks):
+    """Insert sales chunks with executemany, all in one transaction.
+
+    Returns:
+        int: Number of rows inserted
+    """
+    sql = f"INSERT INTO sales ({', '.join(SALES_COLUMNS)}) VALUES ({', '.join('?' * len(SALES_COLUMNS))})"
+    inserted = 0
+    with conn:
+        for chunk in chunks:
+            conn.executemany(sql, zip(*(chunk[c].tolist() for c in SALES_COLUMNS)))
+            inserted += len(chunk)
+    return inserted
+
+
+def sales_shards(num_sales: int, start_id: int = 1) -> List[Tuple[int, int]]:
+    """Split sales IDs into ``(first_id, count)`` ranges of at most :data:`SHARD_SIZE`."""
+    return [
+        (start_id + offset, min(SHARD_SIZE, num_sales - offset)) for offset in range(0, num_sales, SHARD_SIZE)
+    ]
+
+
+# Dimension tables of the worker process, set once by the pool initializer
+_shard_inputs = {}
+
+
+def _init_shard_worker(products_df, customers_df, marketing_df, end_date, start_date):
+    _shard_inputs.update(
+        products=products_df,
+        customers=customers_df,
+        marketing=marketing_df,
+        end_date=end_date,
+        start_date=start_date,
+    )
+
+
+def _write_shard(shard_path, first_id, num_sales, seed_seq):
+    """Generate one shard into its own database file; runs in a worker process."""
+    conn = sqlite3.connect(shard_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(f"CREATE TABLE sales ({', '.join(SALES_COLUMNS)})")
+    chunks = iter_sales(
+        num_sales,
+        _shard_inputs["products"],
+        _shard_inputs["customers"],
+        _shard_inputs["marketing"],
+        np.random.default_rng(seed_seq),
+        _shard_inputs["end_date"],
+        first_id,
+        start_date=_shard_inputs["start_date"],
+    )
+    insert_sales(conn, chunks)
+    conn.close()
+    return shard_path
+
+
+def merge_shard(conn, shard_path):
+    """Copy a shard's sales into the connected database in one statement."""
+    conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+    try:
+        with conn:
+            conn.execute(f"INSERT INTO sales ({', '.join(SALES_COLUMNS)}) SELECT * FROM shard.sales")
+    finally:
+        conn.execute("DETACH DATABASE shard")
+
+
+def generate_sales_sharded(
+    conn,
+    db_path,
+    num_sales,
+    products_df,
+    customers_df,
+    marketing_df,
+    seed_seq,
+    end_date=None,
+    workers=None,
+    start_id=1,
+    start_date=None,
+):
+    """Generate and insert sales shard by shard, in parallel when there are several shards.
+
+    Returns:
+        int: Number of rows inserted
+    """
+    shards = sales_shards(num_sales, start_id)
+    seqs = seed_seq.spawn(len(shards))
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+
+    if workers <= 1:
+        # Same shards and streams, written straight into the database
+        for (first_id, count), seq in zip(shards, seqs):
+            chunks = iter_sales(
+                count,
+                products_df,
+                customers_df,
+                marketing_df,
+                np.random.default_rng(seq),
+                end_date,
+                first_id,
+                start_date=start_date,
+            )
+            insert_sales(conn, chunks)
+        return num_sales
+
+    # Shard files sit next to the output so the merge does not cross filesystems
+    staging = os.path.dirname(os.path.abspath(db_path))
+    with tempfile.TemporaryDirectory(prefix="sqlite_gen_", dir=staging) as tmp, ProcessPoolExecutor(
+        workers,
+        initializer=_init_shard_worker,
+        initargs=(products_df, customers_df, marketing_df, end_date, start_date),
+    ) as pool:
+        # Shards are merged in submission order, so IDs are appended in order while later
+        # shards generate; the window bounds how many shard files exist at once
+        pending = deque()
+
+        def merge_next():
+            path = pending.popleft().result()
+            merge_shard(conn, path)
+            os.remove(path)
+
+        for i, ((first_id, count), seq) in enumerate(zip(shards, seqs)):
+            if len(pending) >= SHARD_WINDOW * workers:
+                merge_next()
+            path = os.path.join(tmp, f"shard_{i}.db")
+            pending.append(pool.submit(_write_shard, path, first_id, count, seq))
+        while pending:
+            merge_next()
+    return num_sales
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the synthetic analytics database")
+    parser.add_argument("-o", "--output", default="analytics.db", help="SQLite file to write")
+    parser.add_argument("--tier", choices=TIERS, default="demo", help="Dataset size preset")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible data (default: random, printed)")
+    parser.add_argument(
+        "--anchor-date",
+        type=lambda value: datetime.strptime(value, "%Y-%m-%d"),
+        help="Last day of generated activity, YYYY-MM-DD (default: today)",
+    )
+    for table in DatasetScale._fields:
+        parser.add_argument(f"--{table}", type=int, help=f"Override the tier's number of {table}")
+    parser.add_argument("--workers", type=int, help="Processes generating sales shards (default: CPU count)")
+    parser.add_argument(
+        "--append-days",
+        type=_positive_int,
+        help="Append this many days of sales and campaigns to the existing output instead of recreating it; "
+        "--sales/--campaigns then set the number of new rows",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.append_days is not None:
+        start = time.perf_counter()
+        seed = append_database(
+            args.output, args.append_days, args.sales, args.campaigns, args.seed, args.workers
+        )
+        print(f"{args.output}: appended in {time.perf_counter() - start:.1f}s (seed {seed})")
+        return
+
+    scale = TIERS[args.tier]._replace(
+        **{table: getattr(args, table) for table in DatasetScale._fields if getattr(args, table) is not None}
+    )
+    start = time.perf_counter()
+    seed = create_database(args.output, scale, args.seed, args.anchor_date, args.workers)
+    print(
+        f"{args.output}: {scale.sales} sales, {scale.customers} customers, {scale.products} products, "
+        f"{scale.campaigns} campaigns in {time.perf_counter() - start:.1f}s (seed {seed})"
+    )
 
 
 if __name__ == "__main__":
-    create_database()
+    main()
@@ -0,0 +1,72 @@
+import os
+import random
+import sqlite3
+import sys
+from os import path
+
+import pytest
+
+ROOT = path.join(path.dirname(__file__), "..")
+sys.path.append(ROOT)
+sys.path.append(path.join(ROOT, "monolith-agent"))
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+CATEGORIES = ["Electronics", "Office Supplies", "Clothing", "Furniture"]
+REGIONS = ["North", "South", "East", "West"]
+
+
+def build_db(db_path: str, products: int = 20, customers: int = 10, sales: int = 2000, seed: int = 0) -> str:
+    """A small analytics database with the generator's tables and keys."""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT, price REAL);
+        CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, region TEXT, segment TEXT);
+        CREATE TABLE sales (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            product_id INTEGER,
+            customer_id INTEGER,
+            quantity INTEGER,
+            total_price REAL,
+            FOREIGN KEY (product_id) REFERENCES products (id),
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        );
+        """
+    )
+    conn.executemany(
+        "INSERT INTO products VALUES (?, ?, ?, ?)",
+        [(i, f"Product {i}", CATEGORIES[i % len(CATEGORIES)], 10.0 + i) for i in range(1, products + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO customers VALUES (?, ?, ?, ?)",
+        [(i, f"Customer {i}", REGIONS[i % len(REGIONS)], "Consumer") for i in range(1, customers + 1)],
+    )
+    add_sales(conn, sales, products, customers, rnd)
+    conn.close()
+    return db_path
+
+
+def add_sales(conn, n: int, products: int, customers: int, rnd: random.Random, product_id=None) -> None:
+    start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0] + 1
+    rows = []
+    for i in range(start, start + n):
+        quantity = rnd.randint(1, 5)
+        rows.append(
+            (
+                i,
+                f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                product_id or rnd.randint(1, products),
+                rnd.randint(1, customers),
+                quantity,
+                round(quantity * rnd.uniform(5, 50), 2),
+            )
+        )
+    with conn:
+        conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return build_db(str(tmp_path / "analytics.db"))
@@ -0,0 +1,98 @@
+import random
+import sqlite3
+
+import pytest
+from conftest import add_sales
+
+import main
+from aggregate import AggregateSpec, aggregate
+from query_guard import QueryGuard
+from results import QueryResult
+from session import ReportSession
+
+SAMPLED_QUERY = (
+    "SELECT p.category, s.total_price FROM sales s "
+    "JOIN products p ON p.id = s.product_id WHERE s.quantity > 3"
+)
+
+
+@pytest.fixture
+def sampled(db_path, monkeypatch):
+    """A session whose latest result was sampled by the query guard."""
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    monkeypatch.setattr(main, "get_query_guard", lambda: QueryGuard(sample_cost=500))
+    session = ReportSession()
+    result = main.run_sql(SAMPLED_QUERY)
+    assert result.notes and len(result) > 0
+    monkeypatch.setattr(session, "latest_data", lambda: result)
+    return session, result
+
+
+def test_sampled_result_is_not_sampled_again(sampled):
+    session, result = sampled
+    specs = [AggregateSpec(column="total_price", func="sum"), AggregateSpec(column="total_price", func="count")]
+    out = main.calculate_aggregate(session, specs)
+    assert out["count_total_price"] == len(result)
+    assert out["sum_total_price"] == pytest.approx(float(result["total_price"].sum()))
+    assert out["notes"] == result.notes
+
+
+def test_sampled_result_grouped(sampled):
+    session, result = sampled
+    out = main.calculate_aggregate(session, [AggregateSpec(column="total_price", func="sum")], ["category"])
+    expected = result.to_frame().groupby("category")["total_price"].sum()
+    assert dict(zip(out["category"], out["sum_total_price"])) == pytest.approx(expected.to_dict())
+    assert out.notes == result.notes
+
+
+def test_pushdown_notes_are_kept():
+    source = QueryResult.from_rows(["x"], [(1,), (2,)], query="SELECT x FROM t")
+
+    def executor(sql):
+        pushed = QueryResult.from_rows(["sum_x"], [(3,)], query=sql)
+        pushed.notes = ["Sampled 1 in 2 rows of t"]
+        return pushed
+
+    out = aggregate(source, [AggregateSpec(column="x", func="sum")], executor=executor)
+    assert out == {"sum_x": 3, "notes": ["Sampled 1 in 2 rows of t"]}
+
+
+@pytest.fixture
+def latest(db_path, monkeypatch):
+    """Runs a query on the test database and makes it the session's latest result."""
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    session = ReportSession()
+    calls = []
+    run_sql = main.run_sql
+    monkeypatch.setattr(main, "run_sql", lambda sql, **kwargs: calls.append(sql) or run_sql(sql, **kwargs))
+
+    def run(query):
+        result = run_sql(query)
+        monkeypatch.setattr(session, "latest_data", lambda: result)
+        return session, result, calls
+
+    return run
+
+
+def test_pushdown_while_the_database_is_unchanged(latest):
+    session, result, calls = latest("SELECT total_price FROM sales WHERE quantity > 3")
+    out = main.calculate_aggregate(session, [AggregateSpec(column="total_price", func="sum")])
+    assert len(calls) == 1 and "SUM" in calls[0]
+    assert out["sum_total_price"] == pytest.approx(float(result["total_price"].sum()))
+
+
+def test_no_pushdown_after_the_database_changed(latest, db_path):
+    session, result, calls = latest("SELECT total_price FROM sales WHERE quantity > 3")
+    conn = sqlite3.connect(db_path)
+    add_sales(conn, 100, 20, 10, random.Random(1))
+    conn.close()
+    out = main.calculate_aggregate(session, [AggregateSpec(column="total_price", func="count")])
+    assert calls == []
+    assert out["count_total_price"] == len(result)
+
+
+def test_pushed_down_sum_of_no_rows_is_zero(latest):
+    session, result, calls = latest("SELECT total_price FROM sales WHERE quantity > 100")
+    out = main.calculate_aggregate(session, [AggregateSpec(column="total_price", func="sum")])
+    assert len(result) == 0 and len(calls) == 1
+    assert out["sum_total_price"] == 0
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from db_pool import ConnectionPool, borrow, get_pool
+
+
+def test_connections_are_reused(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    pool.close()
+
+
+def test_checkout_times_out_on_a_full_pool(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+    # Released again once the holder returns it
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone() == (20,)
+    pool.close()
+
+
+def test_nested_checkout_gets_another_connection(db_path):
+    pool = ConnectionPool(db_path, size=2, timeout=0.05)
+    with pool.connection() as outer, pool.connection() as inner:
+        assert inner is not outer
+    pool.close()
+
+
+def test_borrow_reuses_the_callers_connection(db_path):
+    get_pool(db_path, size=1, timeout=0.05)
+    with get_pool(db_path).connection() as conn:
+        with borrow(db_path, conn) as borrowed:
+            assert borrowed is conn
+
+
+def test_connections_are_read_only(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM sales")
+    pool.close()
+
+
+def test_closed_pool_refuses_new_connections(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    pool.close()
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            pass
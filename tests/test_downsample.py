@@ -0,0 +1,51 @@
+import numpy as np
+
+from downsample import MINMAX_RATIO, downsample, lttb_indices, minmax_indices
+
+
+def _series(n: int, spike_at: int):
+    x = np.arange(n, dtype=np.float64)
+    y = np.sin(x / 50)
+    y[spike_at] = 100.0
+    return x, y
+
+
+def test_lttb_keeps_ends_and_spikes():
+    x, y = _series(5000, spike_at=1234)
+    index = lttb_indices(x, y, 100)
+    assert len(index) == 100
+    assert index[0] == 0 and index[-1] == 4999
+    assert (np.diff(index) > 0).all()
+    assert 1234 in index
+
+
+def test_lttb_within_budget_keeps_everything():
+    x, y = _series(50, spike_at=10)
+    assert lttb_indices(x, y, 100).tolist() == list(range(50))
+
+
+def test_minmax_keeps_extremes_of_every_bucket():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=10000)
+    y[7777] = -50.0
+    y[10] = np.nan
+    index = minmax_indices(y, 200)
+    assert len(index) <= 200
+    assert 7777 in index
+    assert int(np.nanargmax(y)) in index
+    assert 10 not in index
+
+
+def test_long_lines_are_decimated_before_lttb():
+    x, y = _series(MINMAX_RATIO * 500 + 1, spike_at=42)
+    out = downsample({"x": x, "y": y}, "line", "x", "y", max_points=500)
+    assert out.note == f"500 of {len(x):,} points shown (min-max + LTTB)"
+    assert len(out.columns["x"]) == 500
+    assert 100.0 in out.columns["y"]
+
+
+def test_data_within_budget_is_unchanged():
+    x, y = _series(100, spike_at=5)
+    out = downsample({"x": x, "y": y}, "line", "x", "y", max_points=500)
+    assert out.note is None
+    assert out.columns["y"] is y
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from query_cache import normalize_sql, probe_columns
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("SELECT s.total_price FROM sales s", "select  T.total_price\nFROM sales AS t -- alias"),
+        ("SELECT total_price FROM sales s", "SELECT total_price FROM sales;"),
+        (
+            "SELECT p.category, SUM(s.total_price) FROM sales s JOIN products p ON p.id = s.product_id",
+            "SELECT b.category, SUM(a.total_price) FROM sales a JOIN products b ON b.id = a.product_id",
+        ),
+        ("SELECT quantity AS q FROM sales", "SELECT quantity q FROM sales"),
+    ],
+)
+def test_equivalent_spellings_share_a_key(a, b):
+    assert normalize_sql(a) == normalize_sql(b)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("SELECT * FROM sales", "SELECT * FROM products"),
+        ("SELECT * FROM products WHERE name = 'A'", "SELECT * FROM products WHERE name = 'a'"),
+        # Aliases are renamed, but the columns they qualify are kept
+        ("SELECT s.id FROM sales s", "SELECT s.product_id FROM sales s"),
+    ],
+)
+def test_different_queries_have_different_keys(a, b):
+    assert normalize_sql(a) != normalize_sql(b)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT random() FROM sales",
+        "SELECT date('now')",
+        "SELECT 1; SELECT 2",
+        "DELETE FROM sales",
+        "",
+    ],
+)
+def test_uncacheable_queries(query):
+    assert normalize_sql(query) is None
+
+
+def test_probe_columns_does_not_run_the_query(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.create_function("boom", 0, lambda: 1 / 0)
+    query = "-- totals\nSELECT category, COUNT(*), boom() AS b FROM products GROUP BY category;"
+    assert probe_columns(conn, query) == ["category", "COUNT(*)", "b"]
+    conn.close()
@@ -0,0 +1,84 @@
+import pytest
+
+from db_pool import get_pool
+from query_guard import QueryCancelled, QueryGuard, QueryRejected, QueryTimeout, StatementInterrupter
+
+
+def test_check_uses_the_callers_connection(db_path):
+    # A single connection: any second checkout inside check() would time out
+    pool = get_pool(db_path, size=1, timeout=0.5)
+    with pool.connection() as conn:
+        decision = QueryGuard().check(conn, db_path, "SELECT * FROM sales WHERE quantity > 2")
+    assert decision.query.startswith("SELECT")
+
+
+def test_run_sql_with_a_single_connection(db_path, monkeypatch):
+    import main
+
+    get_pool(db_path, size=1, timeout=0.5)
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    result = main.run_sql("SELECT category, COUNT(*) AS n FROM products GROUP BY category")
+    assert sorted(result["category"]) == ["Clothing", "Electronics", "Furniture", "Office Supplies"]
+
+
+def test_interrupt_after_detach_leaves_the_connection_alone(db_path):
+    interrupter = StatementInterrupter()
+    with get_pool(db_path).connection() as conn:
+        with interrupter.attached(conn):
+            pass
+        interrupter.interrupt("timeout")
+        # Back in use for another query, which must not see the interrupt
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone() == (2000,)
+    assert interrupter.reason == "timeout"
+
+
+def test_expensive_queries_are_sampled(db_path):
+    with get_pool(db_path).connection() as conn:
+        decision = QueryGuard(sample_cost=500).check(conn, db_path, "SELECT * FROM sales")
+        rows = conn.execute(decision.query).fetchall()
+    assert "rowid % 4 = 0" in decision.query
+    assert decision.notes[0].startswith("Sampled 1 in 4 rows of sales")
+    assert len(rows) == 500
+
+
+def test_too_expensive_queries_are_rejected(db_path):
+    with get_pool(db_path).connection() as conn:
+        with pytest.raises(QueryRejected):
+            QueryGuard(sample_cost=100, max_cost=1000).check(conn, db_path, "SELECT * FROM sales")
+
+
+@pytest.mark.parametrize(
+    "query, limited",
+    [
+        ("SELECT * FROM sales", True),
+        ("SELECT * FROM sales LIMIT 5", False),
+        ("SELECT COUNT(*) FROM sales", False),
+        ("SELECT * FROM products", False),
+    ],
+)
+def test_large_results_get_a_limit(db_path, query, limited):
+    with get_pool(db_path).connection() as conn:
+        decision = QueryGuard(max_rows=100).check(conn, db_path, query)
+    assert decision.query.endswith("LIMIT 100") == limited
+    assert bool(decision.notes) == limited
+
+
+ENDLESS_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+
+def test_deadline_stops_long_statements(db_path):
+    with get_pool(db_path).connection() as conn:
+        with pytest.raises(QueryTimeout):
+            with QueryGuard(time_limit=0.05).deadline(conn):
+                conn.execute(ENDLESS_QUERY).fetchall()
+        # The connection is usable again afterwards
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone() == (20,)
+
+
+def test_interrupt_before_the_statement_starts(db_path):
+    interrupter = StatementInterrupter()
+    interrupter.interrupt()
+    with get_pool(db_path).connection() as conn:
+        with pytest.raises(QueryCancelled):
+            with QueryGuard().deadline(conn, interrupter):
+                conn.execute(ENDLESS_QUERY).fetchall()
@@ -0,0 +1,73 @@
+import re
+from concurrent.futures import Future
+
+from figures import FigureHandle, FigureSpec
+from report_writer import FIGURE_ORDER, ReportWriter
+
+
+def _handle(title: str) -> FigureHandle:
+    return FigureHandle(Future(), title, "bar")
+
+
+def _figure_orders(html: str) -> dict:
+    """Flex order of each figure wrapper, by plot ID."""
+    return {
+        plot_id: int(order)
+        for order, plot_id in re.findall(r"style='order: (\d+)'>\n<div id='(plot_\d+)'", html)
+    }
+
+
+def test_figures_are_shown_in_creation_order(tmp_path):
+    writer = ReportWriter(str(tmp_path / "report.html"))
+    first, second = _handle("first"), _handle("second")
+    writer.add_figure(first)
+    writer.add_figure(second)
+    # The second figure is built first and so written first
+    second.future.set_result(FigureSpec("{}", "second", "bar"))
+    first.future.set_result(FigureSpec("{}", "first", "bar"))
+    html = open(writer.finish(), encoding="utf-8").read()
+    assert html.index("id='plot_1'") < html.index("id='plot_0'")
+    assert _figure_orders(html) == {"plot_0": FIGURE_ORDER, "plot_1": FIGURE_ORDER + 1}
+
+
+def test_finish_closes_and_moves_the_report(tmp_path):
+    writer = ReportWriter(str(tmp_path / "partial.html"))
+    writer.add_markdown("# Sales\n\n<!-- plot 1 -->")
+    failed, slow = _handle("failed"), _handle("slow")
+    writer.add_figure(failed)
+    writer.add_figure(slow)
+    failed.future.set_exception(ValueError("no numeric column"))
+
+    path = writer.finish(str(tmp_path / "report.html"), timeout=0.01)
+    html = open(path, encoding="utf-8").read()
+    assert path == str(tmp_path / "report.html") and not (tmp_path / "partial.html").exists()
+    assert "<h1>Sales</h1>" in html and "<!-- plot" not in html
+    assert "Plot 'failed' could not be rendered: no numeric column" in html
+    assert "Plot 'slow' could not be rendered: not built within 0s" in html
+    assert html.endswith("</html>\n")
+
+    # Already written as timed out, so building it late adds nothing
+    slow.future.set_result(FigureSpec("{}", "slow", "bar"))
+    assert open(path, encoding="utf-8").read() == html
+
+
+def test_abort_marks_the_report_incomplete(tmp_path):
+    writer = ReportWriter(str(tmp_path / "report.html"))
+    writer.add_markdown("Partial findings")
+    late = _handle("late")
+    writer.add_figure(late)
+    writer.abort("timed out after 600s")
+    late.future.set_result(FigureSpec("{}", "late", "bar"))
+    writer.add_markdown("More findings")
+
+    html = open(writer.file_path, encoding="utf-8").read()
+    assert "<strong>Incomplete report:</strong> timed out after 600s" in html
+    assert "Partial findings" in html
+    assert "More findings" not in html and "plot_0" not in html
+    assert html.endswith("</html>\n")
+
+
+def test_abort_before_any_content_writes_nothing(tmp_path):
+    writer = ReportWriter(str(tmp_path / "report.html"))
+    writer.abort("cancelled")
+    assert not (tmp_path / "report.html").exists()
@@ -0,0 +1,66 @@
+import random
+import sqlite3
+
+import pytest
+from conftest import add_sales
+
+from rollups import DAILY_SALES, UNKNOWN, refresh_rollups
+
+TOTALS = "SELECT category, SUM(orders), SUM(units), ROUND(SUM(revenue), 2) FROM rollup_daily_sales GROUP BY 1"
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def _rebuilt_totals(conn):
+    refresh_rollups(conn, full=True)
+    return sorted(conn.execute(TOTALS).fetchall())
+
+
+def test_refresh_merges_only_new_rows(conn):
+    (first,) = refresh_rollups(conn)
+    assert (first.mode, first.source_rows, first.watermark) == ("full", 2000, 2000)
+
+    add_sales(conn, 150, 20, 10, random.Random(1))
+    (second,) = refresh_rollups(conn)
+    assert (second.mode, second.source_rows, second.watermark) == ("incremental", 150, 2150)
+
+    refreshed = sorted(conn.execute(TOTALS).fetchall())
+    assert refreshed == _rebuilt_totals(conn)
+
+
+def test_refresh_without_new_rows(conn):
+    refresh_rollups(conn)
+    (result,) = refresh_rollups(conn)
+    assert (result.mode, result.source_rows) == ("incremental", 0)
+
+
+def test_missing_dimensions_merge_into_one_group(conn):
+    refresh_rollups(conn)
+    # Sales of a product that is not in the products table
+    add_sales(conn, 5, 20, 10, random.Random(2), product_id=999)
+    refresh_rollups(conn)
+    add_sales(conn, 5, 20, 10, random.Random(3), product_id=999)
+    refresh_rollups(conn)
+    groups = conn.execute(
+        "SELECT COUNT(*), SUM(orders) FROM rollup_daily_sales "
+        "WHERE category = ? GROUP BY day, region, segment HAVING COUNT(*) > 1",
+        (UNKNOWN,),
+    ).fetchall()
+    assert groups == []
+    assert conn.execute("SELECT SUM(orders) FROM rollup_daily_sales WHERE category = ?", (UNKNOWN,)).fetchone() == (
+        10,
+    )
+
+
+def test_shrunk_source_is_rebuilt(conn):
+    refresh_rollups(conn)
+    with conn:
+        conn.execute("DELETE FROM sales WHERE id > 1000")
+    (result,) = refresh_rollups(conn, [DAILY_SALES])
+    assert (result.mode, result.watermark) == ("full", 1000)
+    assert conn.execute("SELECT SUM(orders) FROM rollup_daily_sales").fetchone() == (1000,)
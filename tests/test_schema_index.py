@@ -0,0 +1,26 @@
+import sqlite3
+
+from schema_index import neighbours
+from schema_summary import collect_stats
+
+
+def test_neighbours_follow_declared_keys(db_path):
+    links = neighbours(collect_stats(db_path))
+    assert links["sales"] == {"products", "customers"}
+    assert links["products"] == {"sales"}
+
+
+def test_neighbours_follow_inferred_keys(tmp_path):
+    # Written without constraints, as pandas to_sql does
+    db_path = str(tmp_path / "plain.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE categories (id INTEGER, name TEXT);
+        CREATE TABLE products (id INTEGER, name TEXT, category_id INTEGER);
+        CREATE TABLE sales (id INTEGER, product_id INTEGER, store_id INTEGER);
+        """
+    )
+    conn.close()
+    links = neighbours(collect_stats(db_path))
+    assert links == {"categories": {"products"}, "products": {"categories", "sales"}, "sales": {"products"}}
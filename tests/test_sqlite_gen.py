@@ -0,0 +1,23 @@
+import sqlite3
+from datetime import datetime
+
+from sqlite_gen import TIERS, append_database, create_database
+
+
+def _sales(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*), MAX(date) FROM sales").fetchone()
+    finally:
+        conn.close()
+
+
+def test_append_to_a_sparse_database_adds_sales(tmp_path):
+    # The demo tier has about one sale every few days, which used to round to none
+    db_path = str(tmp_path / "analytics.db")
+    create_database(db_path, TIERS["demo"], seed=1, end_date=datetime(2024, 6, 30), workers=1)
+    before, last_day = _sales(db_path)
+    append_database(db_path, days=3, seed=2, workers=1)
+    after, new_last_day = _sales(db_path)
+    assert after > before
+    assert new_last_day[:10] > last_day[:10]